@@ -0,0 +1,82 @@
+'''Measure the per-request time of :class:`DvidSource` against a local
+stand-in DVID server (from the tests) with a fixed latency per HTTP request,
+for sequential and concurrent tile fetching, with and without a tile cache.
+Requests are at random locations in a small region, such that they overlap.
+
+Usage::
+
+    python benchmarks/dvid_source.py [latency_ms] [num_requests]
+'''
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+import numpy as np
+
+from gunpowder import *
+
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'cases'))
+from dvid_stand_in import DvidStandIn
+
+shape = (256, 256, 256)
+request_shape = (64, 128, 128)
+
+def run(port, num_requests, **kwargs):
+
+    raw = ArrayKey('RAW')
+    seg = ArrayKey('SEG')
+
+    source = DvidSource(
+        'localhost',
+        port,
+        'benchmark',
+        datasets={raw: 'grayscale', seg: 'groundtruth'},
+        array_specs={
+            raw: ArraySpec(interpolatable=True),
+            seg: ArraySpec(interpolatable=False)
+        },
+        **kwargs)
+
+    np.random.seed(42)
+
+    with build(source):
+
+        start = time.time()
+
+        for _ in range(num_requests):
+
+            offset = np.random.randint(0, 64, size=3)
+            roi = Roi(offset, request_shape)
+            source.request_batch(BatchRequest({
+                raw: ArraySpec(roi=roi),
+                seg: ArraySpec(roi=roi)
+            }))
+
+        return (time.time() - start)/num_requests
+
+if __name__ == "__main__":
+
+    latency = float(sys.argv[1])/1000 if len(sys.argv) > 1 else 0.01
+    num_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    instances = {
+        'grayscale': np.random.randint(0, 255, size=shape).astype(np.uint8),
+        'groundtruth': np.random.randint(0, 100, size=shape).astype(np.uint64)
+    }
+
+    with DvidStandIn(instances, latency=latency) as server:
+
+        for name, kwargs in [
+                ("sequential", {'num_threads': 1}),
+                ("concurrent", {'num_threads': 8}),
+                ("concurrent, cached", {
+                    'num_threads': 8,
+                    'cache_size': 256*1024**2})]:
+
+            seconds = run(server.port, num_requests, **kwargs)
+            print("%s: %.1fms per request"%(name, seconds*1000))
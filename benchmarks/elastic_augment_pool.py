@@ -0,0 +1,94 @@
+'''Measure the per-batch time of :class:`ElasticAugment`, creating a new
+transformation for each batch, or drawing from a pool of transformations.
+
+Usage::
+
+    python benchmarks/elastic_augment_pool.py [pool_size] [num_batches]
+'''
+
+from __future__ import print_function
+
+import math
+import sys
+import time
+
+import numpy as np
+
+from gunpowder import *
+
+shape = (400, 1000, 1000)
+
+class RawSource(BatchProvider):
+
+    def setup(self):
+
+        self.provides(
+            ArrayKey('RAW'),
+            ArraySpec(
+                roi=Roi((0, 0, 0), shape),
+                voxel_size=(1, 1, 1),
+                interpolatable=True))
+
+    def provide(self, request):
+
+        batch = Batch()
+        for key, spec in request.array_specs.items():
+            spec = self.spec[key].copy()
+            spec.roi = request[key].roi
+            batch.arrays[key] = Array(
+                np.random.rand(*spec.roi.get_shape()).astype(np.float32),
+                spec)
+
+        return batch
+
+def run(num_batches, **kwargs):
+
+    raw = ArrayKey('RAW')
+
+    pipeline = (
+        RawSource() +
+        RandomLocation() +
+        ElasticAugment(
+            control_point_spacing=(4, 40, 40),
+            jitter_sigma=(0, 2, 2),
+            rotation_interval=(0, math.pi/2),
+            prob_slip=0.05,
+            prob_shift=0.05,
+            max_misalign=10,
+            subsample=8,
+            **kwargs))
+
+    request = BatchRequest()
+    request.add(raw, (40, 200, 200))
+
+    with build(pipeline):
+
+        # fill the pool first, if there is one
+        for _ in range(kwargs.get('pool_size') or 1):
+            pipeline.request_batch(request)
+
+        start = time.time()
+        for _ in range(num_batches):
+            pipeline.request_batch(request)
+        seconds = (time.time() - start)/num_batches
+
+    return seconds
+
+if __name__ == "__main__":
+
+    pool_size = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    num_batches = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    for name, kwargs in [
+            ("new transformation per batch", {}),
+            ("pool", {
+                'pool_size': pool_size}),
+            ("pool, refreshed every 5 batches", {
+                'pool_size': pool_size,
+                'pool_refresh': 5}),
+            ("pool, margin 10", {
+                'pool_size': pool_size,
+                'pool_margin': 10})]:
+
+        seconds = run(num_batches, **kwargs)
+        print("%s: %.1fms per batch"%(name, seconds*1000))
@@ -0,0 +1,98 @@
+'''Measure the effect of the block cache of :class:`Hdf5Source`.
+
+Writes a gzip-compressed, chunked test volume and requests randomly placed,
+overlapping regions from it, with and without block cache. Reports the time
+per request and the cache hit rate.
+
+Usage::
+
+    python benchmarks/hdf5_block_cache.py [cache_size_mb] [num_requests]
+'''
+
+from __future__ import print_function
+
+import os
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from gunpowder import *
+
+shape = (256, 256, 256)
+chunks = (32, 32, 32)
+request_shape = (64, 64, 64)
+# requests are placed in a sub-volume, such that they overlap
+location_range = 128
+
+def create_volume(filename):
+
+    data = np.random.randint(0, 16, size=shape).astype(np.uint8)
+    with h5py.File(filename, 'w') as f:
+        f.create_dataset(
+            'raw',
+            data=data,
+            chunks=chunks,
+            compression='gzip')
+
+def run(filename, cache_size, num_requests):
+
+    raw = ArrayKey('RAW')
+    source = Hdf5Source(
+        filename,
+        {raw: 'raw'},
+        array_specs={raw: ArraySpec(interpolatable=True)},
+        cache_size=cache_size)
+
+    np.random.seed(42)
+    stats = None
+
+    with build(source):
+
+        start = time.time()
+
+        for _ in range(num_requests):
+
+            offset = np.random.randint(0, location_range, size=3)
+            batch = source.request_batch(BatchRequest({
+                raw: ArraySpec(roi=Roi(offset, request_shape))
+            }))
+
+            if stats is None:
+                stats = batch.profiling_stats
+            else:
+                stats.merge_with(batch.profiling_stats)
+
+        elapsed = time.time() - start
+
+    counters = stats.get_counters()
+    hits = counters.get(('Hdf5Source', 'cache hits'), 0)
+    misses = counters.get(('Hdf5Source', 'cache misses'), 0)
+
+    return elapsed/num_requests, hits, misses
+
+if __name__ == "__main__":
+
+    cache_size_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 64
+    num_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    fd, filename = tempfile.mkstemp(suffix='.hdf')
+    os.close(fd)
+
+    try:
+
+        create_volume(filename)
+
+        for cache_size in [None, int(cache_size_mb*1024*1024)]:
+
+            seconds, hits, misses = run(filename, cache_size, num_requests)
+
+            print("cache size %s: %.1fms per request"%(
+                cache_size, seconds*1000))
+            if hits + misses > 0:
+                print("  hit rate: %.1f%%"%(100.0*hits/(hits + misses)))
+
+    finally:
+        os.remove(filename)
@@ -0,0 +1,67 @@
+'''Measure the per-request overhead of :class:`Hdf5Source` on an uncompressed
+volume, where opening the file and copying the data dominate.
+
+Usage::
+
+    python benchmarks/hdf5_read_overhead.py [request_size] [num_requests]
+'''
+
+from __future__ import print_function
+
+import os
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from gunpowder import *
+
+shape = (256, 256, 256)
+
+def run(filename, request_size, num_requests, buffer_pool):
+
+    raw = ArrayKey('RAW')
+    source = Hdf5Source(
+        filename,
+        {raw: 'raw'},
+        array_specs={raw: ArraySpec(interpolatable=True)},
+        buffer_pool=buffer_pool)
+
+    np.random.seed(42)
+
+    with build(source):
+
+        start = time.time()
+
+        for _ in range(num_requests):
+
+            offset = np.random.randint(0, shape[0] - request_size, size=3)
+            source.request_batch(BatchRequest({
+                raw: ArraySpec(roi=Roi(offset, (request_size,)*3))
+            }))
+
+        return (time.time() - start)/num_requests
+
+if __name__ == "__main__":
+
+    request_size = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    num_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    fd, filename = tempfile.mkstemp(suffix='.hdf')
+    os.close(fd)
+
+    try:
+
+        with h5py.File(filename, 'w') as f:
+            f['raw'] = np.random.randint(0, 255, size=shape).astype(np.uint8)
+
+        seconds = run(filename, request_size, num_requests, None)
+        print("%.3fms per request"%(seconds*1000))
+
+        seconds = run(filename, request_size, num_requests, BufferPool())
+        print("%.3fms per request with buffer pool"%(seconds*1000))
+
+    finally:
+        os.remove(filename)
@@ -0,0 +1,93 @@
+'''Measure how long a :class:`Scan` over a volume takes with synchronous and
+asynchronous :class:`Hdf5Write`, if producing each block takes some time
+without using the CPU (like waiting for a prediction on the GPU).
+
+Usage::
+
+    python benchmarks/hdf5_write_async.py [block_size] [seconds_per_block]
+'''
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from gunpowder import *
+
+shape = (256, 256, 256)
+
+class PredictionSource(BatchProvider):
+
+    def __init__(self, seconds_per_block):
+        self.seconds_per_block = seconds_per_block
+
+    def setup(self):
+
+        self.provides(
+            ArrayKey('PREDICTION'),
+            ArraySpec(
+                roi=Roi((0, 0, 0), shape),
+                voxel_size=(1, 1, 1),
+                dtype=np.float32,
+                interpolatable=True))
+
+    def provide(self, request):
+
+        time.sleep(self.seconds_per_block)
+
+        batch = Batch()
+        for key, spec in request.array_specs.items():
+            spec = self.spec[key].copy()
+            spec.roi = request[key].roi
+            batch.arrays[key] = Array(
+                np.random.rand(*spec.roi.get_shape()).astype(np.float32),
+                spec)
+
+        return batch
+
+def run(output_dir, block_size, seconds_per_block, asynchronous):
+
+    prediction = ArrayKey('PREDICTION')
+
+    reference = BatchRequest()
+    reference.add(prediction, (block_size,)*3)
+
+    pipeline = (
+        PredictionSource(seconds_per_block) +
+        Hdf5Write(
+            {prediction: 'prediction'},
+            output_dir=output_dir,
+            output_filename='async_%s.hdf'%asynchronous,
+            compression_type='gzip',
+            asynchronous=asynchronous) +
+        Scan(reference))
+
+    start = time.time()
+
+    with build(pipeline):
+        pipeline.request_batch(BatchRequest())
+
+    return time.time() - start
+
+if __name__ == "__main__":
+
+    block_size = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    seconds_per_block = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+
+    output_dir = tempfile.mkdtemp()
+
+    try:
+
+        seconds = run(output_dir, block_size, seconds_per_block, False)
+        print("synchronous: %.2fs"%seconds)
+
+        seconds = run(output_dir, block_size, seconds_per_block, True)
+        print("asynchronous: %.2fs"%seconds)
+
+    finally:
+        shutil.rmtree(output_dir)
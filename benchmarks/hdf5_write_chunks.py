@@ -0,0 +1,87 @@
+'''Measure how long a :class:`Scan` with :class:`Hdf5Write` takes, if the
+scanned blocks are not aligned with the HDF5 chunks, with and without write
+combining (``chunk_shape``).
+
+Usage::
+
+    python benchmarks/hdf5_write_chunks.py [block_size] [chunk_size]
+'''
+
+from __future__ import print_function
+
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from gunpowder import *
+
+shape = (256, 256, 256)
+
+class RandomSource(BatchProvider):
+
+    def setup(self):
+
+        self.provides(
+            ArrayKey('PREDICTION'),
+            ArraySpec(
+                roi=Roi((0, 0, 0), shape),
+                voxel_size=(1, 1, 1),
+                dtype=np.float32,
+                interpolatable=True))
+
+    def provide(self, request):
+
+        batch = Batch()
+        for key, spec in request.array_specs.items():
+            spec = self.spec[key].copy()
+            spec.roi = request[key].roi
+            batch.arrays[key] = Array(
+                np.random.rand(*spec.roi.get_shape()).astype(np.float32),
+                spec)
+
+        return batch
+
+def run(output_dir, block_size, chunk_shape):
+
+    prediction = ArrayKey('PREDICTION')
+
+    reference = BatchRequest()
+    reference.add(prediction, (block_size,)*3)
+
+    pipeline = (
+        RandomSource() +
+        Hdf5Write(
+            {prediction: 'prediction'},
+            output_dir=output_dir,
+            output_filename='chunks_%s.hdf'%(chunk_shape is not None),
+            compression_type='gzip',
+            chunk_shape=chunk_shape) +
+        Scan(reference))
+
+    start = time.time()
+
+    with build(pipeline):
+        pipeline.request_batch(BatchRequest())
+
+    return time.time() - start
+
+if __name__ == "__main__":
+
+    block_size = int(sys.argv[1]) if len(sys.argv) > 1 else 48
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+
+    output_dir = tempfile.mkdtemp()
+
+    try:
+
+        seconds = run(output_dir, block_size, None)
+        print("chunks chosen by HDF5: %.2fs"%seconds)
+
+        seconds = run(output_dir, block_size, (chunk_size,)*3)
+        print("write combining in %d^3 chunks: %.2fs"%(chunk_size, seconds))
+
+    finally:
+        shutil.rmtree(output_dir)
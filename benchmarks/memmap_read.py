@@ -0,0 +1,79 @@
+'''Compare the per-request time of :class:`Hdf5Source` on a gzip-compressed
+dataset with :class:`MemmapSource` on the same data, converted with
+:func:`hdf5_to_memmap`. The data of each batch is summed once, to account for
+the page faults of the memory-mapped reads.
+
+Usage::
+
+    python benchmarks/memmap_read.py [request_size] [num_requests]
+'''
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from gunpowder import *
+
+shape = (256, 256, 256)
+
+def run(source, request_size, num_requests):
+
+    raw = ArrayKey('RAW')
+
+    np.random.seed(42)
+
+    with build(source):
+
+        start = time.time()
+
+        for _ in range(num_requests):
+
+            offset = np.random.randint(0, shape[0] - request_size, size=3)
+            batch = source.request_batch(BatchRequest({
+                raw: ArraySpec(roi=Roi(offset, (request_size,)*3))
+            }))
+            batch.arrays[raw].data.sum()
+
+        return (time.time() - start)/num_requests
+
+if __name__ == "__main__":
+
+    request_size = int(sys.argv[1]) if len(sys.argv) > 1 else 128
+    num_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    raw = ArrayKey('RAW')
+    specs = {raw: ArraySpec(interpolatable=True)}
+
+    tmp_dir = tempfile.mkdtemp()
+
+    try:
+
+        # smooth data, such that compression has something to do
+        data = np.random.randint(0, 255, size=shape).astype(np.uint8)//32
+
+        hdf_file = os.path.join(tmp_dir, 'raw.hdf')
+        with h5py.File(hdf_file, 'w') as f:
+            f.create_dataset(
+                'raw', data=data, chunks=(64, 64, 64), compression='gzip')
+
+        hdf5_to_memmap(hdf_file, ['raw'], tmp_dir)
+
+        seconds = run(
+            Hdf5Source(hdf_file, {raw: 'raw'}, array_specs=specs),
+            request_size, num_requests)
+        print("Hdf5Source: %.3fms per request"%(seconds*1000))
+
+        seconds = run(
+            MemmapSource(tmp_dir, {raw: 'raw.npy'}, array_specs=specs),
+            request_size, num_requests)
+        print("MemmapSource: %.3fms per request"%(seconds*1000))
+
+    finally:
+        shutil.rmtree(tmp_dir)
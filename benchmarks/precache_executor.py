@@ -0,0 +1,100 @@
+'''Compare process and thread workers of :class:`PreCache` on a standard
+augmentation pipeline.
+
+Creates a temporary HDF5 file with random raw data and labels, and measures
+the throughput of::
+
+    Hdf5Source + Normalize + RandomLocation + SimpleAugment + IntensityAugment
+    + GrowBoundary + ExcludeLabels + PreCache
+
+for both executors. ``ElasticAugment`` is added if the ``augment`` module is
+installed.
+
+Usage::
+
+    python benchmarks/precache_executor.py [num_workers] [num_batches]
+'''
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from gunpowder import *
+from gunpowder.ext import h5py
+
+raw = ArrayKey('RAW')
+labels = ArrayKey('GT_LABELS')
+mask = ArrayKey('GT_MASK')
+
+def create_data(filename):
+
+    with h5py.File(filename, 'w') as f:
+        f['raw'] = np.random.randint(0, 255, (100, 400, 400)).astype(np.uint8)
+        # blocks of 20x20 voxels in x and y with 50 different labels
+        y, x = np.meshgrid(np.arange(400)//20, np.arange(400)//20, indexing='ij')
+        f['labels'] = np.tile((y*20 + x)%50, (100, 1, 1)).astype(np.uint64)
+        for ds in ['raw', 'labels']:
+            f[ds].attrs['resolution'] = (40, 4, 4)
+
+def run(filename, num_workers, num_batches, executor):
+
+    try:
+        from augment import create_identity_transformation
+        elastic = [ElasticAugment([4, 40, 40], [0, 2, 2], [0, np.pi/2.0])]
+    except ImportError:
+        elastic = []
+
+    nodes = [
+        Hdf5Source(filename, datasets={raw: 'raw', labels: 'labels'}),
+        Normalize(raw),
+        RandomLocation()
+    ] + elastic + [
+        SimpleAugment(transpose_only=[1, 2]),
+        IntensityAugment(raw, 0.9, 1.1, -0.1, 0.1),
+        GrowBoundary(labels, None, steps=1, only_xy=True),
+        ExcludeLabels(labels, [1, 2, 3], ignore_mask=mask),
+        PreCache(
+            cache_size=2*num_workers,
+            num_workers=num_workers,
+            executor=executor)
+    ]
+
+    pipeline = nodes[0]
+    for node in nodes[1:]:
+        pipeline += node
+
+    request = BatchRequest()
+    request.add(raw, (40*20, 4*132, 4*132))
+    request.add(labels, (40*10, 4*44, 4*44))
+    request.add(mask, (40*10, 4*44, 4*44))
+
+    with build(pipeline):
+
+        start = time.time()
+        for _ in range(num_batches):
+            pipeline.request_batch(request)
+        elapsed = time.time() - start
+
+    print("executor=%s: %.2fms per batch (including startup)"%(
+        executor,
+        elapsed/num_batches*1e3))
+
+if __name__ == "__main__":
+
+    num_workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    num_batches = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmp_dir, 'data.hdf')
+        create_data(filename)
+        run(filename, num_workers, num_batches, 'process')
+        run(filename, num_workers, num_batches, 'thread')
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,88 @@
+'''Compare the throughput of :class:`PreCache` with and without shared memory
+transport of batches.
+
+The source produces batches of the size of a typical 3D training request
+(84x268x268 float32 raw data plus 3x56x56x56 float32 affinities), the consumer
+only touches the data.
+
+Usage::
+
+    python benchmarks/precache_transport.py [num_workers] [num_batches]
+'''
+
+from __future__ import print_function
+
+import sys
+import time
+
+import numpy as np
+
+from gunpowder import *
+
+raw = ArrayKey('RAW')
+affs = ArrayKey('GT_AFFINITIES')
+
+class Source(BatchProvider):
+
+    def setup(self):
+
+        self.provides(
+            raw,
+            ArraySpec(
+                roi=Roi((0, 0, 0), (1000, 1000, 1000)),
+                voxel_size=(1, 1, 1),
+                dtype=np.float32))
+        self.provides(
+            affs,
+            ArraySpec(
+                roi=Roi((0, 0, 0), (1000, 1000, 1000)),
+                voxel_size=(1, 1, 1),
+                dtype=np.float32))
+
+    def provide(self, request):
+
+        batch = Batch()
+        for key, spec in request.array_specs.items():
+            spec = spec.copy()
+            spec.voxel_size = self.spec[key].voxel_size
+            shape = spec.roi.get_shape()
+            if key == affs:
+                shape = (3,) + shape
+            batch.arrays[key] = Array(np.ones(shape, dtype=np.float32), spec)
+        return batch
+
+def run(num_workers, num_batches, shared_memory):
+
+    pipeline = (
+        Source() +
+        PreCache(
+            cache_size=2*num_workers,
+            num_workers=num_workers,
+            shared_memory=shared_memory))
+
+    request = BatchRequest()
+    request.add(raw, (84, 268, 268))
+    request.add(affs, (56, 56, 56))
+
+    with build(pipeline):
+
+        # warm up
+        for _ in range(num_workers):
+            pipeline.request_batch(request)
+
+        start = time.time()
+        for _ in range(num_batches):
+            batch = pipeline.request_batch(request)
+            batch.arrays[raw].data.sum()
+        elapsed = time.time() - start
+
+    print("shared_memory=%s: %.2fms per batch"%(
+        shared_memory,
+        elapsed/num_batches*1e3))
+
+if __name__ == "__main__":
+
+    num_workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    num_batches = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    run(num_workers, num_batches, False)
+    run(num_workers, num_batches, True)
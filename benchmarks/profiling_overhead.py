@@ -0,0 +1,52 @@
+'''Measure the cost of collecting profiling statistics.
+
+Simulates a pipeline of ``num_nodes`` filters: every batch gets a fresh
+:class:`ProfilingStats`, to which each node adds a ``prepare`` and a
+``process`` :class:`Timing`. The batch statistics are then merged into an
+accumulator, as :class:`PrintProfilingStats` does with ``every=num_batches``.
+Reports the time per batch and the size of the accumulated statistics.
+
+Usage::
+
+    python benchmarks/profiling_overhead.py [num_nodes] [num_batches]
+'''
+
+from __future__ import print_function
+
+import pickle
+import sys
+import time
+
+from gunpowder.profiling import Timing, ProfilingStats
+
+class Node(object):
+    pass
+
+if __name__ == "__main__":
+
+    num_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    num_batches = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    node = Node()
+    accumulated = ProfilingStats()
+
+    start = time.time()
+
+    for _ in range(num_batches):
+
+        stats = ProfilingStats()
+
+        for i in range(num_nodes):
+            for method in ['prepare', 'process']:
+                timing = Timing(node, method + str(i))
+                timing.start()
+                timing.stop()
+                stats.add(timing)
+
+        accumulated.merge_with(stats)
+
+    elapsed = time.time() - start
+
+    print("%d nodes, %d batches"%(num_nodes, num_batches))
+    print("time per batch: %.1fus"%(elapsed/num_batches*1e6))
+    print("accumulated stats: %d bytes pickled"%len(pickle.dumps(accumulated, -1)))
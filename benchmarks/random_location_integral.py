@@ -0,0 +1,104 @@
+'''Measure the setup time and peak memory of :class:`RandomLocation` with
+``min_masked``, computing the mask integral in memory from the whole mask, or
+blockwise into a memory-mapped file (and reusing that file in a second run).
+
+Each configuration runs in its own process, the peak resident memory of that
+process during setup is reported.
+
+Usage::
+
+    python benchmarks/random_location_integral.py [size] [block_size]
+'''
+
+from __future__ import print_function
+
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from gunpowder import *
+
+class MaskSource(BatchProvider):
+    '''A mask of regularly spaced cubes, generated on request.'''
+
+    def __init__(self, size):
+        self.size = size
+
+    def setup(self):
+
+        self.provides(
+            ArrayKey('MASK'),
+            ArraySpec(
+                roi=Roi((0, 0, 0), (self.size,)*3),
+                voxel_size=(1, 1, 1),
+                interpolatable=False))
+
+    def provide(self, request):
+
+        batch = Batch()
+        for key, spec in request.array_specs.items():
+            spec = self.spec[key].copy()
+            spec.roi = request[key].roi
+            z, y, x = np.ogrid[spec.roi.get_bounding_box()]
+            data = ((z%64 < 32) & (y%64 < 32) & (x%64 < 32)).astype(np.uint8)
+            batch.arrays[key] = Array(data, spec)
+
+        return batch
+
+def run(size, queue, **kwargs):
+
+    mask = ArrayKey('MASK')
+
+    pipeline = (
+        MaskSource(size) +
+        RandomLocation(min_masked=0.5, mask=mask, **kwargs))
+
+    request = BatchRequest()
+    request.add(mask, (32, 32, 32))
+
+    start = time.time()
+    with build(pipeline):
+        seconds = time.time() - start
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0
+        pipeline.request_batch(request)
+
+    queue.put((seconds, peak_mb))
+
+if __name__ == "__main__":
+
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 384
+    block_size = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+
+    tmp_dir = tempfile.mkdtemp()
+    integral_file = os.path.join(tmp_dir, 'mask_integral.npy')
+
+    try:
+
+        for name, kwargs in [
+                ("in memory", {}),
+                ("blockwise, memory-mapped", {
+                    'mask_block_shape': (block_size,)*3,
+                    'mask_integral_file': integral_file}),
+                ("reused", {
+                    'mask_block_shape': (block_size,)*3,
+                    'mask_integral_file': integral_file})]:
+
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=run,
+                args=(size, queue),
+                kwargs=kwargs)
+            process.start()
+            seconds, peak_mb = queue.get()
+            process.join()
+
+            print("%s: setup %.2fs, peak RSS %.0fMB"%(name, seconds, peak_mb))
+
+    finally:
+        shutil.rmtree(tmp_dir)
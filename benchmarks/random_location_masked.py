@@ -0,0 +1,85 @@
+'''Measure the per-request time of :class:`RandomLocation` with ``min_masked``
+on a sparse mask (a few percent of the voxels masked in).
+
+Usage::
+
+    python benchmarks/random_location_masked.py [coverage] [num_requests]
+'''
+
+from __future__ import print_function
+
+import sys
+import time
+
+import numpy as np
+
+from gunpowder import *
+
+shape = (256, 256, 256)
+
+class MaskSource(BatchProvider):
+
+    def __init__(self, mask_data):
+        self.mask_data = mask_data
+
+    def setup(self):
+
+        self.provides(
+            ArrayKey('MASK'),
+            ArraySpec(
+                roi=Roi((0, 0, 0), shape),
+                voxel_size=(1, 1, 1),
+                interpolatable=False))
+
+    def provide(self, request):
+
+        batch = Batch()
+        for key, spec in request.array_specs.items():
+            spec = self.spec[key].copy()
+            spec.roi = request[key].roi
+            batch.arrays[key] = Array(
+                self.mask_data[spec.roi.get_bounding_box()],
+                spec)
+
+        return batch
+
+def sparse_mask(coverage):
+    '''Random cubes of 40^3 voxels covering about the given ratio of
+    voxels.'''
+
+    np.random.seed(42)
+    mask_data = np.zeros(shape, dtype=np.uint8)
+    while mask_data.mean() < coverage:
+        z, y, x = np.random.randint(0, shape[0] - 40, size=3)
+        mask_data[z:z+40, y:y+40, x:x+40] = 1
+
+    return mask_data
+
+if __name__ == "__main__":
+
+    coverage = float(sys.argv[1]) if len(sys.argv) > 1 else 0.03
+    num_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    mask = ArrayKey('MASK')
+    mask_data = sparse_mask(coverage)
+    print("mask coverage: %.3f"%mask_data.mean())
+
+    pipeline = (
+        MaskSource(mask_data) +
+        RandomLocation(min_masked=0.5, mask=mask))
+
+    request = BatchRequest()
+    request.add(mask, (32, 32, 32))
+
+    with build(pipeline):
+
+        start = time.time()
+        pipeline.request_batch(request)
+        print("first request: %.1fms"%((time.time() - start)*1000))
+
+        start = time.time()
+        for _ in range(num_requests):
+            pipeline.request_batch(request)
+        seconds = (time.time() - start)/num_requests
+
+    print("%.3fms per request"%(seconds*1000))
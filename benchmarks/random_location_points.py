@@ -0,0 +1,82 @@
+'''Measure the setup time and per-request time of :class:`RandomLocation` with
+``ensure_nonempty`` on a large number of points (like synapses).
+
+Usage::
+
+    python benchmarks/random_location_points.py [num_points] [num_requests]
+'''
+
+from __future__ import print_function
+
+import sys
+import time
+
+import numpy as np
+
+from gunpowder import *
+from gunpowder.points import Points, Point
+
+shape = (2000, 4000, 4000)
+
+class PointsSource(BatchProvider):
+
+    def __init__(self, locations):
+        self.locations = locations
+
+    def setup(self):
+
+        self.provides(
+            PointsKey('SYNAPSES'),
+            PointsSpec(roi=Roi((0, 0, 0), shape)))
+
+    def provide(self, request):
+
+        batch = Batch()
+
+        for key, spec in request.points_specs.items():
+
+            begin = np.array(spec.roi.get_begin())
+            end = np.array(spec.roi.get_end())
+            inside = np.flatnonzero(np.all(
+                (self.locations >= begin) & (self.locations < end),
+                axis=1))
+
+            batch.points[key] = Points(
+                {i: Point(self.locations[i]) for i in inside},
+                spec.copy())
+
+        return batch
+
+if __name__ == "__main__":
+
+    num_points = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    num_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    np.random.seed(42)
+    locations = (np.random.rand(num_points, 3)*shape).astype(np.float32)
+
+    synapses = PointsKey('SYNAPSES')
+
+    pipeline = (
+        PointsSource(locations) +
+        RandomLocation(ensure_nonempty=synapses))
+
+    request = BatchRequest()
+    request[synapses] = PointsSpec(roi=Roi((0, 0, 0), (40, 200, 200)))
+
+    start = time.time()
+
+    with build(pipeline):
+
+        print("setup: %.2fs"%(time.time() - start))
+
+        start = time.time()
+        pipeline.request_batch(request)
+        print("first request: %.1fms"%((time.time() - start)*1000))
+
+        start = time.time()
+        for _ in range(num_requests):
+            pipeline.request_batch(request)
+        seconds = (time.time() - start)/num_requests
+
+    print("%.2fms per request"%(seconds*1000))
@@ -0,0 +1,104 @@
+'''Measure the per-batch time of :class:`Reject` with and without pushing the
+mask test down to :class:`RandomLocation`, for a sparse mask and a raw array
+that is expensive to read.
+
+Usage::
+
+    python benchmarks/reject_pushdown.py [seconds_per_raw_read] [num_batches]
+'''
+
+from __future__ import print_function
+
+import sys
+import time
+
+import numpy as np
+
+from gunpowder import *
+
+shape = (200, 200, 200)
+
+class SlowRawSource(BatchProvider):
+
+    def __init__(self, seconds_per_raw_read):
+        self.seconds_per_raw_read = seconds_per_raw_read
+
+    def setup(self):
+
+        for key, interpolatable in [
+                (ArrayKey('RAW'), True),
+                (ArrayKey('MASK'), False)]:
+            self.provides(
+                key,
+                ArraySpec(
+                    roi=Roi((0, 0, 0), shape),
+                    voxel_size=(1, 1, 1),
+                    interpolatable=interpolatable))
+
+    def provide(self, request):
+
+        batch = Batch()
+
+        for key, spec in request.array_specs.items():
+
+            spec = self.spec[key].copy()
+            spec.roi = request[key].roi
+
+            if key == ArrayKey('RAW'):
+                time.sleep(self.seconds_per_raw_read)
+                data = np.random.rand(*spec.roi.get_shape()).astype(np.float32)
+            else:
+                # only a slab of 20 sections is masked in
+                z, _, _ = np.ogrid[spec.roi.get_bounding_box()]
+                data = np.broadcast_to(
+                    ((z >= 90) & (z < 110)).astype(np.uint8),
+                    spec.roi.get_shape()).copy()
+
+            batch.arrays[key] = Array(data, spec)
+
+        return batch
+
+def run(seconds_per_raw_read, num_batches, pushdown):
+
+    raw = ArrayKey('RAW')
+    mask = ArrayKey('MASK')
+
+    pipeline = (
+        SlowRawSource(seconds_per_raw_read) +
+        RandomLocation() +
+        IntensityAugment(raw, 0.9, 1.1, -0.1, 0.1) +
+        Reject(mask, min_masked=0.5, pushdown=pushdown))
+
+    request = BatchRequest()
+    request.add(raw, (10, 64, 64))
+    request.add(mask, (10, 64, 64))
+
+    counters = {}
+
+    with build(pipeline):
+
+        start = time.time()
+
+        for _ in range(num_batches):
+            batch = pipeline.request_batch(request)
+            for key, value in batch.profiling_stats.get_counters().items():
+                counters[key] = counters.get(key, 0) + value
+
+        seconds = (time.time() - start)/num_batches
+
+    return seconds, counters
+
+if __name__ == "__main__":
+
+    seconds_per_raw_read = float(sys.argv[1]) if len(sys.argv) > 1 else 0.02
+    num_batches = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    np.random.seed(42)
+
+    for pushdown in [False, True]:
+
+        seconds, counters = run(seconds_per_raw_read, num_batches, pushdown)
+
+        print("pushdown=%s: %.1fms per batch"%(pushdown, seconds*1000))
+        for (node, name), value in sorted(counters.items()):
+            print("  %s %s: %s"%(node, name, value))
@@ -0,0 +1,98 @@
+'''Measure the per-node overhead of passing a request through a pipeline.
+
+Builds a chain of no-op :class:`BatchFilters<BatchFilter>` on top of a source
+that returns (tiny) arrays and points for every requested key, and reports the
+average time spent per node and batch. Half of the filters implement
+``prepare`` (and therefore get their own copy of the request), the other half
+pass the request through untouched.
+
+Usage::
+
+    python benchmarks/request_overhead.py [num_nodes] [num_batches]
+'''
+
+from __future__ import print_function
+
+import sys
+import time
+
+import numpy as np
+
+from gunpowder import *
+
+num_keys = 5
+
+class Source(BatchProvider):
+
+    def setup(self):
+
+        for i in range(num_keys):
+            self.provides(
+                ArrayKey('ARRAY_%d'%i),
+                ArraySpec(
+                    roi=Roi((0, 0, 0), (1000, 1000, 1000)),
+                    voxel_size=(4, 4, 4),
+                    interpolatable=True,
+                    dtype=np.float32))
+        self.provides(
+            PointsKey('POINTS'),
+            PointsSpec(roi=Roi((0, 0, 0), (1000, 1000, 1000))))
+
+    def provide(self, request):
+
+        batch = Batch()
+        for key, spec in request.array_specs.items():
+            spec = spec.copy()
+            spec.voxel_size = self.spec[key].voxel_size
+            shape = spec.roi.get_shape()/spec.voxel_size
+            batch.arrays[key] = Array(np.zeros(shape, dtype=np.float32), spec)
+        for key, spec in request.points_specs.items():
+            batch.points[key] = Points({}, spec.copy())
+        return batch
+
+class PassThrough(BatchFilter):
+
+    def process(self, batch, request):
+        pass
+
+class Prepare(BatchFilter):
+
+    def prepare(self, request):
+        pass
+
+    def process(self, batch, request):
+        pass
+
+def run(num_nodes, num_batches):
+
+    pipeline = Source()
+    for i in range(num_nodes):
+        pipeline += Prepare() if i%2 == 0 else PassThrough()
+
+    request = BatchRequest()
+    for i in range(num_keys):
+        request.add(ArrayKey('ARRAY_%d'%i), (40, 40, 40))
+    request.add(PointsKey('POINTS'), (40, 40, 40))
+
+    with build(pipeline):
+
+        # warm up
+        for _ in range(10):
+            pipeline.request_batch(request)
+
+        start = time.time()
+        for _ in range(num_batches):
+            pipeline.request_batch(request)
+        elapsed = time.time() - start
+
+    print("%d nodes, %d batches: %.2fms per batch, %.1fus per node"%(
+        num_nodes,
+        num_batches,
+        elapsed/num_batches*1e3,
+        elapsed/num_batches/num_nodes*1e6))
+
+if __name__ == "__main__":
+
+    num_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 25
+    num_batches = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    run(num_nodes, num_batches)
@@ -0,0 +1,84 @@
+'''Compare the throughput of :class:`Hdf5Source` and :class:`ZarrSource` on
+the same compressed volume, read by several :class:`PreCache` workers.
+
+Usage::
+
+    python benchmarks/zarr_read.py [request_size] [num_requests] [num_workers]
+'''
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+from gunpowder import *
+from gunpowder.chunked_array import ChunkedArray
+
+shape = (256, 256, 256)
+chunks = (64, 64, 64)
+
+def run(source, request_size, num_requests, num_workers):
+
+    raw = ArrayKey('RAW')
+
+    request = BatchRequest()
+    request.add(raw, (request_size,)*3)
+
+    pipeline = (
+        source +
+        RandomLocation() +
+        PreCache(cache_size=2*num_workers, num_workers=num_workers))
+
+    with build(pipeline):
+
+        # warm up the workers
+        pipeline.request_batch(request)
+
+        start = time.time()
+        for _ in range(num_requests):
+            pipeline.request_batch(request)
+
+        return (time.time() - start)/num_requests
+
+if __name__ == "__main__":
+
+    request_size = int(sys.argv[1]) if len(sys.argv) > 1 else 128
+    num_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    num_workers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    raw = ArrayKey('RAW')
+    specs = {raw: ArraySpec(interpolatable=True)}
+
+    tmp_dir = tempfile.mkdtemp()
+
+    try:
+
+        # smooth data, such that compression has something to do
+        data = np.random.randint(0, 255, size=shape).astype(np.uint8)//32
+
+        hdf_file = os.path.join(tmp_dir, 'raw.hdf')
+        with h5py.File(hdf_file, 'w') as f:
+            f.create_dataset('raw', data=data, chunks=chunks, compression='gzip')
+
+        zarr_file = os.path.join(tmp_dir, 'raw.zarr')
+        ChunkedArray.create(
+            zarr_file, 'raw', shape, chunks, np.uint8).write((0, 0, 0), data)
+
+        seconds = run(
+            Hdf5Source(hdf_file, {raw: 'raw'}, array_specs=specs),
+            request_size, num_requests, num_workers)
+        print("Hdf5Source: %.3fms per batch"%(seconds*1000))
+
+        seconds = run(
+            ZarrSource(zarr_file, {raw: 'raw'}, array_specs=specs),
+            request_size, num_requests, num_workers)
+        print("ZarrSource: %.3fms per batch"%(seconds*1000))
+
+    finally:
+        shutil.rmtree(tmp_dir)
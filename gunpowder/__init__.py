@@ -6,6 +6,7 @@ from .nodes import *
 from .batch import Batch
 from .batch_provider_tree import *
 from .batch_request import BatchRequest
+from .buffer_pool import BufferPool
 from .build import build
 from .coordinate import Coordinate
 from .points import Points, Point, PointsKey, PointsKeys
@@ -75,6 +75,17 @@ class Array(Freezable):
         spec.roi = deepcopy(roi)
         return Array(data, spec, attrs)
 
+    def make_writeable(self):
+        '''Make sure the data of this array can be modified in-place. If the
+        data is a read-only view (e.g., into a volume kept by
+        :class:`Materialize`), it is replaced with a copy.
+
+        Nodes that change arrays in-place should call this first.
+        '''
+
+        if not self.data.flags.writeable:
+            self.data = np.array(self.data)
+
 class ArrayKey(Freezable):
     '''A key to identify arrays in requests, batches, and across nodes.
 
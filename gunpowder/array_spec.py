@@ -1,4 +1,3 @@
-import copy
 from .coordinate import Coordinate
 from .freezable import Freezable
 
@@ -41,7 +40,19 @@ class ArraySpec(Freezable):
 
     def copy(self):
         '''Create a copy of this spec.'''
-        return copy.deepcopy(self)
+
+        # all members but the ROI are immutable and can be shared
+        spec = type(self).__new__(type(self))
+        spec.__dict__.update(self.__dict__)
+        if self.roi is not None:
+            spec.roi = self.roi.copy()
+        return spec
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return self.copy()
 
     def __eq__(self, other):
 
@@ -0,0 +1,242 @@
+try:
+    import Queue
+except:
+    import queue as Queue
+import logging
+import multiprocessing
+import os
+import signal
+import traceback
+
+from .array import Array
+from .batch import Batch
+from .profiling import Timing
+from .shared_memory_pool import SharedMemoryPool, PackedBatch
+
+logger = logging.getLogger(__name__)
+
+class BackgroundWriterError(Exception):
+    pass
+
+class BackgroundWriter(object):
+    '''Calls a write function in a separate process, such that compression
+    and disk I/O do not block the calling process. (A thread would not help:
+    h5py holds the GIL while compressing and writing.)
+
+    Batches are handed over through a bounded queue. Their array data is
+    copied into shared memory slabs (see :class:`SharedMemoryPool`) instead of
+    being pickled. The writer process reports a :class:`Timing` of each write
+    back, together with the number of bytes written.
+
+    Args:
+
+        node (:class:`BatchProvider`):
+
+            The node the writer works for, used to name the reported timings.
+
+        write (callable):
+
+            Called in the writer process as ``write(batch, args)`` for each
+            item passed to :func:`put`. Can keep state (e.g., open files) in
+            the writer process.
+
+        close (callable, optional):
+
+            Called in the writer process after the last item was written.
+
+        queue_size (``int``):
+
+            How many batches to hold at most in the queue.
+
+        slab_size (``int``, optional):
+
+            The size of the shared memory slabs in bytes. Batches that do not
+            fit are pickled. If not given, all batches are pickled.
+    '''
+
+    def __init__(
+            self,
+            node,
+            write,
+            close=None,
+            queue_size=4,
+            slab_size=None):
+
+        self.node = node
+        self.write = write
+        self.close = close
+        self.queue_size = queue_size
+        self.slab_size = slab_size
+
+        self.__queue = None
+        self.__reports = None
+        self.__process = None
+        self.__shared_memory_pool = None
+        self.__num_queued = 0
+        self.__num_written = 0
+        self.__pending_reports = []
+        self.__error = None
+
+    def start(self):
+        '''Start the writer process.'''
+
+        # one slab per queued batch, one in the writer, and one being packed
+        if self.slab_size is not None:
+            self.__shared_memory_pool = SharedMemoryPool(
+                self.queue_size + 2,
+                self.slab_size)
+
+        self.__queue = multiprocessing.Queue(self.queue_size)
+        self.__reports = multiprocessing.Queue()
+        self.__process = multiprocessing.Process(target=self.__run)
+        self.__process.daemon = True
+        self.__process.start()
+
+    def put(self, batch, args=None, keys=None, block=True):
+        '''Queue ``batch`` for writing. Blocks while the queue is full, unless
+        ``block`` is ``False``, in which case the batch is not queued and
+        ``False`` returned.
+
+        Only the arrays with the given ``keys`` (all, if not given) are handed
+        to the writer process. The arrays of ``batch`` itself are not
+        changed.'''
+
+        self.__check()
+
+        if not block and self.get_queue_depth() >= self.queue_size:
+            return False
+
+        # a shallow copy, packing replaces the data of the arrays
+        shallow = Batch()
+        shallow.id = batch.id
+        shallow.iteration = batch.iteration
+        shallow.loss = batch.loss
+        for key, array in batch.arrays.items():
+            if keys is None or key in keys:
+                shallow.arrays[key] = Array(array.data, array.spec, array.attrs)
+
+        if self.__shared_memory_pool is not None:
+            shallow = self.__shared_memory_pool.pack(shallow)
+
+        while True:
+            try:
+                self.__queue.put((shallow, args), block, 0.1)
+                break
+            except Queue.Full:
+                if not block:
+                    if isinstance(shallow, PackedBatch):
+                        self.__shared_memory_pool.release(shallow.slab)
+                    return False
+                self.__check()
+
+        self.__num_queued += 1
+
+        return True
+
+    def get_queue_depth(self):
+        '''How many batches are queued or being written.'''
+
+        self.__poll()
+        return self.__num_queued - self.__num_written
+
+    def get_reports(self):
+        '''Get the reports of all writes that finished since the last call, as
+        a list of tuples ``(timing, num_bytes)``.'''
+
+        self.__poll()
+        reports = self.__pending_reports
+        self.__pending_reports = []
+        return reports
+
+    def stop(self):
+        '''Wait until all queued batches are written and stop the writer
+        process. Returns the remaining reports, see :func:`get_reports`.'''
+
+        if self.__process is None:
+            return []
+
+        if self.__process.is_alive():
+            self.__queue.put(None)
+            while self.__process.is_alive() or not self.__reports.empty():
+                self.__poll(timeout=0.1)
+        self.__process.join()
+        self.__process = None
+
+        if self.__error is not None:
+            raise BackgroundWriterError(self.__error)
+
+        return self.get_reports()
+
+    def __check(self):
+
+        self.__poll()
+
+        if self.__error is not None:
+            raise BackgroundWriterError(self.__error)
+
+        if not self.__process.is_alive():
+            raise BackgroundWriterError(
+                "writer process died with exit code %s"%
+                self.__process.exitcode)
+
+    def __poll(self, timeout=None):
+
+        while True:
+
+            try:
+                if timeout is None:
+                    report = self.__reports.get_nowait()
+                else:
+                    report = self.__reports.get(timeout=timeout)
+                    timeout = None
+            except Queue.Empty:
+                break
+
+            if isinstance(report, str):
+                self.__error = report
+                continue
+
+            self.__num_written += 1
+            self.__pending_reports.append(report)
+
+    def __run(self):
+
+        # let the main process handle interrupts, it will stop the writer
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        try:
+
+            while True:
+
+                item = self.__queue.get()
+                if item is None:
+                    break
+
+                batch, args = item
+                if self.__shared_memory_pool is not None:
+                    batch = self.__shared_memory_pool.unpack(batch)
+
+                timing = Timing(self.node, 'write')
+                timing.start()
+                self.write(batch, args)
+                timing.stop()
+
+                num_bytes = sum(a.data.nbytes for a in batch.arrays.values())
+
+                # release the slab
+                del batch, item
+
+                self.__reports.put((timing, num_bytes))
+
+            if self.close is not None:
+                self.close()
+
+        except:
+
+            self.__reports.put(
+                "writer process %d failed:\n%s"%(
+                    os.getpid(), traceback.format_exc()))
+
+        # wait until all reports are sent
+        self.__reports.close()
+        self.__reports.join_thread()
@@ -1,4 +1,3 @@
-import copy
 from .points import PointsKey
 from .points_spec import PointsSpec
 from .provider_spec import ProviderSpec
@@ -55,10 +54,6 @@ class BatchRequest(ProviderSpec):
         self[key] = spec
         self.__center_rois()
 
-    def copy(self):
-        '''Create a copy of this request.'''
-        return copy.deepcopy(self)
-
     def __center_rois(self):
         '''Ensure that all ROIs are centered around the same location.'''
 
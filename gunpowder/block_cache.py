@@ -0,0 +1,136 @@
+import collections
+import itertools
+import logging
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class BlockCache(object):
+    '''A least-recently-used cache of array blocks with a budget in bytes.
+
+    Blocks are numpy arrays, stored under an arbitrary (hashable) key. Once the
+    total size of all blocks exceeds the budget, the least recently used
+    blocks are evicted. The cache can be shared between threads. Worker
+    processes get their own copy of the cache when they are forked.
+
+    Args:
+
+        max_bytes (``int``):
+
+            The budget of the cache in bytes.
+    '''
+
+    def __init__(self, max_bytes):
+
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.__blocks = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        '''Get the block stored under ``key``, or ``None`` if it is not
+        cached.'''
+
+        with self.__lock:
+
+            block = self.__blocks.pop(key, None)
+
+            if block is None:
+                self.misses += 1
+                return None
+
+            # mark as most recently used
+            self.__blocks[key] = block
+            self.hits += 1
+
+            return block
+
+    def put(self, key, block):
+        '''Store a block under ``key``, evicting the least recently used
+        blocks if needed. Blocks larger than the budget are not stored.'''
+
+        if block.nbytes > self.max_bytes:
+            return
+
+        with self.__lock:
+
+            if key in self.__blocks:
+                self.num_bytes -= self.__blocks.pop(key).nbytes
+
+            self.__blocks[key] = block
+            self.num_bytes += block.nbytes
+
+            while self.num_bytes > self.max_bytes:
+                _, evicted = self.__blocks.popitem(last=False)
+                self.num_bytes -= evicted.nbytes
+
+    def read(self, dataset, key, block_shape, begin, end, out=None, pool=None):
+        '''Read the region ``[begin, end)`` of ``dataset`` by assembling it
+        from blocks of ``block_shape``, aligned with the origin of the dataset.
+        Blocks that are not cached are read from ``dataset`` (any object
+        supporting numpy-style slicing) and stored under ``(key,
+        block_index)``. If ``out`` is given, the region is written into it. If
+        ``pool`` (e.g., a ``multiprocessing.pool.ThreadPool``) is given,
+        missing blocks are read concurrently.
+
+        Returns the region and the number of cache hits and misses.'''
+
+        begin = np.array(begin)
+        end = np.array(end)
+        block_shape = np.array(block_shape)
+        dataset_shape = np.array(dataset.shape)
+
+        if out is None:
+            data = np.empty(end - begin, dtype=dataset.dtype)
+        else:
+            data = out
+
+        first = begin//block_shape
+        last = (end - 1)//block_shape
+
+        blocks = {}
+        missing = []
+
+        for index in itertools.product(*[
+                range(f, l + 1)
+                for f, l in zip(first, last)]):
+
+            block = self.get((key, index))
+
+            if block is None:
+                missing.append(index)
+            else:
+                blocks[index] = block
+
+        def read_block(index):
+            block_begin = np.array(index)*block_shape
+            block_end = np.minimum(block_begin + block_shape, dataset_shape)
+            return np.array(dataset[_slices(block_begin, block_end)])
+
+        if pool is not None and len(missing) > 1:
+            read_blocks = pool.map(read_block, missing)
+        else:
+            read_blocks = [read_block(index) for index in missing]
+
+        for index, block in zip(missing, read_blocks):
+            self.put((key, index), block)
+            blocks[index] = block
+
+        for index, block in blocks.items():
+
+            block_begin = np.array(index)*block_shape
+
+            # copy the intersection of block and region
+            lo = np.maximum(begin, block_begin)
+            hi = np.minimum(end, block_begin + block.shape)
+            data[_slices(lo - begin, hi - begin)] = \
+                block[_slices(lo - block_begin, hi - block_begin)]
+
+        return data, len(blocks) - len(missing), len(missing)
+
+def _slices(begin, end):
+    return tuple(slice(b, e) for b, e in zip(begin, end))
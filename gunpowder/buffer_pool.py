@@ -0,0 +1,84 @@
+import logging
+import threading
+import weakref
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class BufferPool(object):
+    '''A pool of reusable numpy arrays, to avoid allocating (and page-faulting
+    in) fresh memory for every batch.
+
+    :func:`get` leases a buffer of the requested shape and dtype. The returned
+    array is backed by a lease object, which is referenced by the array and
+    all views of it. Once the lease got garbage collected (i.e., the batch the
+    buffer was used in and all views of it are gone), the buffer is released
+    and can be handed out again. The contents of a buffer are undefined.
+
+    Args:
+
+        max_buffers (``int``):
+
+            How many buffers to keep at most. If all of them are leased,
+            :func:`get` allocates a new array that is not kept.
+    '''
+
+    def __init__(self, max_buffers=16):
+
+        self.max_buffers = max_buffers
+        self.__buffers = []
+        # index of buffer -> weak reference to its lease
+        self.__leases = {}
+        # reentrant, a lease can be released while the pool is locked
+        self.__lock = threading.RLock()
+
+    def get(self, shape, dtype):
+        '''Get a buffer of the given shape and dtype.'''
+
+        shape = tuple(shape)
+        dtype = np.dtype(dtype)
+
+        with self.__lock:
+
+            for i, buffer in enumerate(self.__buffers):
+
+                if buffer.shape != shape or buffer.dtype != dtype:
+                    continue
+
+                if i not in self.__leases:
+                    return self.__lease(i)
+
+            buffer = np.empty(shape, dtype=dtype)
+
+            if len(self.__buffers) < self.max_buffers:
+                self.__buffers.append(buffer)
+                return self.__lease(len(self.__buffers) - 1)
+
+            # replace a released buffer of a different shape, if there is one
+            for i in range(len(self.__buffers)):
+                if i not in self.__leases:
+                    self.__buffers[i] = buffer
+                    return self.__lease(i)
+
+            return buffer
+
+    def __lease(self, i):
+
+        lease = _Lease(self.__buffers[i])
+        self.__leases[i] = weakref.ref(lease, lambda _: self.__release(i))
+
+        return np.asarray(lease)
+
+    def __release(self, i):
+
+        with self.__lock:
+            del self.__leases[i]
+
+class _Lease(object):
+    '''Exposes a pooled buffer as the base of the array handed out.'''
+
+    def __init__(self, buffer):
+
+        self.__array_interface__ = buffer.__array_interface__
+        self.buffer = buffer
@@ -0,0 +1,241 @@
+import itertools
+import json
+import logging
+import os
+import tempfile
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# permissions for new chunk files (mkstemp creates them readable only by the
+# owner)
+_umask = os.umask(0)
+os.umask(_umask)
+_file_mode = 0o666 & ~_umask
+
+class ChunkedArray(object):
+    '''An n-dimensional array stored as a directory of independently
+    compressed chunks, following the zarr (version 2) storage format.
+
+    Each chunk is a file named after its grid index (e.g., ``0.3.1``),
+    containing the chunk in C order, compressed with zlib. Chunks at the upper
+    border are stored in full size. Missing chunks read as zeros. Array
+    attributes are kept in ``.zattrs``. Only the ``zlib`` and ``gzip``
+    compressors (or none) are supported for reading, chunks are written with
+    ``zlib``.
+
+    Chunks are read and written independently of each other. :func:`read` and
+    :func:`write` take an optional ``pool`` (e.g., a
+    ``multiprocessing.pool.ThreadPool``) to process them concurrently. Chunk
+    files are replaced atomically, such that readers never see a partially
+    written chunk. Concurrent writes to the same chunk are not synchronized,
+    though.
+
+    Args:
+
+        path (``string``):
+
+            The directory of an existing array. Use :func:`create` to create a
+            new one.
+    '''
+
+    def __init__(self, path):
+
+        self.path = path
+
+        with open(os.path.join(path, '.zarray'), 'r') as f:
+            meta = json.load(f)
+
+        assert meta['zarr_format'] == 2, (
+            "Unsupported zarr format %s in %s"%(meta['zarr_format'], path))
+        assert meta.get('order', 'C') == 'C', (
+            "Only C order is supported, %s has %s"%(path, meta['order']))
+        assert not meta.get('filters'), (
+            "Filters are not supported, %s has %s"%(path, meta['filters']))
+
+        self.shape = tuple(meta['shape'])
+        self.chunks = tuple(meta['chunks'])
+        self.dtype = np.dtype(meta['dtype'])
+        self.fill_value = meta.get('fill_value') or 0
+        self.separator = meta.get('dimension_separator', '.')
+
+        compressor = meta.get('compressor')
+        if compressor is None:
+            self.__decompress = lambda data: data
+        elif compressor['id'] == 'zlib':
+            self.__decompress = zlib.decompress
+        elif compressor['id'] == 'gzip':
+            self.__decompress = lambda data: zlib.decompress(data, 16 + zlib.MAX_WBITS)
+        else:
+            raise RuntimeError(
+                "Unsupported compressor %s in %s"%(compressor['id'], path))
+
+        self.compression_level = (
+            compressor.get('level', 5)
+            if compressor is not None and compressor['id'] == 'zlib'
+            else 5)
+
+        attrs_path = os.path.join(path, '.zattrs')
+        if os.path.exists(attrs_path):
+            with open(attrs_path, 'r') as f:
+                self.attrs = json.load(f)
+        else:
+            self.attrs = {}
+
+    @staticmethod
+    def create(root, name, shape, chunks, dtype, compression_level=5, attrs=None):
+        '''Create a new array ``name`` (e.g., ``volumes/raw``) in the zarr
+        container (a directory) ``root``, including all groups on the way, and
+        return it.'''
+
+        path = root
+        for group in [''] + name.strip('/').split('/')[:-1]:
+            path = os.path.join(path, group)
+            ChunkedArray.__create_group(path)
+
+        path = os.path.join(root, name.strip('/'))
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        meta = {
+            'zarr_format': 2,
+            'shape': [int(s) for s in shape],
+            'chunks': [int(c) for c in chunks],
+            'dtype': np.dtype(dtype).str,
+            'compressor': {'id': 'zlib', 'level': compression_level},
+            'fill_value': 0,
+            'order': 'C',
+            'filters': None
+        }
+
+        with open(os.path.join(path, '.zarray'), 'w') as f:
+            json.dump(meta, f)
+
+        array = ChunkedArray(path)
+        if attrs is not None:
+            array.set_attrs(attrs)
+
+        return array
+
+    def set_attrs(self, attrs):
+        '''Update the attributes of this array.'''
+
+        self.attrs.update(attrs)
+        with open(os.path.join(self.path, '.zattrs'), 'w') as f:
+            json.dump(self.attrs, f)
+
+    def read(self, begin, end, out=None, pool=None):
+        '''Read the region ``[begin, end)``. If ``out`` is given, the region is
+        written into it.'''
+
+        begin = np.array(begin)
+        end = np.array(end)
+
+        if out is None:
+            out = np.empty(end - begin, dtype=self.dtype)
+
+        def read_chunk(index):
+
+            chunk_begin = np.array(index)*self.chunks
+            chunk = self.__read_chunk(index)
+
+            lo = np.maximum(begin, chunk_begin)
+            hi = np.minimum(end, chunk_begin + self.chunks)
+            out[_slices(lo - begin, hi - begin)] = \
+                chunk[_slices(lo - chunk_begin, hi - chunk_begin)]
+
+        self.__map(read_chunk, self.__chunk_indices(begin, end), pool)
+
+        return out
+
+    def write(self, begin, data, pool=None):
+        '''Write ``data`` to the region starting at ``begin``. Chunks that are
+        only partially covered are read and updated.'''
+
+        begin = np.array(begin)
+        end = begin + data.shape
+        shape = np.array(self.shape)
+
+        def write_chunk(index):
+
+            chunk_begin = np.array(index)*self.chunks
+            chunk_end = np.minimum(chunk_begin + self.chunks, shape)
+
+            lo = np.maximum(begin, chunk_begin)
+            hi = np.minimum(end, chunk_end)
+
+            if np.all(lo == chunk_begin) and np.all(hi == chunk_end):
+                chunk = np.full(self.chunks, self.fill_value, dtype=self.dtype)
+            else:
+                chunk = np.array(self.__read_chunk(index))
+
+            chunk[_slices(lo - chunk_begin, hi - chunk_begin)] = \
+                data[_slices(lo - begin, hi - begin)]
+
+            self.__write_chunk(index, chunk)
+
+        self.__map(write_chunk, self.__chunk_indices(begin, end), pool)
+
+    def __chunk_indices(self, begin, end):
+
+        first = begin//self.chunks
+        last = (end - 1)//self.chunks
+
+        return list(itertools.product(*[
+            range(f, l + 1)
+            for f, l in zip(first, last)]))
+
+    def __map(self, function, indices, pool):
+
+        if pool is None or len(indices) == 1:
+            for index in indices:
+                function(index)
+        else:
+            pool.map(function, indices)
+
+    def __chunk_path(self, index):
+        return os.path.join(
+            self.path,
+            self.separator.join(str(i) for i in index))
+
+    def __read_chunk(self, index):
+
+        try:
+            with open(self.__chunk_path(index), 'rb') as f:
+                data = f.read()
+        except IOError as e:
+            if not os.path.exists(self.__chunk_path(index)):
+                return np.full(self.chunks, self.fill_value, dtype=self.dtype)
+            raise e
+
+        return np.frombuffer(
+            self.__decompress(data),
+            dtype=self.dtype).reshape(self.chunks)
+
+    def __write_chunk(self, index, chunk):
+
+        data = zlib.compress(
+            np.ascontiguousarray(chunk, dtype=self.dtype).tobytes(),
+            self.compression_level)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, _file_mode)
+        os.rename(tmp_path, self.__chunk_path(index))
+
+    @staticmethod
+    def __create_group(path):
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        group_file = os.path.join(path, '.zgroup')
+        if not os.path.exists(group_file):
+            with open(group_file, 'w') as f:
+                json.dump({'zarr_format': 2}, f)
+
+def _slices(begin, end):
+    return tuple(slice(b, e) for b, e in zip(begin, end))
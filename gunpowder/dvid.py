@@ -0,0 +1,209 @@
+try:
+    import httplib
+except ImportError:
+    import http.client as httplib
+import itertools
+import json
+import logging
+import os
+import socket
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# persistent HTTP connections, one per thread and server
+_local = threading.local()
+
+# dtypes of DVID data types, if not stated explicitly in the instance info
+_type_dtypes = {
+    'uint8blk': np.uint8,
+    'labelblk': np.uint64,
+    'labelarray': np.uint64,
+    'labelmap': np.uint64
+}
+
+class DvidInstance(object):
+    '''A data instance (e.g., ``uint8blk`` or ``labelblk``) or ROI of a DVID
+    node, read over HTTP.
+
+    Each thread keeps one persistent connection per server, which is reused
+    for all requests. Worker processes open their own connections.
+
+    Instances support numpy-style slicing (in voxels, in z, y, x order), such
+    that they can be used with :class:`BlockCache`. Slices are passed on to
+    DVID as they are.
+
+    Args:
+
+        hostname (``string``):
+
+            The name of the DVID server.
+
+        port (``int``):
+
+            The port of the DVID server.
+
+        uuid (``string``):
+
+            The UUID of the DVID node.
+
+        name (``string``):
+
+            The name of the data instance or ROI.
+
+        is_roi (``bool``):
+
+            If set, the instance is a ROI, and reading returns a binary mask
+            (``np.uint8``).
+    '''
+
+    def __init__(self, hostname, port, uuid, name, is_roi=False):
+
+        self.hostname = hostname
+        self.port = port
+        self.uuid = uuid
+        self.name = name
+        self.is_roi = is_roi
+
+        # the extent of the instance in voxels, used to clip blocks read
+        # through BlockCache
+        self.shape = None
+
+        self.__info = None
+
+    @property
+    def info(self):
+        '''The metadata of this instance (not available for ROIs).'''
+
+        if self.__info is None:
+            self.__info = json.loads(
+                self.__get('info').decode('utf-8'))
+        return self.__info
+
+    @property
+    def dtype(self):
+
+        if self.is_roi:
+            return np.dtype(np.uint8)
+
+        values = self.info['Extended'].get('Values')
+        if values:
+            return np.dtype(str(values[0]['DataType']))
+
+        return np.dtype(_type_dtypes[self.info['Base']['TypeName']])
+
+    def read(self, begin, end):
+        '''Read the region ``[begin, end)`` (in voxels, z, y, x) with a single
+        HTTP request.'''
+
+        size = [int(e - b) for b, e in zip(begin, end)]
+
+        if self.is_roi:
+            endpoint = 'mask'
+        else:
+            endpoint = 'raw'
+
+        data = self.__get('%s/0_1_2/%s/%s'%(
+            endpoint,
+            '_'.join(str(s) for s in size[::-1]),
+            '_'.join(str(int(b)) for b in begin[::-1])))
+
+        return np.frombuffer(data, dtype=self.dtype).reshape(size)
+
+    def read_tiled(self, begin, end, tile_shape, out=None, pool=None):
+        '''Read the region ``[begin, end)`` in tiles of ``tile_shape``,
+        aligned with the origin. If ``pool`` (e.g., a
+        ``multiprocessing.pool.ThreadPool``) is given, the tiles are read
+        concurrently. If ``out`` is given, the region is written into it.'''
+
+        begin = np.array(begin)
+        end = np.array(end)
+        tile_shape = np.array(tile_shape)
+
+        if out is None:
+            out = np.empty(end - begin, dtype=self.dtype)
+
+        first = begin//tile_shape
+        last = (end - 1)//tile_shape
+
+        def read_tile(index):
+
+            tile_begin = np.array(index)*tile_shape
+            lo = np.maximum(begin, tile_begin)
+            hi = np.minimum(end, tile_begin + tile_shape)
+
+            out[_slices(lo - begin, hi - begin)] = self.read(lo, hi)
+
+        indices = list(itertools.product(*[
+            range(f, l + 1)
+            for f, l in zip(first, last)]))
+
+        if pool is not None and len(indices) > 1:
+            pool.map(read_tile, indices)
+        else:
+            for index in indices:
+                read_tile(index)
+
+        return out
+
+    def __getitem__(self, slices):
+
+        return self.read(
+            [s.start for s in slices],
+            [s.stop for s in slices])
+
+    def __get(self, path):
+
+        url = '/api/node/%s/%s/%s'%(self.uuid, self.name, path)
+
+        # a kept-alive connection might have been closed by the server in the
+        # meantime, retry once with a new one
+        for attempt in range(2):
+
+            connection = _get_connection(self.hostname, self.port)
+
+            try:
+                connection.request('GET', url)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (httplib.HTTPException, socket.error):
+                _drop_connection(self.hostname, self.port)
+                if attempt == 1:
+                    raise
+
+        if response.status != 200:
+            raise RuntimeError(
+                "DVID request %s failed with status %d: %s"%(
+                    url, response.status, data[:200]))
+
+        return data
+
+    def __repr__(self):
+
+        return "%s:%s/%s/%s"%(self.hostname, self.port, self.uuid, self.name)
+
+def _get_connection(hostname, port):
+
+    # connections do not survive a fork, open new ones in forked processes
+    pid = os.getpid()
+    if getattr(_local, 'pid', None) != pid:
+        _local.connections = {}
+        _local.pid = pid
+
+    key = (hostname, port)
+    if key not in _local.connections:
+        _local.connections[key] = httplib.HTTPConnection(hostname, port)
+
+    return _local.connections[key]
+
+def _drop_connection(hostname, port):
+
+    connection = _local.connections.pop((hostname, port), None)
+    if connection is not None:
+        connection.close()
+
+def _slices(begin, end):
+    return tuple(slice(b, e) for b, e in zip(begin, end))
@@ -40,3 +40,8 @@ try:
     import augment
 except ImportError:
     augment = NoSuchModule('augment')
+
+try:
+    import threadpoolctl
+except ImportError:
+    threadpoolctl = NoSuchModule('threadpoolctl')
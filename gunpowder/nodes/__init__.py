@@ -17,6 +17,8 @@ from .hdf5_write import Hdf5Write
 from .intensity_augment import IntensityAugment
 from .intensity_scale_shift import IntensityScaleShift
 from .klb_source import KlbSource
+from .materialize import Materialize
+from .memmap_source import MemmapSource, hdf5_to_memmap
 from .merge_provider import MergeProvider
 from .normalize import Normalize
 from .pad import Pad
@@ -31,3 +33,6 @@ from .scan import Scan
 from .simple_augment import SimpleAugment
 from .snapshot import Snapshot
 from .specified_location import SpecifiedLocation
+from .write_chrome_trace import WriteChromeTrace
+from .zarr_source import ZarrSource
+from .zarr_write import ZarrWrite
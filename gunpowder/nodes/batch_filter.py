@@ -1,4 +1,3 @@
-import copy
 import logging
 
 from .batch_provider import BatchProvider
@@ -55,7 +54,7 @@ class BatchFilter(BatchProvider):
         '''
 
         assert key in self.spec, "Node %s is trying to change the spec for %s, but is not provided upstream."%(type(self).__name__, key)
-        self.spec[key] = copy.deepcopy(spec)
+        self.spec[key] = spec.copy()
         self.updated_items.append(key)
 
         logger.debug("%s updates %s with %s"%(self.name(), key, spec))
@@ -77,7 +76,7 @@ class BatchFilter(BatchProvider):
     def _init_spec(self):
         # default for BatchFilters is to provide the same as upstream
         if not hasattr(self, '_spec') or self._spec is None:
-            self._spec = copy.deepcopy(self.get_upstream_provider().spec)
+            self._spec = self.get_upstream_provider().spec.copy()
 
     def internal_teardown(self):
 
@@ -110,19 +109,24 @@ class BatchFilter(BatchProvider):
 
     def provide(self, request):
 
-        # operate on a copy of the request, to provide the original request to
-        # 'process' for convenience
-        upstream_request = copy.deepcopy(request)
-
         skip = self.__can_skip(request)
 
         timing_prepare = Timing(self, 'prepare')
         timing_prepare.start()
 
-        if not skip:
+        if not skip and self.__modifies_request(request):
+
+            # operate on a copy of the request, to provide the original request
+            # to 'process' for convenience
+            upstream_request = request.copy()
             self.prepare(upstream_request)
             self.remove_provided(upstream_request)
 
+        else:
+
+            # nothing to change, pass the request on as it is (copy-on-write)
+            upstream_request = request
+
         timing_prepare.stop()
 
         batch = self.get_upstream_provider().request_batch(upstream_request)
@@ -140,6 +144,21 @@ class BatchFilter(BatchProvider):
 
         return batch
 
+    def __modifies_request(self, request):
+        '''Check if this filter might change the given request on its way
+        upstream, i.e., if it implements :func:`prepare` or provides any of
+        the requested keys.'''
+
+        prepare = getattr(type(self).prepare, '__func__', type(self).prepare)
+        if prepare is not _default_prepare:
+            return True
+
+        for key in self.provided_items:
+            if key in request:
+                return True
+
+        return False
+
     def __can_skip(self, request):
         '''Check if this filter needs to be run for the given request.'''
 
@@ -192,3 +211,5 @@ class BatchFilter(BatchProvider):
                 this request.
         '''
         raise RuntimeError("Class %s does not implement 'process'"%type(self).__name__)
+
+_default_prepare = getattr(BatchFilter.prepare, '__func__', BatchFilter.prepare)
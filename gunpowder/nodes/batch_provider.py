@@ -1,4 +1,3 @@
-import copy
 import logging
 from gunpowder.coordinate import Coordinate
 from gunpowder.points_spec import PointsSpec
@@ -78,7 +77,7 @@ class BatchProvider(object):
             "Node %s is trying to add spec for %s, but is already "
             "provided."%(type(self).__name__, key))
 
-        self.spec[key] = copy.deepcopy(spec)
+        self.spec[key] = spec.copy()
         self.provided_items.append(key)
 
         logger.debug("%s provides %s with spec %s", self.name(), key, spec)
@@ -143,7 +142,7 @@ class BatchProvider(object):
 
         self.check_request_consistency(request)
 
-        batch = self.provide(copy.deepcopy(request))
+        batch = self.provide(request.copy())
 
         self.check_batch_consistency(batch, request)
 
@@ -172,6 +172,7 @@ class DefectAugment(BatchFilter):
         assert batch.get_total_roi().dims() == 3, "defectaugment works on 3d batches only"
 
         raw = batch.arrays[self.intensities]
+        raw.make_writeable()
         raw_voxel_size = self.spec[self.intensities].voxel_size
 
         for c, augmentation_type in self.slice_to_augmentation.items():
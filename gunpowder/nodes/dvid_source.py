@@ -2,10 +2,12 @@ import logging
 import numpy as np
 
 from gunpowder.batch import Batch
+from gunpowder.block_cache import BlockCache
 from gunpowder.coordinate import Coordinate
-from gunpowder.ext import dvision
+from gunpowder.dvid import DvidInstance
 from gunpowder.profiling import Timing
 from gunpowder.roi import Roi
+from gunpowder.thread_pool import ProcessThreadPool
 from gunpowder.array import Array
 from gunpowder.array_spec import ArraySpec
 from .batch_provider import BatchProvider
@@ -17,6 +19,11 @@ class DvidSource(BatchProvider):
 
     Provides arrays from DVID servers for each array key given.
 
+    Requests are split into tiles aligned with the beginning of the provided
+    ROI, which are fetched concurrently over persistent HTTP connections (one
+    per thread). Each process (e.g., a worker of :class:`PreCache`) starts its
+    own threads and connections on its first request.
+
     Args:
 
         hostname (``string``):
@@ -47,6 +54,25 @@ class DvidSource(BatchProvider):
             array specs automatically determined from the DVID server. This is
             useful to set ``voxel_size``, for example. Only fields that are not
             ``None`` in the given :class:`ArraySpec` will be used.
+
+        num_threads (``int``):
+
+            How many tiles to fetch in parallel.
+
+        cache_size (``int``, optional):
+
+            If given, keep a cache of up to that many bytes of tiles fetched
+            from the server, such that overlapping requests fetch each tile
+            only once. Least recently used tiles are evicted first. Cache hits
+            and misses are reported as counters in the profiling stats of each
+            batch. Each worker process of a :class:`PreCache` has its own
+            cache, thread workers share one.
+
+        tile_shape (``tuple`` of ``int``):
+
+            The shape of the tiles in voxels. Should be a multiple of the
+            block size of the DVID data instances (usually 32 voxels per
+            dimension), such that each tile is served from whole blocks.
     '''
 
     def __init__(
@@ -56,7 +82,10 @@ class DvidSource(BatchProvider):
             uuid,
             datasets,
             masks=None,
-            array_specs=None):
+            array_specs=None,
+            num_threads=8,
+            cache_size=None,
+            tile_shape=(64, 64, 64)):
 
         self.hostname = hostname
         self.port = port
@@ -68,20 +97,51 @@ class DvidSource(BatchProvider):
 
         self.array_specs = array_specs if array_specs is not None else {}
 
+        self.num_threads = num_threads
+        self.tile_shape = tuple(tile_shape)
+
+        if cache_size is not None:
+            self.block_cache = BlockCache(cache_size)
+        else:
+            self.block_cache = None
+
         self.ndims = None
+        self.instances = {}
+
+        self.__pool = ProcessThreadPool(self.num_threads)
 
     def setup(self):
 
-        for array_key, _ in self.datasets.items():
+        for array_key, name in self.datasets.items():
+            self.instances[array_key] = DvidInstance(
+                self.hostname,
+                self.port,
+                self.uuid,
+                name)
             spec = self.__get_spec(array_key)
             self.provides(array_key, spec)
 
-        for array_key, _ in self.masks.items():
+        for array_key, name in self.masks.items():
+            self.instances[array_key] = DvidInstance(
+                self.hostname,
+                self.port,
+                self.uuid,
+                name,
+                is_roi=True)
             spec = self.__get_mask_spec(array_key)
             self.provides(array_key, spec)
 
+        # the extent of each instance, to clip cached tiles
+        for array_key, instance in self.instances.items():
+            spec = self.spec[array_key]
+            instance.shape = (spec.roi/spec.voxel_size).get_shape()
+
         logger.info("DvidSource.spec:\n%s", self.spec)
 
+    def teardown(self):
+
+        self.__pool.close()
+
     def provide(self, request):
 
         timing = Timing(self)
@@ -106,13 +166,10 @@ class DvidSource(BatchProvider):
             array_spec.roi = request_spec.roi
 
             # read the data
-            if array_key in self.datasets:
-                data = self.__read_array(self.datasets[array_key], dataset_roi)
-            elif array_key in self.masks:
-                data = self.__read_mask(self.masks[array_key], dataset_roi)
-            else:
-                assert False, ("Encountered a request for %s that is neither a volume "
-                               "nor a mask."%array_key)
+            data = self.__read(
+                array_key,
+                dataset_roi,
+                batch.profiling_stats)
 
             # add array to batch
             batch.arrays[array_key] = Array(data, array_spec)
@@ -124,34 +181,9 @@ class DvidSource(BatchProvider):
 
         return batch
 
-    def __get_info(self, array_key):
-
-        if array_key in self.datasets:
-
-            data = dvision.DVIDDataInstance(
-                self.hostname,
-                self.port,
-                self.uuid,
-                self.datasets[array_key])
-
-        elif array_key in self.masks:
-
-            data = dvision.DVIDRegionOfInterest(
-                self.hostname,
-                self.port,
-                self.uuid,
-                self.masks[array_key])
-
-        else:
-
-            assert False, ("Encountered a request that is neither a volume "
-                           "nor a mask.")
-
-        return data.info
-
     def __get_spec(self, array_key):
 
-        info = self.__get_info(array_key)
+        info = self.instances[array_key].info
 
         roi_min = info['Extended']['MinPoint']
         if roi_min is not None:
@@ -181,11 +213,7 @@ class DvidSource(BatchProvider):
         if spec.roi is None:
             spec.roi = data_roi*spec.voxel_size
 
-        data_dtype = dvision.DVIDDataInstance(
-            self.hostname,
-            self.port,
-            self.uuid,
-            self.datasets[array_key]).dtype
+        data_dtype = self.instances[array_key].dtype
 
         if spec.dtype is not None:
             assert spec.dtype == data_dtype, ("dtype %s provided in array_specs for %s, "
@@ -266,25 +294,30 @@ class DvidSource(BatchProvider):
 
         return spec
 
-    def __read_array(self, instance, roi):
+    def __read(self, array_key, roi, profiling_stats):
 
-        data_instance = dvision.DVIDDataInstance(
-            self.hostname,
-            self.port,
-            self.uuid,
-            instance)
+        instance = self.instances[array_key]
 
-        return data_instance[roi.get_bounding_box()]
+        if self.block_cache is None:
 
-    def __read_mask(self, instance, roi):
+            return instance.read_tiled(
+                roi.get_begin(),
+                roi.get_end(),
+                self.tile_shape,
+                pool=self.__pool.get())
 
-        dvid_roi = dvision.DVIDRegionOfInterest(
-            self.hostname,
-            self.port,
-            self.uuid,
-            instance)
+        data, hits, misses = self.block_cache.read(
+            instance,
+            (self.uuid, instance.name),
+            self.tile_shape,
+            roi.get_begin(),
+            roi.get_end(),
+            pool=self.__pool.get())
+
+        profiling_stats.add_to_counter(type(self).__name__, 'cache hits', hits)
+        profiling_stats.add_to_counter(type(self).__name__, 'cache misses', misses)
 
-        return dvid_roi[roi.get_bounding_box()]
+        return data
 
     def __repr__(self):
 
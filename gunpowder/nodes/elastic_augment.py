@@ -1,13 +1,16 @@
+import collections
 import copy
 import logging
 import math
 import numpy as np
 import random
+import threading
 
 from .batch_filter import BatchFilter
 from gunpowder.coordinate import Coordinate
 from gunpowder.ext import augment
 from gunpowder.roi import Roi
+from gunpowder.thread_pool import ProcessThreadPool
 
 logger = logging.getLogger(__name__)
 
@@ -54,6 +57,37 @@ class ElasticAugment(BatchFilter):
             piecewise linear deformations for large factors. Usually, a factor
             of 4 can savely by used without noticable changes. However, the
             default is 1 (i.e., no subsampling).
+
+        pool_size (``int``, optional):
+
+            If set, do not create a new transformation for each batch, but keep
+            a pool of this many transformations per shape of the requested
+            (total) ROI and draw from it at random. The pool is filled by the
+            first ``pool_size`` batches. Slip and shift misalignments are
+            still sampled for each batch. Note that each transformation stores
+            three ``float32`` values per voxel of the total ROI (plus
+            ``pool_margin``), a pool can take a lot of memory.
+
+        pool_refresh (``int``, optional):
+
+            If set, replace a random transformation of the pool with a new one
+            every ``pool_refresh`` batches. New transformations are created in
+            a background thread, batches continue to draw from the current
+            pool meanwhile. If not set (the default), the pool does not change
+            once it is filled.
+
+        pool_margin (``int`` or ``tuple`` of ``int``, optional):
+
+            Create pooled transformations larger than the total ROI by this
+            many voxels per dimension, and use a random crop of them for each
+            batch. Defaults to 0.
+
+        pool_mirror (``bool``, optional):
+
+            Randomly mirror transformations drawn from the pool in z, and in y
+            and x together. This does not change the distribution of the
+            deformations (mirroring y and x together preserves the direction
+            of rotations). Defaults to ``True``.
     '''
 
     def __init__(
@@ -64,7 +98,11 @@ class ElasticAugment(BatchFilter):
             prob_slip=0,
             prob_shift=0,
             max_misalign=0,
-            subsample=1):
+            subsample=1,
+            pool_size=None,
+            pool_refresh=None,
+            pool_margin=0,
+            pool_mirror=True):
 
         self.control_point_spacing = control_point_spacing
         self.jitter_sigma = jitter_sigma
@@ -74,6 +112,22 @@ class ElasticAugment(BatchFilter):
         self.prob_shift = prob_shift
         self.max_misalign = max_misalign
         self.subsample = subsample
+        self.pool_size = pool_size
+        self.pool_refresh = pool_refresh
+        self.pool_margin = pool_margin
+        self.pool_mirror = pool_mirror
+        self.transformation_pools = collections.OrderedDict()
+        # the pools are shared with the copies of thread workers of PreCache
+        self.transformation_pools_lock = threading.Lock()
+
+        # refreshes transformations in the background, one thread per kept
+        # pool (a pool of a single thread would not be started)
+        self.__pool = ProcessThreadPool(2)
+
+    def teardown(self):
+
+        self.__pool.close()
+        self.transformation_pools.clear()
 
     def prepare(self, request):
 
@@ -106,9 +160,22 @@ class ElasticAugment(BatchFilter):
         # covers all voxels of the all requested ROIs. The master transformation
         # is zero-based.
 
-        # create a transformation with the size of the master ROI in voxels
-        self.master_transformation = self.__create_transformation(
-            master_roi_voxels.get_shape())
+        # create a transformation with the size of the master ROI in voxels,
+        # or draw one from the pool
+        master_shape = master_roi_voxels.get_shape()
+        if self.pool_size:
+            self.master_transformation, value_scale, value_offset = \
+                self.__draw_transformation(master_shape)
+        else:
+            self.master_transformation = self.__create_transformation(
+                master_shape)
+            value_scale, value_offset = None, None
+
+        # misalignments are cheap, sample them for each batch even if the
+        # transformation is drawn from the pool
+        misalign_shifts = None
+        if self.prob_slip + self.prob_shift > 0:
+            misalign_shifts = self.__misalignment_shifts(master_shape[0])
 
         # Third, crop out parts of the master transformation for each of the
         # smaller requested ROIs. Since these ROIs now have to align with the
@@ -151,6 +218,15 @@ class ElasticAugment(BatchFilter):
                     (slice(None),) +
                     target_roi_in_master_roi_voxels.get_bounding_box()]
             )
+            if value_scale is not None:
+                for d in range(transformation.shape[0]):
+                    transformation[d] *= value_scale[d]
+                    transformation[d] += value_offset[d]
+            if misalign_shifts is not None:
+                z_begin = target_roi_in_master_roi_voxels.get_begin()[0]
+                self.__misalign(
+                    transformation,
+                    misalign_shifts[z_begin:z_begin + transformation.shape[1]])
             self.transformations[key] = transformation
 
             # get ROI of all voxels necessary to perfrom transformation
@@ -310,11 +386,83 @@ class ElasticAugment(BatchFilter):
                     transformation,
                     target_shape)
 
-        if self.prob_slip + self.prob_shift > 0:
-            self.__misalign(transformation)
-
         return transformation
 
+    def __draw_transformation(self, shape):
+        '''Draw a transformation for the given shape from the pool. Returns a
+        view into the pooled transformation, and a scale and offset per
+        dimension to apply to the values of (copies of) the view.'''
+
+        shape = tuple(shape)
+        dims = len(shape)
+        margin = self.pool_margin
+        if not isinstance(margin, collections.Iterable):
+            margin = (margin,)*dims
+        pooled_shape = tuple(s + m for s, m in zip(shape, margin))
+
+        with self.transformation_pools_lock:
+
+            if shape not in self.transformation_pools:
+                self.transformation_pools[shape] = _TransformationPool()
+                # keep pools for a few shapes only, they are large
+                while len(self.transformation_pools) > 2:
+                    self.transformation_pools.popitem(last=False)
+            pool = self.transformation_pools[shape]
+
+            if pool.pending is not None and pool.pending.ready():
+                pool.replace(random.randrange(len(pool)), pool.pending.get())
+                pool.pending = None
+
+            fill = len(pool) < self.pool_size
+            if (
+                    not fill and
+                    self.pool_refresh and
+                    pool.num_draws%self.pool_refresh == 0 and
+                    pool.pending is None):
+                logger.debug("creating new transformation for pool")
+                pool.pending = self.__pool.get().apply_async(
+                    self.__create_transformation,
+                    (pooled_shape,))
+
+        # create transformations to fill the pool outside of the lock, such
+        # that threads can do so concurrently
+        if fill:
+            logger.debug("creating transformation %d of pool", len(pool))
+            transformation = self.__create_transformation(pooled_shape)
+
+        with self.transformation_pools_lock:
+            if fill and len(pool) < self.pool_size:
+                pool.add(transformation)
+            transformation = pool.draw()
+
+        # crop at a random offset
+        offset = tuple(random.randint(0, m) for m in margin)
+        transformation = transformation[
+            (slice(None),) +
+            tuple(slice(o, o + s) for o, s in zip(offset, shape))]
+
+        # source coordinates are relative to the crop now
+        value_scale = [1]*dims
+        value_offset = [-o for o in offset]
+
+        if self.pool_mirror:
+
+            # mirror z, and y and x together
+            mirror_dims = []
+            if random.randint(0, 1):
+                mirror_dims.append(0)
+            if random.randint(0, 1):
+                mirror_dims += list(range(1, dims))
+            logger.debug("mirroring transformation in %s", mirror_dims)
+
+            for d in mirror_dims:
+                transformation = transformation[
+                    (slice(None),)*(1 + d) + (slice(None, None, -1),)]
+                value_scale[d] = -1
+                value_offset[d] = shape[d] - 1 + offset[d]
+
+        return transformation, value_scale, value_offset
+
     def __project(self, transformation, location):
         '''Find the projection of location given by transformation. Returns None
         if projection lies outside of transformation.'''
@@ -412,9 +560,7 @@ class ElasticAugment(BatchFilter):
         for d in range(transformation.shape[0]):
             transformation[d] += shift[d]
 
-    def __misalign(self, transformation):
-
-        num_sections = transformation[0].shape[0]
+    def __misalignment_shifts(self, num_sections):
 
         shifts = [Coordinate((0,0,0))]*num_sections
         for z in range(num_sections):
@@ -433,6 +579,12 @@ class ElasticAugment(BatchFilter):
 
         logger.debug("misaligning sections with " + str(shifts))
 
+        return shifts
+
+    def __misalign(self, transformation, shifts):
+
+        num_sections = transformation[0].shape[0]
+
         dims = 3
         bb_min = tuple(int(math.floor(transformation[d].min())) for d in range(dims))
         bb_max = tuple(int(math.ceil(transformation[d].max())) + 1 for d in range(dims))
@@ -449,3 +601,31 @@ class ElasticAugment(BatchFilter):
     def __random_offset(self):
 
         return Coordinate((0,) + tuple(self.max_misalign - random.randint(0, 2*int(self.max_misalign)) for d in range(2)))
+
+
+class _TransformationPool(object):
+    '''A list of transformations for one shape, and the state of its
+    refresh.'''
+
+    def __init__(self):
+
+        self.transformations = []
+        self.num_draws = 0
+        self.pending = None
+
+    def __len__(self):
+
+        return len(self.transformations)
+
+    def add(self, transformation):
+
+        self.transformations.append(transformation)
+
+    def replace(self, index, transformation):
+
+        self.transformations[index] = transformation
+
+    def draw(self):
+
+        self.num_draws += 1
+        return random.choice(self.transformations)
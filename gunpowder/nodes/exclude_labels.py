@@ -60,6 +60,7 @@ class ExcludeLabels(BatchFilter):
     def process(self, batch, request):
 
         gt = batch.arrays[self.labels]
+        gt.make_writeable()
 
         # 0 marks included regions (to be used directly with distance transform
         # later)
@@ -42,6 +42,7 @@ class GrowBoundary(BatchFilter):
     def process(self, batch, request):
 
         gt = batch.arrays[self.labels]
+        gt.make_writeable()
         gt_mask = None if not self.mask else batch.arrays[self.mask]
 
         if gt_mask is not None:
@@ -1,8 +1,10 @@
 import copy
 import logging
 import numpy as np
+import os
 
 from gunpowder.batch import Batch
+from gunpowder.block_cache import BlockCache
 from gunpowder.coordinate import Coordinate
 from gunpowder.ext import h5py
 from gunpowder.profiling import Timing
@@ -39,13 +41,49 @@ class Hdf5Source(BatchProvider):
             the array specs automatically determined from the HDF5 file. This
             is useful to set a missing ``voxel_size``, for example. Only fields
             that are not ``None`` in the given :class:`ArraySpec` will be used.
+
+        cache_size (``int``, optional):
+
+            If given, keep a cache of up to that many bytes of blocks read from
+            the datasets. Requests are assembled from these blocks, such that
+            overlapping requests (e.g., from random locations close to each
+            other or from a scan with context) read and decompress each block
+            only once. Blocks are aligned with the HDF5 chunks of a dataset
+            (or have a size of 64 voxels per dimension for contiguous
+            datasets). Least recently used blocks are evicted first. Cache hits
+            and misses are reported as counters in the profiling stats of each
+            batch. Each worker process of a :class:`PreCache` has its own
+            cache, thread workers share one.
+
+        rdcc_nbytes (``int``, optional):
+
+            Size of the HDF5 chunk cache of each dataset in bytes (see
+            ``h5py.File``). The HDF5 default is 1MB.
+
+        rdcc_nslots (``int``, optional):
+
+            Number of hash slots of the HDF5 chunk cache (see ``h5py.File``).
+            Should be a prime about 100 times the number of chunks fitting
+            into ``rdcc_nbytes``.
+
+        buffer_pool (:class:`BufferPool`, optional):
+
+            If given, arrays are read into buffers from this pool instead of
+            freshly allocated memory.
+
+    The HDF5 file is kept open between requests. Each process (e.g., a worker
+    of :class:`PreCache`) opens its own handle on its first request.
     '''
 
     def __init__(
             self,
             filename,
             datasets,
-            array_specs=None):
+            array_specs=None,
+            cache_size=None,
+            rdcc_nbytes=None,
+            rdcc_nslots=None,
+            buffer_pool=None):
 
         self.filename = filename
         self.datasets = datasets
@@ -57,20 +95,48 @@ class Hdf5Source(BatchProvider):
 
         self.ndims = None
 
+        if cache_size is not None:
+            self.block_cache = BlockCache(cache_size)
+        else:
+            self.block_cache = None
+        self.block_shapes = {}
+
+        self.rdcc_nbytes = rdcc_nbytes
+        self.rdcc_nslots = rdcc_nslots
+        self.buffer_pool = buffer_pool
+
+        self.__hdf_file = None
+        self.__hdf_file_pid = None
+
     def setup(self):
 
-        hdf_file = h5py.File(self.filename, 'r')
+        # the file is not kept open here: HDF5 would hand out the same
+        # (inherited) handle again to processes forked after setup, which then
+        # share the file offset with this one
+        with h5py.File(self.filename, 'r') as hdf_file:
+
+            for (array_key, ds_name) in self.datasets.items():
 
-        for (array_key, ds_name) in self.datasets.items():
+                if ds_name not in hdf_file:
+                    raise RuntimeError("%s not in %s"%(ds_name, self.filename))
 
-            if ds_name not in hdf_file:
-                raise RuntimeError("%s not in %s"%(ds_name, self.filename))
+                spec = self.__read_spec(array_key, hdf_file, ds_name)
 
-            spec = self.__read_spec(array_key, hdf_file, ds_name)
+                self.provides(array_key, spec)
 
-            self.provides(array_key, spec)
+                dataset = hdf_file[ds_name]
+                if dataset.chunks is not None:
+                    self.block_shapes[ds_name] = dataset.chunks
+                else:
+                    self.block_shapes[ds_name] = tuple(
+                        min(64, s) for s in dataset.shape)
 
-        hdf_file.close()
+    def teardown(self):
+
+        if self.__hdf_file is not None and self.__hdf_file_pid == os.getpid():
+            self.__hdf_file.close()
+        self.__hdf_file = None
+        self.__hdf_file_pid = None
 
     def provide(self, request):
 
@@ -79,28 +145,32 @@ class Hdf5Source(BatchProvider):
 
         batch = Batch()
 
-        with h5py.File(self.filename, 'r') as hdf_file:
+        hdf_file = self.__get_file()
 
-            for (array_key, request_spec) in request.array_specs.items():
+        for (array_key, request_spec) in request.array_specs.items():
 
-                logger.debug("Reading %s in %s...", array_key, request_spec.roi)
+            logger.debug("Reading %s in %s...", array_key, request_spec.roi)
 
-                voxel_size = self.spec[array_key].voxel_size
+            voxel_size = self.spec[array_key].voxel_size
 
-                # scale request roi to voxel units
-                dataset_roi = request_spec.roi/voxel_size
+            # scale request roi to voxel units
+            dataset_roi = request_spec.roi/voxel_size
 
-                # shift request roi into dataset
-                dataset_roi = dataset_roi - self.spec[array_key].roi.get_offset()/voxel_size
+            # shift request roi into dataset
+            dataset_roi = dataset_roi - self.spec[array_key].roi.get_offset()/voxel_size
 
-                # create array spec
-                array_spec = self.spec[array_key].copy()
-                array_spec.roi = request_spec.roi
+            # create array spec
+            array_spec = self.spec[array_key].copy()
+            array_spec.roi = request_spec.roi
 
-                # add array to batch
-                batch.arrays[array_key] = Array(
-                    self.__read(hdf_file, self.datasets[array_key], dataset_roi),
-                    array_spec)
+            # add array to batch
+            batch.arrays[array_key] = Array(
+                self.__read(
+                    hdf_file,
+                    self.datasets[array_key],
+                    dataset_roi,
+                    batch.profiling_stats),
+                array_spec)
 
         logger.debug("done")
 
@@ -109,6 +179,34 @@ class Hdf5Source(BatchProvider):
 
         return batch
 
+    def __get_file(self):
+        '''Get the handle of the HDF5 file for the calling process, open it if
+        needed.'''
+
+        pid = os.getpid()
+
+        if self.__hdf_file is None or self.__hdf_file_pid != pid:
+
+            if self.__hdf_file is not None:
+                # a handle inherited through a fork: HDF5 would hand out its
+                # state (shared with the parent, e.g., the file offset) again
+                # for the new handle, close the copy of this process first
+                # (the parent's handle stays open)
+                self.__hdf_file.close()
+                self.__hdf_file = None
+
+            kwargs = {}
+            if self.rdcc_nbytes is not None:
+                kwargs['rdcc_nbytes'] = self.rdcc_nbytes
+            if self.rdcc_nslots is not None:
+                kwargs['rdcc_nslots'] = self.rdcc_nslots
+
+            logger.debug("opening %s in process %d", self.filename, pid)
+            self.__hdf_file = h5py.File(self.filename, 'r', **kwargs)
+            self.__hdf_file_pid = pid
+
+        return self.__hdf_file
+
     def __read_spec(self, array_key, hdf_file, ds_name):
 
         dataset = hdf_file[ds_name]
@@ -170,8 +268,36 @@ class Hdf5Source(BatchProvider):
 
         return spec
 
-    def __read(self, hdf_file, ds_name, roi):
-        return np.array(hdf_file[ds_name][roi.get_bounding_box()])
+    def __read(self, hdf_file, ds_name, roi, profiling_stats):
+
+        dataset = hdf_file[ds_name]
+        shape = roi.get_shape()
+
+        if self.buffer_pool is not None:
+            data = self.buffer_pool.get(shape, dataset.dtype)
+        else:
+            data = np.empty(shape, dtype=dataset.dtype)
+
+        if self.block_cache is None:
+
+            # read directly into the target array, without intermediate copy
+            if data.size > 0:
+                dataset.read_direct(data, source_sel=roi.get_bounding_box())
+
+            return data
+
+        _, hits, misses = self.block_cache.read(
+            dataset,
+            (self.filename, ds_name),
+            self.block_shapes[ds_name],
+            roi.get_begin(),
+            roi.get_end(),
+            out=data)
+
+        profiling_stats.add_to_counter(type(self).__name__, 'cache hits', hits)
+        profiling_stats.add_to_counter(type(self).__name__, 'cache misses', misses)
+
+        return data
 
     def __repr__(self):
 
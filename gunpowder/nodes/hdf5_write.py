@@ -1,9 +1,14 @@
+import itertools
 import logging
+import numpy as np
 import os
 
 from .batch_filter import BatchFilter
+from gunpowder.background_writer import BackgroundWriter
 from gunpowder.batch_request import BatchRequest
 from gunpowder.ext import h5py
+from gunpowder.profiling import Timing
+from gunpowder.shared_memory_pool import SharedMemoryPool
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +45,33 @@ class Hdf5Write(BatchFilter):
             A dictionary from array keys to datatype (eg. ``np.int8``). If
             given, arrays are stored using this type. The original arrays
             within the pipeline remain unchanged.
+
+        chunk_shape (``tuple`` of ``int``, optional):
+
+            The shape of the HDF5 storage chunks in voxels, for the spatial
+            dimensions. If given, passing arrays are collected in a buffer
+            until they cover whole chunks, which are then written with a
+            single write each. This avoids that chunks which are partially
+            covered by several batches (e.g., if the :class:`Scan` reference
+            shape is not a multiple of the chunk shape) are read, decompressed,
+            updated, and compressed again for each of them. Chunks that are
+            still incomplete when the pipeline is torn down are written then.
+            If not given, HDF5 chooses the chunk shape and arrays are written
+            as they pass.
+
+        asynchronous (``bool``):
+
+            If set, the arrays of passing batches are queued and written by a
+            separate process, such that compression and disk I/O overlap with
+            the production of the next batch. :func:`process` blocks only
+            while the queue is full. The HDF5 file is complete after the
+            pipeline was torn down. The queue depth and the bytes written are
+            reported in the profiling statistics, the writes themselves as
+            timings of method ``write``.
+
+        queue_size (``int``):
+
+            How many batches to queue at most in asynchronous mode.
         '''
 
     def __init__(
@@ -48,7 +80,10 @@ class Hdf5Write(BatchFilter):
             output_dir='.',
             output_filename='output.hdf',
             compression_type=None,
-            dataset_dtypes=None):
+            dataset_dtypes=None,
+            chunk_shape=None,
+            asynchronous=False,
+            queue_size=4):
 
         self.dataset_names = dataset_names
         self.output_dir = output_dir
@@ -58,7 +93,25 @@ class Hdf5Write(BatchFilter):
             self.dataset_dtypes = {}
         else:
             self.dataset_dtypes = dataset_dtypes
+        self.chunk_shape = chunk_shape
+        self.asynchronous = asynchronous
+        self.queue_size = queue_size
         self.file = None
+        self.write_buffers = {}
+        self.writer = None
+        self.dataset_layouts = None
+        self.bytes_written = 0
+        self.write_seconds = 0
+
+    def teardown(self):
+
+        if self.writer is not None:
+            logger.info("Waiting for pending writes...")
+            self.writer.stop()
+        elif self.chunk_shape is not None:
+            self.close()
+        self.writer = None
+        self.dataset_layouts = None
 
     def create_output_file(self, batch):
 
@@ -69,6 +122,43 @@ class Hdf5Write(BatchFilter):
 
         self.file = h5py.File(os.path.join(self.output_dir, self.output_filename), 'w')
         self.datasets = {}
+        self.write_buffers = {}
+
+        for array_key, layout in self.dataset_layouts.items():
+
+            dataset_name, data_shape, dtype, offset, voxel_size = layout
+
+            if self.chunk_shape is not None:
+                dims = len(self.chunk_shape)
+                chunks = tuple(
+                    min(c, s)
+                    for c, s in zip(
+                        data_shape[:-dims] + tuple(self.chunk_shape),
+                        data_shape))
+            else:
+                chunks = None
+
+            dataset = self.file.create_dataset(
+                    name=dataset_name,
+                    shape=data_shape,
+                    chunks=chunks,
+                    compression=self.compression_type,
+                    dtype=dtype)
+
+            dataset.attrs['offset'] = offset
+            dataset.attrs['resolution'] = voxel_size
+
+            self.datasets[array_key] = dataset
+            if chunks is not None:
+                self.write_buffers[array_key] = _WriteCombiningBuffer(
+                    dataset,
+                    chunks)
+
+    def get_dataset_layouts(self, batch):
+        '''Get the name, shape, dtype, offset, and voxel size of the dataset
+        for each array to store, given the first batch.'''
+
+        layouts = {}
 
         for (array_key, dataset_name) in self.dataset_names.items():
 
@@ -96,19 +186,40 @@ class Hdf5Write(BatchFilter):
             else:
                 dtype = batch.arrays[array_key].data.dtype
 
-            dataset = self.file.create_dataset(
-                    name=dataset_name,
-                    shape=data_shape,
-                    compression=self.compression_type,
-                    dtype=dtype)
-
-            dataset.attrs['offset'] = total_roi.get_offset()
-            dataset.attrs['resolution'] = self.spec[array_key].voxel_size
+            layouts[array_key] = (
+                dataset_name,
+                data_shape,
+                dtype,
+                total_roi.get_offset(),
+                self.spec[array_key].voxel_size)
 
-            self.datasets[array_key] = dataset
+        return layouts
 
     def process(self, batch, request):
 
+        if self.dataset_layouts is None:
+            self.dataset_layouts = self.get_dataset_layouts(batch)
+            if self.asynchronous:
+                self.__start_writer(batch)
+
+        if not self.asynchronous:
+            self.write(batch)
+            return
+
+        timing = Timing(self, 'enqueue')
+        timing.start()
+
+        self.writer.put(batch, keys=list(self.dataset_names.keys()))
+
+        timing.stop()
+        batch.profiling_stats.add(timing)
+
+        self.__report(batch)
+
+    def write(self, batch, args=None):
+        '''Write the arrays of ``batch`` into the HDF5 file, create it if
+        needed.'''
+
         if self.file is None:
             logger.info("Creating HDF file...")
             self.create_output_file(batch)
@@ -128,5 +239,135 @@ class Hdf5Write(BatchFilter):
             channel_slices = (slice(None),)*max(0, len(dataset.shape) - dims)
             voxel_slices = data_roi.get_bounding_box()
 
-            dataset[channel_slices + voxel_slices] = batch.arrays[array_key].data
+            if array_key in self.write_buffers:
+                num_channel_dims = len(channel_slices)
+                self.write_buffers[array_key].write(
+                    (0,)*num_channel_dims + tuple(data_roi.get_begin()),
+                    data)
+            else:
+                dataset[channel_slices + voxel_slices] = data
+
+    def close(self):
+        '''Write incomplete chunks and close the HDF5 file.'''
+
+        if self.file is None:
+            return
+
+        for write_buffer in self.write_buffers.values():
+            write_buffer.flush()
+
+        self.file.close()
+        self.file = None
+
+    def __start_writer(self, batch):
+
+        # leave some headroom for batches of slightly varying sizes
+        batch_size = sum(
+            batch.arrays[array_key].data.nbytes
+            for array_key in self.dataset_names)
+        slab_size = (
+            int(batch_size*1.1) +
+            len(self.dataset_names)*SharedMemoryPool.alignment)
+
+        self.writer = BackgroundWriter(
+            self,
+            self.write,
+            close=self.close,
+            queue_size=self.queue_size,
+            slab_size=slab_size)
+        self.writer.start()
+
+        self.bytes_written = 0
+        self.write_seconds = 0
+
+    def __report(self, batch):
+
+        node_name = type(self).__name__
+        stats = batch.profiling_stats
+
+        for timing, num_bytes in self.writer.get_reports():
+            stats.add(timing)
+            stats.add_to_counter(node_name, 'bytes written', num_bytes)
+            self.bytes_written += num_bytes
+            self.write_seconds += timing.elapsed()
+
+        configuration = {
+            'queue size': self.queue_size,
+            'queue depth': self.writer.get_queue_depth()
+        }
+        if self.write_seconds > 0:
+            configuration['writer MB/s'] = '%.1f'%(
+                self.bytes_written/self.write_seconds/1024**2)
+        stats.set_configuration(node_name, configuration)
+
+
+class _WriteCombiningBuffer(object):
+    '''Collects the blocks written to a chunked dataset until they cover whole
+    chunks, which are then written at once.'''
+
+    def __init__(self, dataset, chunks):
+
+        self.dataset = dataset
+        self.chunks = np.array(chunks)
+        self.shape = np.array(dataset.shape)
+
+        # chunk index -> (data, mask of voxels written)
+        self.pending = {}
+
+    def write(self, begin, data):
+
+        begin = np.array(begin)
+        end = begin + data.shape
+
+        first = begin//self.chunks
+        last = (end - 1)//self.chunks
+
+        for index in itertools.product(*[
+                range(f, l + 1)
+                for f, l in zip(first, last)]):
+
+            chunk_begin = np.array(index)*self.chunks
+            chunk_end = np.minimum(chunk_begin + self.chunks, self.shape)
+
+            lo = np.maximum(begin, chunk_begin)
+            hi = np.minimum(end, chunk_end)
+            source = data[_slices(lo - begin, hi - begin)]
+
+            # covers the whole chunk, no need to buffer
+            if np.all(lo == chunk_begin) and np.all(hi == chunk_end):
+                self.pending.pop(index, None)
+                self.dataset[_slices(chunk_begin, chunk_end)] = source
+                continue
+
+            if index not in self.pending:
+                self.pending[index] = (
+                    np.zeros(chunk_end - chunk_begin, dtype=self.dataset.dtype),
+                    np.zeros(chunk_end - chunk_begin, dtype=np.bool))
+            buffer, written = self.pending[index]
+
+            target = _slices(lo - chunk_begin, hi - chunk_begin)
+            buffer[target] = source
+            written[target] = True
+
+            if written.all():
+                del self.pending[index]
+                self.dataset[_slices(chunk_begin, chunk_end)] = buffer
+
+    def flush(self):
+        '''Write all incomplete chunks.'''
+
+        for index, (buffer, written) in self.pending.items():
+
+            chunk_begin = np.array(index)*self.chunks
+            chunk_end = np.minimum(chunk_begin + self.chunks, self.shape)
+            slices = _slices(chunk_begin, chunk_end)
+
+            # keep what is stored already in the parts not written
+            data = self.dataset[slices]
+            data[written] = buffer[written]
+            self.dataset[slices] = data
+
+        self.pending = {}
 
+def _slices(begin, end):
+    return tuple(slice(b, e) for b, e in zip(begin, end))
@@ -39,6 +39,7 @@ class IntensityAugment(BatchFilter):
     def process(self, batch, request):
 
         raw = batch.arrays[self.array]
+        raw.make_writeable()
 
         assert not self.z_section_wise or raw.spec.roi.dims() == 3, "If you specify 'z_section_wise', I expect 3D data."
         assert raw.data.dtype == np.float32 or raw.data.dtype == np.float64, "Intensity augmentation requires float types for the raw array (not " + str(raw.data.dtype) + "). Consider using Normalize before."
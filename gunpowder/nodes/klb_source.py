@@ -1,19 +1,25 @@
 import copy
+import json
 import logging
 import numpy as np
 import glob
+import os
 
 from gunpowder.batch import Batch
 from gunpowder.coordinate import Coordinate
 from gunpowder.ext import pyklb
 from gunpowder.profiling import Timing
 from gunpowder.roi import Roi
+from gunpowder.thread_pool import ProcessThreadPool
 from gunpowder.array import Array
 from gunpowder.array_spec import ArraySpec
 from .batch_provider import BatchProvider
 
 logger = logging.getLogger(__name__)
 
+# the header fields used by KlbSource, these are stored in the header cache
+_header_fields = ['imagesize_tczyx', 'pixelspacing_tczyx', 'datatype']
+
 class KlbSource(BatchProvider):
     '''A KLB data source.
 
@@ -40,32 +46,57 @@ class KlbSource(BatchProvider):
             automatically determined from the KLB file. This is useful to set
             ``voxel_size``, for example. Only fields that are not ``None`` in
             the given :class:`ArraySpec` will be used.
+
+        num_threads (``int``):
+
+            How many files to read in parallel, if ``filename`` is a glob
+            expression. The files of a request are read directly into the
+            output array. Each process (e.g., a worker of :class:`PreCache`)
+            starts its own threads on its first request.
+
+        header_cache (``bool``):
+
+            If set, the headers of the KLB files are cached in a file
+            ``.klb_headers.json`` next to the (first) KLB file, such that
+            later setups only read the headers of new or modified files (as
+            determined by their modification time and size). If the cache
+            cannot be written, a warning is shown and the headers are read
+            again the next time.
     '''
 
     def __init__(
             self,
             filename,
             array,
-            array_spec=None):
+            array_spec=None,
+            num_threads=4,
+            header_cache=True):
 
         self.filename = filename
         self.array = array
         self.array_spec = array_spec
+        self.num_threads = num_threads
+        self.header_cache = header_cache
 
         self.files = None
         self.ndims = None
 
+        self.__pool = ProcessThreadPool(self.num_threads)
+
     def setup(self):
 
         self.files = glob.glob(self.filename)
         self.files.sort()
 
-        logger.info("Reading KLB headers of %d files...", len(self.files))
-        headers = [ pyklb.readheader(f) for f in self.files ]
+        headers = self.__read_headers()
         spec = self.__read_spec(headers)
 
         self.provides(self.array, spec)
 
+    def teardown(self):
+
+        self.__pool.close()
+
     def provide(self, request):
 
         timing = Timing(self)
@@ -101,6 +132,96 @@ class KlbSource(BatchProvider):
 
         return batch
 
+    def __read_headers(self):
+
+        if len(self.files) == 0:
+            raise RuntimeError("No KLB files match %s"%self.filename)
+
+        if self.header_cache:
+            cache_file = os.path.join(
+                os.path.dirname(self.files[0]),
+                '.klb_headers.json')
+            cache = self.__load_header_cache(cache_file)
+        else:
+            cache = {}
+
+        headers = {}
+        missing = []
+        for f in self.files:
+
+            stat = os.stat(f)
+            path = os.path.abspath(f)
+            entry = cache.get(path)
+
+            if (
+                    entry is not None and
+                    entry['mtime'] == stat.st_mtime and
+                    entry['size'] == stat.st_size):
+                headers[f] = {
+                    'imagesize_tczyx': np.array(entry['imagesize_tczyx']),
+                    'pixelspacing_tczyx': np.array(entry['pixelspacing_tczyx']),
+                    'datatype': np.dtype(str(entry['datatype']))
+                }
+            else:
+                missing.append(f)
+
+        if missing:
+
+            logger.info(
+                "Reading KLB headers of %d files (%d cached)...",
+                len(missing), len(self.files) - len(missing))
+
+            pool = self.__pool.get()
+            if pool is not None and len(missing) > 1:
+                read = pool.map(pyklb.readheader, missing)
+            else:
+                read = [pyklb.readheader(f) for f in missing]
+
+            for f, header in zip(missing, read):
+                headers[f] = header
+
+            if self.header_cache:
+
+                for f in missing:
+                    stat = os.stat(f)
+                    cache[os.path.abspath(f)] = {
+                        'mtime': stat.st_mtime,
+                        'size': stat.st_size,
+                        'imagesize_tczyx': [
+                            int(s) for s in headers[f]['imagesize_tczyx']],
+                        'pixelspacing_tczyx': [
+                            float(s) for s in headers[f]['pixelspacing_tczyx']],
+                        'datatype': np.dtype(headers[f]['datatype']).name
+                    }
+
+                self.__store_header_cache(cache_file, cache)
+
+        return [headers[f] for f in self.files]
+
+    def __load_header_cache(self, cache_file):
+
+        if not os.path.exists(cache_file):
+            return {}
+
+        try:
+            with open(cache_file, 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError) as e:
+            logger.warning("Ignoring KLB header cache %s: %s", cache_file, e)
+            return {}
+
+    def __store_header_cache(self, cache_file, cache):
+
+        # write to a temporary file first, such that concurrent setups never
+        # see a partially written cache
+        tmp_file = '%s.%d.tmp'%(cache_file, os.getpid())
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(cache, f)
+            os.rename(tmp_file, cache_file)
+        except (IOError, OSError) as e:
+            logger.warning("Could not write KLB header cache %s: %s", cache_file, e)
+
     def __read_spec(self, headers):
 
         num_files = len(headers)
@@ -169,30 +290,42 @@ class KlbSource(BatchProvider):
 
     def __read(self, roi):
 
+        data = np.empty(roi.get_shape(), dtype=self.spec[self.array].dtype)
+
         if len(self.files) == 1:
 
-            return self.__read_file(self.files[0], roi)
+            self.__read_file(self.files[0], roi, data)
 
         else:
 
-            file_indices = range(
-                roi.get_begin()[0],
-                roi.get_end()[0])
-
             file_roi = Roi(
                 roi.get_begin()[1:],
                 roi.get_shape()[1:])
 
-            return np.array([
-                    self.__read_file(self.files[i], file_roi)
-                    for i in file_indices
-                ])
+            # read each file directly into its section of the output array
+            def read_file(i):
+                self.__read_file(
+                    self.files[roi.get_begin()[0] + i],
+                    file_roi,
+                    data[i])
+
+            indices = range(roi.get_shape()[0])
+
+            pool = self.__pool.get()
+            if pool is not None and len(indices) > 1:
+                pool.map(read_file, indices)
+            else:
+                for i in indices:
+                    read_file(i)
+
+        return data
 
-    def __read_file(self, filename, roi):
+    def __read_file(self, filename, roi, out):
 
         # pyklb reads max-inclusive, gunpowder rois are max exclusive ->
         # subtract (1, 1, ...) from max coordinate
-        return pyklb.readroi(
+        pyklb.readroi_inplace(
+            out,
             filename,
             roi.get_begin(),
             roi.get_end() - (1,)*roi.dims())
@@ -0,0 +1,151 @@
+import logging
+import numpy as np
+
+from .batch_filter import BatchFilter
+from gunpowder.batch import Batch
+from gunpowder.batch_request import BatchRequest
+from gunpowder.profiling import Timing
+
+logger = logging.getLogger(__name__)
+
+class Materialize(BatchFilter):
+    '''Keep small volumes in memory.
+
+    During setup, this node requests the whole provided ROI of each array
+    once from upstream and keeps the result in memory. Afterwards, requests
+    for these arrays are served from memory without asking upstream, as views
+    on the kept volumes (no data is copied). Worker processes forked later
+    (e.g., by :class:`PreCache`) share the kept volumes with the main
+    process.
+
+    The views are read-only. Nodes that modify arrays in-place copy them first
+    (see :func:`Array.make_writeable`).
+
+    Arrays that do not fit into the memory budget, or have an unbounded ROI,
+    are passed through as usual.
+
+    Args:
+
+        keys (``list`` of :class:`ArrayKey`, optional):
+
+            The arrays to keep in memory. If not given, all arrays provided
+            upstream are considered.
+
+        max_bytes (``int``, optional):
+
+            The memory budget for all kept arrays in bytes. Arrays are
+            considered in the order given and skipped if they do not fit in
+            the remaining budget. Defaults to 1GB. Set to ``None`` to keep
+            arrays regardless of their size.
+    '''
+
+    def __init__(self, keys=None, max_bytes=1024**3):
+
+        self.keys = keys
+        self.max_bytes = max_bytes
+        self.arrays = {}
+
+    def setup(self):
+
+        if self.keys is None:
+            keys = list(self.spec.array_specs.keys())
+        else:
+            keys = self.keys
+
+        self.arrays = {}
+        budget = self.max_bytes
+
+        request = BatchRequest()
+        for key in keys:
+
+            spec = self.spec[key]
+
+            if spec.roi is None:
+                logger.info("%s has an unbounded ROI, passing it through", key)
+                continue
+
+            if spec.dtype is not None:
+                num_bytes = self.__num_bytes(
+                    spec.roi.get_shape()//spec.voxel_size,
+                    spec.dtype)
+                if budget is not None and num_bytes > budget:
+                    logger.info(
+                        "%s (%d bytes) exceeds the memory budget, passing it "
+                        "through", key, num_bytes)
+                    continue
+                if budget is not None:
+                    budget -= num_bytes
+
+            request[key] = spec.copy()
+
+        if len(request) == 0:
+            return
+
+        logger.info("Materializing %s...", list(request.array_specs.keys()))
+
+        batch = self.get_upstream_provider().request_batch(request)
+
+        budget = self.max_bytes
+        for key in keys:
+
+            if key not in request:
+                continue
+
+            array = batch.arrays[key]
+
+            # the dtype might not have been known, or there are channel
+            # dimensions
+            if budget is not None and array.data.nbytes > budget:
+                logger.info(
+                    "%s (%d bytes) exceeds the memory budget, passing it "
+                    "through", key, array.data.nbytes)
+                continue
+            if budget is not None:
+                budget -= array.data.nbytes
+
+            # detach from buffers that might be shared with upstream
+            if not array.data.flags.owndata:
+                array.data = np.array(array.data)
+            array.data.flags.writeable = False
+
+            self.arrays[key] = array
+
+    def teardown(self):
+
+        self.arrays = {}
+
+    def provide(self, request):
+
+        if not all(key in self.arrays for key, _ in request.items()):
+            return super(Materialize, self).provide(request)
+
+        # everything is in memory, don't bother upstream
+        timing = Timing(self)
+        timing.start()
+
+        batch = Batch()
+        self.process(batch, request)
+
+        timing.stop()
+        batch.profiling_stats.add(timing)
+
+        return batch
+
+    def prepare(self, request):
+
+        for key in self.arrays:
+            if key in request:
+                del request[key]
+
+    def process(self, batch, request):
+
+        for key, array in self.arrays.items():
+            if key in request:
+                batch.arrays[key] = array.crop(request[key].roi, copy=False)
+
+    def __num_bytes(self, shape, dtype):
+
+        num_bytes = np.dtype(dtype).itemsize
+        for s in shape:
+            num_bytes *= s
+        return num_bytes
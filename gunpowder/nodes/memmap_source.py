@@ -0,0 +1,298 @@
+import json
+import logging
+import numpy as np
+import os
+
+from gunpowder.batch import Batch
+from gunpowder.coordinate import Coordinate
+from gunpowder.ext import h5py
+from gunpowder.profiling import Timing
+from gunpowder.roi import Roi
+from gunpowder.array import Array
+from gunpowder.array_spec import ArraySpec
+from .batch_provider import BatchProvider
+
+logger = logging.getLogger(__name__)
+
+class MemmapSource(BatchProvider):
+    '''A source for uncompressed arrays stored as ``.npy`` or raw files, which
+    are memory-mapped instead of read.
+
+    Provided arrays are views into the memory-mapped files, no data is copied
+    or decompressed. Each batch gets its own copy-on-write mapping: if a
+    downstream node modifies an array in-place, the affected pages are copied
+    by the operating system. Neither the files nor other batches see the
+    change.
+
+    Each file can have a sidecar JSON file with the same name and the
+    extension ``.json`` (e.g., ``raw.json`` for ``raw.npy``), following the
+    conventions of :class:`Hdf5Source`: If ``resolution`` is set, it will be
+    used as the array's ``voxel_size``. If ``offset`` is set, it will be used
+    as the offset of the :class:`Roi` for this array (in world units). Raw
+    files (without the ``.npy`` header) need ``shape`` and ``dtype`` entries
+    in their sidecar file. Use :func:`hdf5_to_memmap` to create such files
+    from HDF5 datasets.
+
+    Args:
+
+        filename (``string``):
+
+            The directory containing the files.
+
+        datasets (``dict``, :class:`ArrayKey` -> ``string``):
+
+            Dictionary of array keys to file names (relative to ``filename``)
+            that this source offers.
+
+        array_specs (``dict``, :class:`ArrayKey` -> :class:`ArraySpec`, optional):
+
+            An optional dictionary of array keys to array specs to overwrite
+            the array specs automatically determined from the files. Only
+            fields that are not ``None`` in the given :class:`ArraySpec` will
+            be used.
+    '''
+
+    def __init__(
+            self,
+            filename,
+            datasets,
+            array_specs=None):
+
+        self.filename = filename
+        self.datasets = datasets
+
+        if array_specs is None:
+            self.array_specs = {}
+        else:
+            self.array_specs = array_specs
+
+        self.ndims = None
+        self.layouts = {}
+
+    def setup(self):
+
+        for (array_key, ds_name) in self.datasets.items():
+
+            path = os.path.join(self.filename, ds_name)
+            if not os.path.exists(path):
+                raise RuntimeError("%s not in %s"%(ds_name, self.filename))
+
+            meta = _read_sidecar(path)
+
+            if path.endswith('.npy'):
+                with open(path, 'rb') as f:
+                    version = np.lib.format.read_magic(f)
+                    shape, fortran_order, dtype = \
+                        _read_array_header(f, version)
+                    offset = f.tell()
+                order = 'F' if fortran_order else 'C'
+            else:
+                assert 'shape' in meta and 'dtype' in meta, (
+                    "Raw file %s needs 'shape' and 'dtype' in its sidecar "
+                    "file %s"%(path, _sidecar_path(path)))
+                shape = tuple(meta['shape'])
+                dtype = np.dtype(str(meta['dtype']))
+                offset = 0
+                order = meta.get('order', 'C')
+
+            self.layouts[array_key] = (path, shape, dtype, offset, order)
+
+            self.provides(
+                array_key,
+                self.__read_spec(array_key, shape, dtype, meta, ds_name))
+
+    def provide(self, request):
+
+        timing = Timing(self)
+        timing.start()
+
+        batch = Batch()
+
+        for (array_key, request_spec) in request.array_specs.items():
+
+            logger.debug("Reading %s in %s...", array_key, request_spec.roi)
+
+            voxel_size = self.spec[array_key].voxel_size
+
+            # scale request roi to voxel units
+            dataset_roi = request_spec.roi/voxel_size
+
+            # shift request roi into dataset
+            dataset_roi = dataset_roi - self.spec[array_key].roi.get_offset()/voxel_size
+
+            # create array spec
+            array_spec = self.spec[array_key].copy()
+            array_spec.roi = request_spec.roi
+
+            # add a view on the memory-mapped file to the batch
+            batch.arrays[array_key] = Array(
+                self.__map(array_key)[dataset_roi.get_bounding_box()],
+                array_spec)
+
+        logger.debug("done")
+
+        timing.stop()
+        batch.profiling_stats.add(timing)
+
+        return batch
+
+    def __map(self, array_key):
+        '''Create a new copy-on-write mapping of the file for ``array_key``.
+        Each batch gets its own mapping, such that in-place modifications are
+        private to the batch.'''
+
+        path, shape, dtype, offset, order = self.layouts[array_key]
+
+        return np.asarray(np.memmap(
+            path,
+            dtype=dtype,
+            mode='c',
+            offset=offset,
+            shape=shape,
+            order=order))
+
+    def __read_spec(self, array_key, shape, dtype, meta, ds_name):
+
+        dims = Coordinate(shape)
+
+        if self.ndims is None:
+            self.ndims = len(dims)
+        else:
+            assert self.ndims == len(dims)
+
+        if array_key in self.array_specs:
+            spec = self.array_specs[array_key].copy()
+        else:
+            spec = ArraySpec()
+
+        if spec.voxel_size is None:
+
+            if 'resolution' in meta:
+                spec.voxel_size = Coordinate(meta['resolution'])
+            else:
+                spec.voxel_size = Coordinate((1,)*self.ndims)
+                logger.warning("WARNING: %s does not contain resolution information "
+                               "for %s (file %s), voxel size has been set to %s. This "
+                               "might not be what you want.",
+                               self.filename, array_key, ds_name, spec.voxel_size)
+
+        if spec.roi is None:
+
+            if 'offset' in meta:
+                offset = Coordinate(meta['offset'])
+            else:
+                offset = Coordinate((0,)*self.ndims)
+
+            spec.roi = Roi(offset, dims*spec.voxel_size)
+
+        if spec.dtype is not None:
+            assert spec.dtype == dtype, ("dtype %s provided in array_specs for %s, "
+                                         "but differs from file %s dtype %s"%
+                                         (self.array_specs[array_key].dtype,
+                                          array_key, ds_name, dtype))
+        else:
+            spec.dtype = dtype
+
+        if spec.interpolatable is None:
+
+            spec.interpolatable = spec.dtype in [
+                np.float,
+                np.float32,
+                np.float64,
+                np.float128,
+                np.uint8 # assuming this is not used for labels
+            ]
+            logger.warning("WARNING: You didn't set 'interpolatable' for %s "
+                           "(file %s). Based on the dtype %s, it has been "
+                           "set to %s. This might not be what you want.",
+                           array_key, ds_name, spec.dtype,
+                           spec.interpolatable)
+
+        return spec
+
+    def __repr__(self):
+
+        return self.filename
+
+def hdf5_to_memmap(hdf5_filename, datasets, output_dir, block_size=64):
+    '''Convert HDF5 datasets into ``.npy`` files for :class:`MemmapSource`.
+
+    For each dataset, a file ``<dataset>.npy`` and a sidecar file
+    ``<dataset>.json`` with the ``offset`` and ``resolution`` attributes of
+    the dataset (if present) are created in ``output_dir``. The data is copied
+    in slabs, such that datasets larger than the available memory can be
+    converted.
+
+    Args:
+
+        hdf5_filename (``string``):
+
+            The HDF5 file to read from.
+
+        datasets (``list`` of ``string``):
+
+            The names of the datasets to convert (e.g., ``volumes/raw``).
+
+        output_dir (``string``):
+
+            The directory to store the files in. Will be created, if it does
+            not exist.
+
+        block_size (``int``):
+
+            How many sections (along the first dimension) to copy at once.
+    '''
+
+    with h5py.File(hdf5_filename, 'r') as hdf_file:
+
+        for ds_name in datasets:
+
+            dataset = hdf_file[ds_name]
+            path = os.path.join(output_dir, ds_name.strip('/') + '.npy')
+
+            try:
+                os.makedirs(os.path.dirname(path))
+            except:
+                pass
+
+            logger.info(
+                "Converting %s:%s to %s...", hdf5_filename, ds_name, path)
+
+            memmap = np.lib.format.open_memmap(
+                path,
+                mode='w+',
+                dtype=dataset.dtype,
+                shape=dataset.shape)
+
+            for z in range(0, dataset.shape[0], block_size):
+                memmap[z:z + block_size] = dataset[z:z + block_size]
+
+            memmap.flush()
+            del memmap
+
+            meta = {}
+            for attr in ['offset', 'resolution']:
+                if attr in dataset.attrs:
+                    meta[attr] = [int(v) for v in dataset.attrs[attr]]
+
+            with open(_sidecar_path(path), 'w') as f:
+                json.dump(meta, f)
+
+def _read_array_header(f, version):
+
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(f)
+    return np.lib.format.read_array_header_2_0(f)
+
+def _sidecar_path(path):
+    return os.path.splitext(path)[0] + '.json'
+
+def _read_sidecar(path):
+
+    sidecar = _sidecar_path(path)
+
+    if not os.path.exists(sidecar):
+        return {}
+
+    with open(sidecar, 'r') as f:
+        return json.load(f)
@@ -1,10 +1,18 @@
+try:
+    import Queue
+except:
+    import queue as Queue
+import collections
 import copy
 import logging
+import math
 import multiprocessing
+import time
 
 from .batch_filter import BatchFilter
 from gunpowder.profiling import Timing
-from gunpowder.producer_pool import ProducerPool
+from gunpowder.producer_pool import ProducerPool, NoResult, WorkerRestarted
+from gunpowder.shared_memory_pool import SharedMemoryPool
 
 logger = logging.getLogger(__name__)
 
@@ -12,9 +20,19 @@ class WorkersDiedException(Exception):
     pass
 
 class PreCache(BatchFilter):
-    '''Pre-cache repeated equal batch requests. For the first of a series of
-    equal batch request, a set of workers is spawned to pre-cache the batches
-    in parallel processes. This way, subsequent requests can be served quickly.
+    '''Pre-cache repeated equal batch requests. For each distinct batch
+    request, a pool of workers pre-caches batches in parallel processes. This
+    way, subsequent equal requests can be served quickly.
+
+    The workers are started with the first request and kept running for the
+    lifetime of the pipeline. Each distinct request has its own cache. If
+    requests change (e.g., when alternating between training and validation
+    requests), the workers switch to the new request without being restarted,
+    and the caches of the ``max_cached_requests`` most recently used requests
+    are kept. Tasks of the most recently used request are always worked on
+    first. Batches that workers are producing when the request changes are
+    finished and added to their cache, workers skip queued tasks of dropped
+    caches.
 
     This node only makes sense if:
 
@@ -25,50 +43,474 @@ class PreCache(BatchFilter):
 
         cache_size (``int``):
 
-            How many batches to hold at most in the cache.
+            How many batches to hold at most in the cache of each request.
 
         num_workers (``int``):
 
-            How many processes to spawn to fill the cache.
+            How many processes (or threads) to spawn to fill the caches.
+
+        shared_memory (``bool``):
+
+            If set, the workers pass the array data of their batches through
+            shared memory instead of pickling them through a pipe. The very
+            first batch is produced in the calling process to determine the
+            size of the shared memory slabs. Batches that do not fit (or arrive
+            while all slabs are in use) are pickled as usual.
+
+        max_cached_requests (``int``):
+
+            How many distinct requests to keep caches for. If a new request
+            arrives and there are already that many caches, the cache of the
+            least recently used request is dropped.
+
+        executor (``string``):
+
+            How to run the workers, either ``'process'`` (default) or
+            ``'thread'``. Thread workers avoid forking and pickling and hand
+            batches over by reference, but only run in parallel while upstream
+            nodes release the GIL (e.g., in ``h5py`` reads or ``scipy.ndimage``
+            functions). Each thread works on its own shallow copy of the
+            upstream nodes, such that state stored between :func:`prepare` and
+            :func:`process` is not shared. ``shared_memory`` has no effect for
+            thread workers.
+
+        cpu_sets (list of lists of ``int``, optional):
+
+            CPUs to pin the workers to, see :class:`ProducerPool`.
+
+        num_threads (``int``, optional):
+
+            Limit the threads of native libraries (OpenMP, MKL, OpenBLAS) in
+            each worker process, see :class:`ProducerPool`. With many workers,
+            setting this to 1 avoids oversubscribing the CPUs.
+
+        max_restarts (``int``):
+
+            How often worker processes that died (e.g., because they ran out
+            of memory) are restarted in total, before giving up. Restarting a
+            worker does not affect the others.
+
+        min_workers (``int``, optional):
+
+            If given, the number of workers is adapted to the demand, between
+            ``min_workers`` and ``num_workers``. The node measures how long
+            downstream nodes take between two requests and how long the
+            workers take to produce a batch, and runs as many workers as
+            needed to keep up. Additional workers are started while the cache
+            of the current request is filled less than ``target_fill``, and
+            workers are retired one by one while it is filled more than that
+            and fewer workers would suffice. Starts with ``min_workers``.
+
+        target_fill (``float``):
+
+            The fraction of ``cache_size`` to keep filled when adapting the
+            number of workers.
     '''
 
-    def __init__(self, cache_size=50, num_workers=20):
+    def __init__(
+            self,
+            cache_size=50,
+            num_workers=20,
+            shared_memory=False,
+            max_cached_requests=2,
+            executor='process',
+            max_restarts=10,
+            min_workers=None,
+            target_fill=0.5,
+            cpu_sets=None,
+            num_threads=None):
 
-        self.current_request = None
         self.workers = None
         self.cache_size = cache_size
         self.num_workers = num_workers
+        self.shared_memory = shared_memory
+        self.shared_memory_pool = None
+        self.max_cached_requests = max_cached_requests
+        self.executor = executor
+        self.max_restarts = max_restarts
+        self.num_restarts = 0
+        self.min_workers = min_workers
+        self.target_fill = target_fill
+        self.cpu_sets = cpu_sets
+        self.num_threads = num_threads
+
+        # moving averages of the time spent downstream between two requests
+        # and upstream to produce a batch, for autoscaling
+        self.downstream_time = None
+        self.upstream_time = None
+        self.last_provide = None
+        self.last_scaling = 0
+        self.last_fill = 0
+
+        if shared_memory and executor == 'thread':
+            logger.warning(
+                "shared memory transport has no effect for thread workers")
+            self.shared_memory = False
+
+        # request caches, least recently used first
+        self.caches = []
+        self.next_cache_id = 1
+        self.tasks = None
+        self.active_cache_ids = None
+        self.upstream_copies = None
 
     def teardown(self):
 
+        if self.executor == 'thread' and self.tasks is not None:
+            # wake up threads waiting for a task, such that they can exit
+            self.tasks.put((None, None))
+
         if self.workers is not None:
             self.workers.stop()
 
+        self.workers = None
+        self.caches = []
+        self.shared_memory_pool = None
+        self.downstream_time = None
+        self.upstream_time = None
+        self.last_provide = None
+
     def provide(self, request):
 
         timing = Timing(self)
         timing.start()
 
-        if request != self.current_request:
+        if self.last_provide is not None:
+            self.downstream_time = self.__average(
+                self.downstream_time,
+                time.time() - self.last_provide)
+
+        previous = self.caches[-1] if self.caches else None
+        cache = self.__get_cache(request)
 
-            if self.workers is not None:
-                logger.info("new request received, stopping current workers...")
-                self.workers.stop()
+        if self.workers is None:
 
-            self.current_request = copy.deepcopy(request)
+            batch = None
+            if self.shared_memory:
+                batch = self.get_upstream_provider().request_batch(request)
+                self.__create_shared_memory_pool(batch)
 
-            logger.info("starting new set of workers...")
-            self.workers = ProducerPool([ lambda i=i: self.__run_worker(i) for i in range(self.num_workers) ], queue_size=self.cache_size)
-            self.workers.start()
+            self.__start_workers()
 
-        logger.debug("getting batch from queue...")
-        batch = self.workers.get()
+            if batch is not None:
+                self.__top_up(cache)
+                timing.stop()
+                batch.profiling_stats.add(timing)
+                self.last_provide = time.time()
+                return batch
+
+        if cache is not previous:
+            self.__prioritize(cache)
+        self.__top_up(cache)
+
+        logger.debug("getting batch from cache...")
+        while not cache.batches:
+            self.__receive()
+
+        batch, queued = cache.batches.popleft()
+        self.__top_up(cache)
+
+        # time the batch spent waiting in the queues
+        queued.stop()
+
+        if self.min_workers is not None:
+            # count batches that are done but not received yet
+            while self.__receive(block=False):
+                pass
+            self.__autoscale(cache)
+
+        if isinstance(batch, Exception):
+            raise batch
 
         timing.stop()
+        batch.profiling_stats.add(queued)
         batch.profiling_stats.add(timing)
+        batch.profiling_stats.set_configuration(
+            type(self).__name__,
+            self.workers.get_configuration())
+
+        self.last_provide = time.time()
 
         return batch
 
+    def __autoscale(self, cache):
+        '''Adapt the number of workers to the demand of downstream nodes.'''
+
+        if self.downstream_time is None or self.upstream_time is None:
+            return
+
+        # give the last change a chance to take effect
+        if time.time() - self.last_scaling < 2*self.upstream_time:
+            return
+
+        num_workers = self.workers.get_num_workers()
+
+        # workers needed to produce a batch in the time downstream nodes take
+        # to ask for the next one
+        needed = int(math.ceil(
+            self.upstream_time/max(self.downstream_time, 1e-6)))
+
+        fill = float(len(cache.batches))/self.cache_size
+        if fill < self.target_fill:
+            # one more worker than needed to fill the cache, more if the fill
+            # level did not improve since the last check
+            target = max(needed + 1, num_workers)
+            if fill <= self.last_fill:
+                target = max(target, num_workers + 1)
+        elif needed < num_workers:
+            target = num_workers - 1
+        else:
+            target = num_workers
+
+        self.last_fill = fill
+        self.last_scaling = time.time()
+
+        target = max(self.min_workers, min(target, self.num_workers))
+        if target == num_workers:
+            return
+
+        logger.info(
+            "cache filled %d%%, upstream takes %.3fs per batch, downstream "
+            "%.3fs per request: changing number of workers from %d to %d",
+            fill*100, self.upstream_time, self.downstream_time, num_workers,
+            target)
+
+        self.workers.set_num_workers(target)
+
+    def __average(self, average, value):
+
+        if average is None:
+            return value
+        return 0.9*average + 0.1*value
+
+    def __get_cache(self, request):
+        '''Find the cache for the given request, create a new one (evicting the
+        least recently used one) if there is none.'''
+
+        for i, cache in enumerate(self.caches):
+            if cache.request == request:
+                # mark as most recently used
+                self.caches.append(self.caches.pop(i))
+                return cache
+
+        if len(self.caches) >= self.max_cached_requests:
+            evicted = self.caches.pop(0)
+            logger.info(
+                "dropping cache of least recently used request %d",
+                evicted.id)
+
+        logger.info("new request received, creating cache %d", self.next_cache_id)
+
+        cache = _RequestCache(self.next_cache_id, request.copy())
+        self.next_cache_id += 1
+        self.caches.append(cache)
+
+        if self.active_cache_ids is not None:
+            self.__update_active_cache_ids()
+
+        return cache
+
+    def __prioritize(self, cache):
+        '''Submit tasks for the given cache before all tasks that are already
+        queued, and order the queued tasks by how recently their caches were
+        used.'''
+
+        queued = []
+        try:
+            while True:
+                queued.append(self.tasks.get_nowait())
+        except Queue.Empty:
+            pass
+
+        self.__top_up(cache)
+
+        # most recently used first, tasks of dropped caches are discarded, the
+        # teardown signal of thread workers stays last
+        recency = {
+            c.id: len(self.caches) - i
+            for i, c in enumerate(self.caches)
+        }
+        queued = [
+            task for task in queued
+            if task[0] is None or task[0] in recency
+        ]
+        queued.sort(key=lambda task: recency.get(task[0], len(recency) + 1))
+
+        for task in queued:
+            self.tasks.put(task)
+
+        logger.debug(
+            "prioritized cache %d, %d other tasks queued",
+            cache.id, len(queued))
+
+    def __top_up(self, cache):
+        '''Submit tasks for the given cache, until the cached and pending
+        batches fill the cache.'''
+
+        while len(cache.batches) + cache.pending < self.cache_size:
+            self.tasks.put((cache.id, cache.request))
+            cache.pending += 1
+
+    def __receive(self, block=True):
+        '''Get the next batch from the workers and sort it into its cache. If
+        not blocking, returns ``False`` if there is no batch available.'''
+
+        while True:
+            self.__check_restarts()
+            try:
+                if block:
+                    cache_id, batch, seconds, queued = self.workers.get()
+                else:
+                    cache_id, batch, seconds, queued = self.workers.get_nowait()
+                break
+            except WorkerRestarted:
+                pass
+            except NoResult:
+                return False
+
+        self.upstream_time = self.__average(self.upstream_time, seconds)
+
+        if self.shared_memory_pool is not None:
+            batch = self.shared_memory_pool.unpack(batch)
+
+        for cache in self.caches:
+            if cache.id == cache_id:
+                cache.pending = max(0, cache.pending - 1)
+                cache.batches.append((batch, queued))
+                return True
+
+        logger.debug("discarding batch for dropped cache %d", cache_id)
+
+        return True
+
+    def __check_restarts(self):
+        '''Resubmit tasks that got lost with restarted workers.'''
+
+        num_restarts = sum(self.workers.get_restarts())
+        lost = num_restarts - self.num_restarts
+        if lost == 0:
+            return
+
+        logger.warning(
+            "%d worker(s) got restarted, resubmitting their tasks", lost)
+        self.num_restarts = num_restarts
+
+        # we don't know which caches the lost tasks belonged to, resubmit for
+        # all of them (a cache might temporarily hold a few extra batches)
+        for cache in self.caches:
+            cache.pending = max(0, cache.pending - lost)
+            self.__top_up(cache)
+
+    def __start_workers(self):
+
+        if self.executor == 'process':
+
+            self.tasks = multiprocessing.Queue()
+            self.active_cache_ids = multiprocessing.RawArray(
+                'l',
+                self.max_cached_requests)
+
+            # workers use their own forked copy of the upstream nodes
+            self.upstream_copies = [
+                self.get_upstream_provider()
+            ]*self.num_workers
+
+        else:
+
+            self.tasks = Queue.Queue()
+            self.active_cache_ids = [0]*self.max_cached_requests
+
+            self.upstream_copies = [
+                self.__copy_provider(self.get_upstream_provider(), {})
+                for _ in range(self.num_workers)
+            ]
+
+        self.__update_active_cache_ids()
+
+        logger.info("starting workers...")
+        self.workers = ProducerPool(
+            [ lambda i=i: self.__run_worker(i) for i in range(self.num_workers) ],
+            queue_size=self.cache_size,
+            executor=self.executor,
+            max_restarts=self.max_restarts,
+            num_workers=self.min_workers,
+            cpu_sets=self.cpu_sets,
+            num_threads=self.num_threads)
+        self.num_restarts = 0
+        self.workers.start()
+
+    def __copy_provider(self, provider, memo):
+        '''Create a shallow copy of the given provider and all providers
+        upstream of it (sharing their specs and data, but not attributes set
+        later on).'''
+
+        if id(provider) in memo:
+            return memo[id(provider)]
+
+        provider_copy = copy.copy(provider)
+        provider_copy.upstream_providers = [
+            self.__copy_provider(upstream, memo)
+            for upstream in provider.get_upstream_providers()
+        ]
+        memo[id(provider)] = provider_copy
+
+        return provider_copy
+
+    def __update_active_cache_ids(self):
+
+        ids = [ cache.id for cache in self.caches ]
+        ids += [0]*(self.max_cached_requests - len(ids))
+        self.active_cache_ids[:] = ids
+
     def __run_worker(self, i):
 
-        return self.get_upstream_provider().request_batch(self.current_request)
+        while True:
+            cache_id, request = self.tasks.get()
+            if cache_id is None:
+                # teardown of thread workers, pass the signal on to the next
+                # thread
+                self.tasks.put((None, None))
+                return None
+            # skip tasks of dropped caches
+            if cache_id in self.active_cache_ids[:]:
+                break
+
+        start = time.time()
+        try:
+            batch = self.upstream_copies[i].request_batch(request)
+        except Exception as e:
+            logger.exception("worker %d failed to produce a batch", i)
+            batch = e
+        seconds = time.time() - start
+
+        # measures the time until the batch is handed out (stopped in the
+        # consumer, so the CPU time of this thread is meaningless)
+        queued = Timing(self, 'queue', cpu=False)
+        queued.start()
+
+        if self.shared_memory_pool is not None and not isinstance(batch, Exception):
+            batch = self.shared_memory_pool.pack(batch)
+
+        return cache_id, batch, seconds, queued
+
+    def __create_shared_memory_pool(self, batch):
+
+        # leave some headroom for batches of slightly varying sizes
+        batch_size = sum(a.data.nbytes for a in batch.arrays.values())
+        slab_size = int(batch_size*1.1) + len(batch.arrays)*SharedMemoryPool.alignment
+
+        # enough slabs for all caches, one result per blocked worker, and a
+        # few batches held by downstream nodes
+        num_slabs = (
+            self.cache_size*self.max_cached_requests +
+            self.num_workers + 2)
+
+        self.shared_memory_pool = SharedMemoryPool(num_slabs, slab_size)
+
+class _RequestCache(object):
+
+    def __init__(self, id, request):
+        self.id = id
+        self.request = request
+        self.batches = collections.deque()
+        self.pending = 0
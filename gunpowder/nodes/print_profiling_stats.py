@@ -71,10 +71,12 @@ class PrintProfilingStats(BatchFilter):
         stats += "MAX".ljust(10)
         stats += "MEAN".ljust(10)
         stats += "MEDIAN".ljust(10)
+        stats += "CPU MEAN".ljust(10)
         stats += "\n"
 
-        summaries = self.accumulated_stats.get_timing_summaries().items()
-        summaries.sort()
+        summaries = sorted(
+            self.accumulated_stats.get_timing_summaries().items(),
+            key=lambda item: (item[0][0], item[0][1] or ''))
 
         for (node_name, method_name), summary in summaries:
 
@@ -86,6 +88,10 @@ class PrintProfilingStats(BatchFilter):
                 stats += ("%.2f"%summary.max())[:9].ljust(10)
                 stats += ("%.2f"%summary.mean())[:9].ljust(10)
                 stats += ("%.2f"%summary.median())[:9].ljust(10)
+                if summary.cpu_mean() is not None:
+                    stats += ("%.2f"%summary.cpu_mean())[:9].ljust(10)
+                else:
+                    stats += "-".ljust(10)
                 stats += "\n"
 
         stats += "\n"
@@ -105,6 +111,38 @@ class PrintProfilingStats(BatchFilter):
 
         stats += "\n"
 
+        counters = sorted(self.accumulated_stats.get_counters().items())
+
+        if counters:
+
+            stats += "COUNTERS"
+            stats += "\n"
+
+            for (node_name, counter_name), value in counters:
+                stats += node_name[:19].ljust(20)
+                stats += counter_name[:19].ljust(20)
+                stats += str(value)
+                stats += "\n"
+
+            stats += "\n"
+
+        configurations = sorted(
+            self.accumulated_stats.get_configurations().items())
+
+        if configurations:
+
+            stats += "CONFIGURATION"
+            stats += "\n"
+
+            for node_name, configuration in configurations:
+                for key, value in sorted(configuration.items()):
+                    stats += node_name[:19].ljust(20)
+                    stats += key.ljust(20)
+                    stats += str(value)
+                    stats += "\n"
+
+            stats += "\n"
+
         logger.info(stats)
 
         # reset summaries
@@ -1,11 +1,17 @@
+import collections
+import glob
+import hashlib
+import itertools
+import json
 import logging
-from random import random, randint, choice
+import os
+from random import random, randint
 
 import numpy as np
-from skimage.transform import integral_image, integrate
+from gunpowder.array_spec import ArraySpec
 from gunpowder.batch_request import BatchRequest
 from gunpowder.coordinate import Coordinate
-from gunpowder.points_spec import PointsSpec
+from gunpowder.profiling import ProfilingStats, Timing
 from gunpowder.roi import Roi
 from .batch_filter import BatchFilter
 
@@ -21,11 +27,17 @@ class RandomLocation(BatchFilter):
     If ``min_masked`` and ``mask`` are set, only batches are returned that have
     at least the given ratio of masked-in voxels. This is in general faster
     than using the :class:`Reject` node, at the expense of storing an integral
-    array of the complete mask.
+    array of the complete mask. For each distinct request, the masked-in ratio
+    of all possible locations is computed once, and locations are drawn
+    directly from the acceptable ones (instead of drawing and rejecting
+    locations until one is acceptable, which is slow for sparse masks). Only
+    the number of acceptable locations per block of locations is kept in
+    memory.
 
     If ``ensure_nonempty`` is set to a :class:`PointsKey`, only batches are
     returned that have at least one point of this point collection within the
-    requested ROI.
+    requested ROI. The points are retrieved once during setup and indexed,
+    such that locations can be drawn without further upstream requests.
 
     Additional tests for randomly picked locations can be implemented by
     subclassing and overwriting of :func:`accepts`. This method takes the
@@ -33,6 +45,12 @@ class RandomLocation(BatchFilter):
     ``min_masked`` and ``ensure_nonempty``) and should return ``True`` if the
     request is acceptable.
 
+    Tests that need data at the randomly picked location (like the masked-in
+    ratio checked by :class:`Reject`) can be registered with
+    :func:`add_predicate`. For each location that meets all other criteria,
+    only the arrays needed by these tests are requested from upstream, and
+    the full request is only passed upstream once a location is accepted.
+
     Args:
 
         min_masked (``float``, optional):
@@ -54,9 +72,39 @@ class RandomLocation(BatchFilter):
             If ``ensure_nonempty`` is set, it defines the probability that a
             request for ``ensure_nonempty`` will contain at least one point.
             Default value is 1.0.
+
+        mask_block_shape (``tuple`` of ``int``, optional):
+
+            If given, the mask is requested in blocks of this shape (in
+            voxels) to compute its integral array, instead of all at once.
+            Only one block of the mask is held in memory at a time.
+
+        mask_integral_file (``string``, optional):
+
+            If given, the integral array of the mask is stored in this
+            ``.npy`` file and memory-mapped, instead of being held in memory.
+            Worker processes (e.g., of :class:`PreCache`) share the mapped
+            pages. The ROI and voxel size of the mask are stored next to it
+            (``<mask_integral_file>.json``), together with the sizes and
+            modification times of the files the mask is read from (the
+            ``filename`` of each source upstream that provides the mask). An
+            existing file is reused without requesting the mask again if all
+            of them match.
     '''
 
-    def __init__(self, min_masked=0, mask=None, ensure_nonempty=None, p_nonempty=1.0):
+    # the largest number of possible locations to count acceptable locations
+    # for up front (which tests all of them once), beyond that locations are
+    # drawn and tested against the mask one by one
+    max_acceptance_map_size = 2**28
+
+    def __init__(
+            self,
+            min_masked=0,
+            mask=None,
+            ensure_nonempty=None,
+            p_nonempty=1.0,
+            mask_block_shape=None,
+            mask_integral_file=None):
 
         self.min_masked = min_masked
         self.mask = mask
@@ -64,9 +112,16 @@ class RandomLocation(BatchFilter):
         self.mask_integral = None
         self.ensure_nonempty = ensure_nonempty
         self.points = None
+        self.point_locations = None
+        self.point_samplers = collections.OrderedDict()
+        self.predicates = []
+        self.probe_stats = ProfilingStats()
         self.p_nonempty = p_nonempty
+        self.mask_block_shape = mask_block_shape
+        self.mask_integral_file = mask_integral_file
         self.upstream_spec = None
         self.random_shift = None
+        self.acceptance_maps = collections.OrderedDict()
 
     def setup(self):
 
@@ -79,24 +134,9 @@ class RandomLocation(BatchFilter):
                 "Upstream provider does not have %s"%self.mask)
             self.mask_spec = self.upstream_spec.array_specs[self.mask]
 
-            logger.info("requesting complete mask...")
-
-            mask_request = BatchRequest({self.mask: self.mask_spec})
-            mask_batch = upstream.request_batch(mask_request)
-
-            logger.info("allocating mask integral array...")
-
-            mask_data = mask_batch.arrays[self.mask].data
-            mask_integral_dtype = np.uint64
-            logger.debug("mask size is %s", mask_data.size)
-            if mask_data.size < 2**32:
-                mask_integral_dtype = np.uint32
-            if mask_data.size < 2**16:
-                mask_integral_dtype = np.uint16
-            logger.debug("chose %s as integral array dtype", mask_integral_dtype)
+            self.mask_integral = self.__get_mask_integral(upstream)
 
-            self.mask_integral = np.array(mask_data > 0, dtype=mask_integral_dtype)
-            self.mask_integral = integral_image(self.mask_integral)
+            self.acceptance_maps.clear()
 
         if self.ensure_nonempty:
 
@@ -113,6 +153,17 @@ class RandomLocation(BatchFilter):
 
             logger.info("retrieved %d points", len(self.points.data))
 
+            assert len(self.points.data) > 0, (
+                "Can not ensure non-empty requests, there are no %s"%
+                self.ensure_nonempty)
+
+            # only the locations are needed to pick random locations
+            self.point_locations = np.array(
+                [point.location for point in self.points.data.values()],
+                dtype=np.float64)
+
+            self.point_samplers.clear()
+
         # clear bounding boxes of all provided arrays and points --
         # RandomLocation does not have limits (offsets are ignored)
         for key, spec in self.spec.items():
@@ -153,6 +204,10 @@ class RandomLocation(BatchFilter):
 
     def process(self, batch, request):
 
+        # add statistics of tested locations
+        batch.profiling_stats.merge_with(self.probe_stats)
+        self.probe_stats = ProfilingStats()
+
         # reset ROIs to request
         for (array_key, spec) in request.array_specs.items():
             batch.arrays[array_key].spec.roi = spec.roi
@@ -164,6 +219,183 @@ class RandomLocation(BatchFilter):
             for point_id, _ in batch.points[points_key].data.items():
                 batch.points[points_key].data[point_id].location -= self.random_shift
 
+    def __get_mask_integral(self, upstream):
+
+        mask_voxel_size = self.mask_spec.voxel_size
+        mask_shape = self.mask_spec.roi.get_shape()/mask_voxel_size
+
+        num_voxels = 1
+        for s in mask_shape:
+            num_voxels *= s
+
+        dtype = np.uint64
+        logger.debug("mask size is %s", num_voxels)
+        if num_voxels < 2**32:
+            dtype = np.uint32
+        if num_voxels < 2**16:
+            dtype = np.uint16
+        logger.debug("chose %s as integral array dtype", dtype)
+
+        # the integral array has a leading row of zeros in each dimension,
+        # such that the sum over [begin, end) is an inclusion-exclusion of the
+        # values at begin and end
+        shape = tuple(s + 1 for s in mask_shape)
+
+        if self.mask_integral_file is None:
+
+            logger.info("allocating mask integral array...")
+            integral = np.zeros(shape, dtype=dtype)
+            self.__fill_mask_integral(upstream, integral)
+
+            return integral
+
+        meta_file = self.mask_integral_file + '.json'
+        meta = {
+            'offset': list(self.mask_spec.roi.get_offset()),
+            'shape': list(self.mask_spec.roi.get_shape()),
+            'voxel_size': list(mask_voxel_size),
+            'fingerprint': self.__get_mask_fingerprint(upstream)
+        }
+
+        if os.path.exists(self.mask_integral_file) and os.path.exists(meta_file):
+
+            with open(meta_file, 'r') as f:
+                stored_meta = json.load(f)
+
+            if stored_meta == meta:
+                logger.info(
+                    "reusing mask integral array %s",
+                    self.mask_integral_file)
+                return np.load(self.mask_integral_file, mmap_mode='r')
+
+            logger.info(
+                "mask integral array %s is for a different mask ROI or mask "
+                "files, recomputing it", self.mask_integral_file)
+
+        logger.info(
+            "computing mask integral array in %s...",
+            self.mask_integral_file)
+
+        # write to a temporary file first, such that an interrupted setup
+        # does not leave a partial integral array behind
+        tmp_file = '%s.%d.tmp'%(self.mask_integral_file, os.getpid())
+        # (a new file reads as zeros, including the leading rows)
+        integral = np.lib.format.open_memmap(
+            tmp_file,
+            mode='w+',
+            dtype=dtype,
+            shape=shape)
+        self.__fill_mask_integral(upstream, integral)
+        integral.flush()
+        del integral
+
+        os.rename(tmp_file, self.mask_integral_file)
+        with open(meta_file, 'w') as f:
+            json.dump(meta, f)
+
+        return np.load(self.mask_integral_file, mmap_mode='r')
+
+    def __get_mask_fingerprint(self, upstream):
+        '''Hash the paths, sizes, and modification times of the files the
+        mask is read from, to detect changes of the mask between runs.'''
+
+        sources = _get_sources(upstream)
+        mask_sources = [
+            source
+            for source in sources
+            if self.mask in source.spec
+        ]
+        if mask_sources:
+            sources = mask_sources
+
+        fingerprint = hashlib.sha1()
+
+        for source in sources:
+
+            filename = getattr(source, 'filename', None)
+            if not isinstance(filename, basestring):
+                continue
+
+            # only the dataset of the mask in directory containers (like zarr)
+            datasets = getattr(source, 'datasets', None)
+            if (
+                    os.path.isdir(filename) and
+                    isinstance(datasets, dict) and
+                    self.mask in datasets):
+                filename = os.path.join(filename, datasets[self.mask])
+
+            for path in sorted(glob.glob(filename)):
+                for stat_path in _walk_files(path):
+                    stat = os.stat(stat_path)
+                    fingerprint.update(('%s %d %r\n'%(
+                        os.path.abspath(stat_path),
+                        stat.st_size,
+                        stat.st_mtime)).encode('utf-8'))
+
+        return fingerprint.hexdigest()
+
+    def __fill_mask_integral(self, upstream, integral):
+
+        mask_voxel_size = self.mask_spec.voxel_size
+        mask_shape = Coordinate(s - 1 for s in integral.shape)
+        dims = len(mask_shape)
+
+        if self.mask_block_shape is None:
+            block_shape = mask_shape
+        else:
+            block_shape = Coordinate(self.mask_block_shape)
+
+        block_indices = list(itertools.product(*[
+            range((s + b - 1)//b)
+            for s, b in zip(mask_shape, block_shape)]))
+
+        logger.info("requesting mask in %d blocks...", len(block_indices))
+
+        # in raster order, such that all values of the integral array left of
+        # (in any dimension) a block are known when processing the block
+        for block_index in block_indices:
+
+            begin = Coordinate(block_index)*block_shape
+            end = Coordinate(
+                min(b + s, m)
+                for b, s, m in zip(begin, block_shape, mask_shape))
+
+            block_roi = Roi(
+                self.mask_spec.roi.get_offset() + begin*mask_voxel_size,
+                (end - begin)*mask_voxel_size)
+            mask_request = BatchRequest({
+                self.mask: ArraySpec(roi=block_roi)
+            })
+            mask_data = upstream.request_batch(
+                mask_request).arrays[self.mask].data
+
+            # integral of the block alone
+            block_integral = np.array(mask_data > 0, dtype=integral.dtype)
+            for d in range(dims):
+                np.cumsum(block_integral, axis=d, out=block_integral)
+
+            # add the values of the integral array before the block,
+            # inclusion-exclusion over the faces, edges, ... of the block
+            for before in itertools.product([False, True], repeat=dims):
+
+                num_before = sum(before)
+                if num_before == 0:
+                    continue
+
+                index = tuple(
+                    slice(b, b + 1) if f else slice(b + 1, e + 1)
+                    for b, e, f in zip(begin, end, before))
+
+                # unsigned wrap-arounds cancel out
+                if num_before%2 == 1:
+                    block_integral += integral[index]
+                else:
+                    block_integral -= integral[index]
+
+            integral[tuple(
+                slice(b + 1, e + 1)
+                for b, e in zip(begin, end))] = block_integral
+
     def accepts(self, request):
         '''Should return True if the randomly chosen location is acceptable
         (besided meeting other criteria like ``min_masked`` and/or
@@ -172,6 +404,38 @@ class RandomLocation(BatchFilter):
 
         return True
 
+    def add_predicate(self, keys, predicate):
+        '''Register a test of the data at randomly picked locations.
+
+        Args:
+
+            keys (``list`` of :class:`ArrayKey`):
+
+                The arrays the test needs. For a location that meets all
+                other criteria, these arrays (as far as they are requested)
+                are requested from upstream at the location.
+
+            predicate (callable):
+
+                Called with the batch containing these arrays, should return
+                ``True`` if the location is acceptable. The ROIs of the batch
+                are the ones requested from this node, i.e., not shifted to
+                the location.
+        '''
+
+        # nodes register their predicates in setup, which can be called again
+        if (keys, predicate) not in self.predicates:
+            self.predicates.append((keys, predicate))
+
+    def remove_predicate(self, keys, predicate):
+        '''Unregister a test added with :func:`add_predicate`.'''
+
+        try:
+            self.predicates.remove((keys, predicate))
+        except ValueError:
+            # removed already
+            pass
+
     def __get_possible_shifts(self, request):
 
         total_shift_roi = None
@@ -211,6 +475,19 @@ class RandomLocation(BatchFilter):
             and
             random() <= self.p_nonempty)
 
+        # without points to ensure, draw directly from the locations that
+        # meet 'min_masked'
+        acceptance_map = None
+        if (
+                not ensure_points and
+                self.mask and
+                self.min_masked > 0 and
+                lcm_shift_roi.size() <= self.max_acceptance_map_size):
+            acceptance_map = self.__get_acceptance_map(
+                request,
+                lcm_shift_roi,
+                lcm_voxel_size)
+
         while True:
 
             if ensure_points:
@@ -218,6 +495,8 @@ class RandomLocation(BatchFilter):
                     request,
                     lcm_shift_roi,
                     lcm_voxel_size)
+            elif acceptance_map is not None:
+                random_shift = acceptance_map.sample()*lcm_voxel_size
             else:
                 random_shift = self.__select_random_location(
                     lcm_shift_roi,
@@ -225,7 +504,9 @@ class RandomLocation(BatchFilter):
 
             logger.debug("random shift: " + str(random_shift))
 
-            if not self.__is_min_masked(random_shift, request):
+            if (
+                    acceptance_map is None and
+                    not self.__is_min_masked(random_shift, request)):
                 logger.debug(
                     "random location does not meet 'min_masked' criterium")
                 continue
@@ -235,6 +516,11 @@ class RandomLocation(BatchFilter):
                     "random location does not meet user-provided criterium")
                 continue
 
+            if not self.__accepts_data(random_shift, request):
+                logger.debug(
+                    "random location does not meet registered predicates")
+                continue
+
             return random_shift
 
     def __is_min_masked(self, random_shift, request):
@@ -252,17 +538,65 @@ class RandomLocation(BatchFilter):
         request_mask_roi_in_array -= self.mask_spec.roi.get_offset()/mask_voxel_size
 
         # get number of masked-in voxels
-        num_masked_in = integrate(
+        num_masked_in = _box_sums(
             self.mask_integral,
-            [request_mask_roi_in_array.get_begin()],
-            [request_mask_roi_in_array.get_end()-(1,)*self.mask_integral.ndim]
-        )[0]
+            request_mask_roi_in_array.get_begin(),
+            request_mask_roi_in_array.get_shape(),
+            (1,)*request_mask_roi_in_array.dims(),
+            (1,)*request_mask_roi_in_array.dims())[(0,)*request_mask_roi_in_array.dims()]
 
         mask_ratio = float(num_masked_in)/request_mask_roi_in_array.size()
         logger.debug("mask ratio is %f", mask_ratio)
 
         return mask_ratio >= self.min_masked
 
+    def __get_acceptance_map(self, request, lcm_shift_roi, lcm_voxel_size):
+
+        request_mask_roi = request.array_specs[self.mask].roi
+
+        key = (
+            request_mask_roi.get_begin(),
+            request_mask_roi.get_shape(),
+            lcm_shift_roi.get_begin(),
+            lcm_shift_roi.get_shape(),
+            lcm_voxel_size)
+        if key in self.acceptance_maps:
+            return self.acceptance_maps[key]
+
+        # the mask ROI of the first possible shift, in the mask array
+        mask_voxel_size = self.spec[self.mask].voxel_size
+        first_roi = request_mask_roi.shift(lcm_shift_roi.get_begin()*lcm_voxel_size)
+        first_roi_in_array = first_roi/mask_voxel_size
+        first_roi_in_array -= self.mask_spec.roi.get_offset()/mask_voxel_size
+
+        logger.debug(
+            "computing masked-in ratios of %d possible shifts...",
+            lcm_shift_roi.size())
+
+        acceptance_map = _AcceptanceMap(
+            self.mask_integral,
+            first_roi_in_array.get_begin(),
+            first_roi_in_array.get_shape(),
+            lcm_voxel_size/mask_voxel_size,
+            self.min_masked*first_roi_in_array.size(),
+            lcm_shift_roi.get_shape(),
+            lcm_shift_roi.get_begin())
+
+        assert acceptance_map.size() > 0, (
+            "Can not satisfy batch request, no location has a masked-in "
+            "ratio of at least %f"%self.min_masked)
+
+        logger.debug(
+            "%d of %d possible shifts have a masked-in ratio of at least %f",
+            acceptance_map.size(), lcm_shift_roi.size(), self.min_masked)
+
+        # keep the maps of the last few distinct requests
+        self.acceptance_maps[key] = acceptance_map
+        while len(self.acceptance_maps) > 8:
+            self.acceptance_maps.popitem(last=False)
+
+        return acceptance_map
+
     def __accepts(self, random_shift, request):
 
         # create a shifted copy of the request
@@ -271,6 +605,45 @@ class RandomLocation(BatchFilter):
 
         return self.accepts(shifted_request)
 
+    def __accepts_data(self, random_shift, request):
+
+        node_name = type(self).__name__
+
+        # predicates might remove themselves
+        for keys, predicate in list(self.predicates):
+
+            keys = [key for key in keys if key in request]
+            if not keys:
+                continue
+
+            timing = Timing(self, 'probe')
+            timing.start()
+
+            probe_request = BatchRequest()
+            for key in keys:
+                probe_request[key] = request[key].copy()
+            self.__shift_request(probe_request, random_shift)
+
+            probe_batch = self.get_upstream_provider().request_batch(
+                probe_request)
+
+            # reset ROIs to request
+            for key in keys:
+                probe_batch.arrays[key].spec.roi = request[key].roi
+
+            accepted = predicate(probe_batch)
+
+            timing.stop()
+            self.probe_stats.add(timing)
+
+            if not accepted:
+                self.probe_stats.add_to_counter(node_name, 'probes rejected')
+                return False
+
+            self.probe_stats.add_to_counter(node_name, 'probes accepted')
+
+        return True
+
     def __shift_request(self, request, shift):
 
         # shift request ROIs
@@ -287,126 +660,36 @@ class RandomLocation(BatchFilter):
 
         request_points_roi = request[self.ensure_nonempty].roi
 
-        while True:
-
-            # How to pick shifts that ensure that a randomly chosen point is
-            # contained in the request ROI:
-            #
-            #
-            # request          point
-            # [---------)      .
-            # 0        +10     17
-            #
-            #         least shifted to contain point
-            #         [---------)
-            #         8        +10
-            #         ==
-            #         point-request.begin-request.shape+1
-            #
-            #                  most shifted to contain point:
-            #                  [---------)
-            #                  17       +10
-            #                  ==
-            #                  point-request.begin
-            #
-            #         all possible shifts
-            #         [---------)
-            #         8        +10
-            #         ==
-            #         point-request.begin-request.shape+1
-            #                   ==
-            #                   request.shape
-            #
-            # In the most shifted scenario, it could happen that the point lies
-            # exactly at the lower boundary (17 in the example). This will cause
-            # trouble if later we mirror the batch. The point would end up lying
-            # on the other boundary, which is exclusive and thus not part of the
-            # ROI. Therefore, we have to ensure that the point is well inside
-            # the shifted ROI, not just on the boundary:
-            #
-            #         all possible shifts
-            #         [--------)
-            #         8       +9
-            #                 ==
-            #                 request.shape-1
+        key = (
+            request_points_roi.get_begin(),
+            request_points_roi.get_shape(),
+            lcm_shift_roi.get_begin(),
+            lcm_shift_roi.get_shape(),
+            lcm_voxel_size)
 
-            # pick a random point
-            point_id = choice(self.points.data.keys())
-            point = self.points.data[point_id]
+        if key not in self.point_samplers:
 
-            logger.debug(
-                "select random point %d at %s",
-                point_id,
-                point.location)
+            self.point_samplers[key] = _PointSampler(
+                self.point_locations,
+                request_points_roi,
+                lcm_shift_roi,
+                lcm_voxel_size)
 
-            # get the lcm voxel that contains this point
-            lcm_location = Coordinate(point.location/lcm_voxel_size)
-            logger.debug(
-                "belongs to lcm voxel %s",
-                lcm_location)
+            # keep the samplers of the last few distinct requests
+            while len(self.point_samplers) > 8:
+                self.point_samplers.popitem(last=False)
 
-            # mark all dimensions in which the point lies on the lower boundary
-            # of the lcm voxel
-            on_lower_boundary = lcm_location*lcm_voxel_size == point.location
-            logger.debug(
-                "lies on the lower boundary of the lcm voxel in dimensions %s",
-                on_lower_boundary)
-
-            # for each of these dimensions, we have to change the shape of the
-            # shift ROI using the following correction
-            lower_boundary_correction = Coordinate((
-                -1 if o else 0
-                for o in on_lower_boundary
-            ))
-            logger.debug(
-                "lower bound correction for shape of shift ROI %s",
-                lower_boundary_correction)
-
-            # get the request ROI's shape in lcm
-            lcm_roi_begin = request_points_roi.get_begin()/lcm_voxel_size
-            lcm_roi_shape = request_points_roi.get_shape()/lcm_voxel_size
-            logger.debug("Point request ROI: %s", request_points_roi)
-            logger.debug("Point request lcm ROI shape: %s", lcm_roi_shape)
-
-            # get all possible starting points of lcm_roi_shape that contain
-            # lcm_location
-            lcm_shift_roi_begin = (
-                lcm_location - lcm_roi_begin - lcm_roi_shape +
-                Coordinate((1,)*len(lcm_location))
-            )
-            lcm_shift_roi_shape = (
-                lcm_roi_shape + lower_boundary_correction
-            )
-            lcm_point_shift_roi = Roi(lcm_shift_roi_begin, lcm_shift_roi_shape)
-            logger.debug("lcm point shift roi: %s", lcm_point_shift_roi)
+        sampler = self.point_samplers[key]
 
-            # intersect with total shift ROI
-            if not lcm_point_shift_roi.intersects(lcm_shift_roi):
-                logger.debug(
-                    "reject random shift, random point %s shift ROI %s does "
-                    "not intersect total shift ROI %s", point.location,
-                    lcm_point_shift_roi, lcm_shift_roi)
-                continue
-            lcm_point_shift_roi = lcm_point_shift_roi.intersect(lcm_shift_roi)
+        while True:
 
-            # select a random shift from all possible shifts
-            random_shift = self.__select_random_location(
-                lcm_point_shift_roi,
-                lcm_voxel_size)
+            # pick a random point and a random shift, such that the point is
+            # contained in the shifted request (see _PointSampler)
+            random_shift = sampler.sample()
             logger.debug("random shift: %s", random_shift)
 
             # count all points inside the shifted ROI
-            points_request = BatchRequest()
-            points_request[self.ensure_nonempty] = PointsSpec(
-                roi=request_points_roi.shift(random_shift))
-            logger.debug("points request: %s", points_request)
-            points_batch = self.get_upstream_provider().request_batch(points_request)
-
-            point_ids = points_batch.points[self.ensure_nonempty].data.keys()
-            assert point_id in point_ids, (
-                "Requested batch to contain point %s, but got points "
-                "%s"%(point_id, point_ids))
-            num_points = len(point_ids)
+            num_points = sampler.count(request_points_roi.shift(random_shift))
 
             # accept this shift with p=1/num_points
             #
@@ -425,3 +708,317 @@ class RandomLocation(BatchFilter):
         random_shift *= lcm_voxel_size
 
         return random_shift
+
+class _PointSampler(object):
+    '''Draws random shifts of a request, such that a randomly picked point is
+    contained in the shifted request, and counts the points in ROIs.
+
+    How to pick shifts that ensure that a randomly chosen point is contained
+    in the request ROI::
+
+        request          point
+        [---------)      .
+        0        +10     17
+
+                least shifted to contain point
+                [---------)
+                8        +10
+                ==
+                point-request.begin-request.shape+1
+
+                         most shifted to contain point:
+                         [---------)
+                         17       +10
+                         ==
+                         point-request.begin
+
+                all possible shifts
+                [---------)
+                8        +10
+                ==
+                point-request.begin-request.shape+1
+                          ==
+                          request.shape
+
+    In the most shifted scenario, it could happen that the point lies exactly
+    at the lower boundary (17 in the example). This will cause trouble if
+    later we mirror the batch. The point would end up lying on the other
+    boundary, which is exclusive and thus not part of the ROI. Therefore, we
+    have to ensure that the point is well inside the shifted ROI, not just on
+    the boundary::
+
+                all possible shifts
+                [--------)
+                8       +9
+                        ==
+                        request.shape-1
+
+    The possible shifts of all points are computed at once (on the lcm voxel
+    grid, intersected with all valid shifts). Points without any valid shift
+    are never picked.
+
+    For counting, the points are sorted into a uniform grid with cells of the
+    size of the request, such that each count looks at the points of at most
+    ``2^dims`` cells.
+    '''
+
+    def __init__(self, locations, request_roi, lcm_shift_roi, lcm_voxel_size):
+
+        dims = locations.shape[1]
+
+        lcm_voxel_size = np.array(lcm_voxel_size)
+        lcm_roi_begin = np.array(request_roi.get_begin())//lcm_voxel_size
+        lcm_roi_shape = np.array(request_roi.get_shape())//lcm_voxel_size
+
+        # the lcm voxels containing the points, and whether the points lie on
+        # their lower boundary
+        lcm_locations = np.trunc(locations/lcm_voxel_size).astype(np.int64)
+        on_lower_boundary = lcm_locations*lcm_voxel_size == locations
+
+        # all lcm shifts that contain each point, intersected with the valid
+        # shifts
+        begin = lcm_locations - lcm_roi_begin - lcm_roi_shape + 1
+        end = begin + lcm_roi_shape - on_lower_boundary
+        begin = np.maximum(begin, np.array(lcm_shift_roi.get_begin()))
+        end = np.minimum(end, np.array(lcm_shift_roi.get_end()))
+
+        valid = np.all(end > begin, axis=1)
+
+        assert valid.any(), (
+            "Can not ensure non-empty requests, no point can be contained in "
+            "a request of %s within the valid shifts"%request_roi)
+
+        logger.debug(
+            "%d of %d points can be contained in a valid shift",
+            np.count_nonzero(valid), len(locations))
+
+        self.lcm_voxel_size = Coordinate(lcm_voxel_size)
+        self.shift_begins = begin[valid]
+        self.shift_ends = end[valid]
+
+        # sort points into cells of the request size
+        self.cell_shape = np.array(request_roi.get_shape())
+        cells = np.floor(locations/self.cell_shape).astype(np.int64)
+        self.cells_begin = cells.min(axis=0)
+        self.cells_shape = cells.max(axis=0) - self.cells_begin + 1
+
+        cell_ids = np.ravel_multi_index(
+            (cells - self.cells_begin).T,
+            self.cells_shape)
+        order = np.argsort(cell_ids, kind='mergesort')
+        self.cell_ids = cell_ids[order]
+        self.locations = locations[order]
+
+        self.dims = dims
+
+    def sample(self):
+
+        i = randint(0, len(self.shift_begins) - 1)
+
+        return Coordinate(
+            randint(int(b), int(e - 1))
+            for b, e in zip(self.shift_begins[i], self.shift_ends[i])
+        )*self.lcm_voxel_size
+
+    def count(self, roi):
+        '''Count the points contained in ``roi``.'''
+
+        begin = np.array(roi.get_begin())
+        end = np.array(roi.get_end())
+
+        first = np.floor(begin/self.cell_shape).astype(np.int64)
+        last = np.floor((end - 1)/self.cell_shape).astype(np.int64)
+        first = np.maximum(first, self.cells_begin) - self.cells_begin
+        last = np.minimum(last, self.cells_begin + self.cells_shape - 1) - \
+            self.cells_begin
+
+        count = 0
+        for cell in itertools.product(*[
+                range(f, l + 1)
+                for f, l in zip(first, last)]):
+
+            cell_id = np.ravel_multi_index(cell, self.cells_shape)
+            lo = np.searchsorted(self.cell_ids, cell_id, side='left')
+            hi = np.searchsorted(self.cell_ids, cell_id, side='right')
+
+            locations = self.locations[lo:hi]
+            count += np.count_nonzero(np.all(
+                (locations >= begin) & (locations < end),
+                axis=1))
+
+        return count
+
+class _AcceptanceMap(object):
+    '''Draws uniformly from the shifts that meet ``min_masked``, without
+    rejection.
+
+    Only the number of accepted shifts per block of the shift grid is stored,
+    such that each draw costs a binary search over the cumulative counts. The
+    accepted shifts of the drawn block are computed again from the integral
+    array.'''
+
+    block_size = 4096
+
+    def __init__(
+            self,
+            integral,
+            begin,
+            box_shape,
+            step,
+            min_num_masked_in,
+            shape,
+            offset):
+
+        self.integral = integral
+        self.begin = Coordinate(begin)
+        self.box_shape = Coordinate(box_shape)
+        self.step = Coordinate(step)
+        self.min_num_masked_in = min_num_masked_in
+        self.shape = Coordinate(shape)
+        self.offset = Coordinate(offset)
+
+        self.block_shape = _get_block_shape(self.shape, self.block_size)
+        self.blocks_shape = Coordinate(
+            (s + b - 1)//b
+            for s, b in zip(self.shape, self.block_shape))
+
+        # count in slabs of blocks along the first dimension, to bound the
+        # size of temporary arrays
+        counts = np.zeros(self.blocks_shape, dtype=np.int64)
+        slab_size = max(1, 2**22//(
+            self.block_shape[0]*int(np.prod(self.shape[1:]))))
+        for i in range(0, self.blocks_shape[0], slab_size):
+
+            slab_begin = (i*self.block_shape[0],) + (0,)*(self.shape.dims() - 1)
+            slab_shape = (
+                min(
+                    slab_size*self.block_shape[0],
+                    self.shape[0] - slab_begin[0]),) + self.shape[1:]
+
+            counts[i:i + slab_size] = _count_blocks(
+                self.__accepted(slab_begin, slab_shape),
+                self.block_shape)
+
+        self.cumulative_counts = np.cumsum(counts.ravel())
+
+    def size(self):
+        '''The number of accepted shifts.'''
+
+        return int(self.cumulative_counts[-1])
+
+    def sample(self):
+
+        n = randint(0, self.size() - 1)
+
+        block = int(np.searchsorted(self.cumulative_counts, n, side='right'))
+        if block > 0:
+            n -= int(self.cumulative_counts[block - 1])
+
+        block_begin = Coordinate(
+            np.unravel_index(block, self.blocks_shape))*self.block_shape
+        block_shape = tuple(
+            min(b, s - o)
+            for b, s, o in zip(self.block_shape, self.shape, block_begin))
+
+        index = np.flatnonzero(self.__accepted(block_begin, block_shape))[n]
+
+        return (
+            self.offset +
+            block_begin +
+            Coordinate(np.unravel_index(index, block_shape)))
+
+    def __accepted(self, begin, shape):
+        '''Test the shifts in ``[begin, begin + shape)`` of the shift grid.'''
+
+        num_masked_in = _box_sums(
+            self.integral,
+            self.begin + Coordinate(begin)*self.step,
+            self.box_shape,
+            self.step,
+            shape)
+
+        return num_masked_in >= self.min_num_masked_in
+
+def _get_block_shape(shape, block_size):
+    '''Get a block shape of about ``block_size`` entries that fits into
+    ``shape``, as close to a cube as possible.'''
+
+    block_shape = [1]*len(shape)
+
+    # smallest dimensions first, such that the remaining size can be spread
+    # over the larger ones
+    for i, d in enumerate(np.argsort(shape)):
+        edge = int(round(block_size**(1.0/(len(shape) - i))))
+        block_shape[d] = max(1, min(shape[d], edge))
+        block_size = max(1, block_size//block_shape[d])
+
+    return Coordinate(block_shape)
+
+def _count_blocks(accepted, block_shape):
+    '''Count the ``True`` entries of ``accepted`` in blocks of
+    ``block_shape``, the last block in each dimension can be partial.'''
+
+    padding = [(0, -s%b) for s, b in zip(accepted.shape, block_shape)]
+    accepted = np.pad(accepted, padding, mode='constant')
+
+    # split each dimension into (blocks, block_shape)
+    blocks_shape = []
+    for s, b in zip(accepted.shape, block_shape):
+        blocks_shape += [s//b, b]
+
+    return accepted.reshape(blocks_shape).sum(
+        axis=tuple(range(1, len(blocks_shape), 2)))
+
+def _get_sources(provider):
+    '''Get all providers without upstream providers, upstream of
+    ``provider``.'''
+
+    upstream_providers = provider.get_upstream_providers()
+    if not upstream_providers:
+        return [provider]
+
+    sources = []
+    for upstream_provider in upstream_providers:
+        sources += _get_sources(upstream_provider)
+
+    return sources
+
+def _walk_files(path):
+    '''All files in ``path``, or ``path`` itself if it is a file, in a
+    deterministic order.'''
+
+    if not os.path.isdir(path):
+        return [path]
+
+    files = []
+    for root, dirs, filenames in os.walk(path):
+        dirs.sort()
+        files += [os.path.join(root, f) for f in sorted(filenames)]
+
+    return files
+
+def _box_sums(integral, begin, shape, step, num):
+    '''Sums of boxes of ``shape``, starting at ``begin + i*step`` for all
+    ``i < num`` (per dimension), from an integral array with a leading row of
+    zeros in each dimension.'''
+
+    sums = None
+
+    for corner in itertools.product([0, 1], repeat=len(begin)):
+
+        index = tuple(
+            slice(b + c*s, b + c*s + (n - 1)*t + 1, t)
+            for b, c, s, t, n in zip(begin, corner, shape, step, num))
+
+        # inclusion-exclusion, unsigned wrap-arounds cancel out
+        if (len(corner) - sum(corner))%2 == 0:
+            term = integral[index]
+        else:
+            term = -integral[index]
+
+        if sums is None:
+            sums = term.copy()
+        else:
+            sums += term
+
+    return sums
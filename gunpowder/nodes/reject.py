@@ -1,7 +1,9 @@
 import logging
 import random
+import threading
 
 from .batch_filter import BatchFilter
+from .random_location import RandomLocation
 from gunpowder.profiling import Timing
 
 logger = logging.getLogger(__name__)
@@ -9,6 +11,10 @@ logger = logging.getLogger(__name__)
 class Reject(BatchFilter):
     '''Reject batches based on the masked-in vs. masked-out ratio.
 
+    The number of accepted and rejected batches, and the time spent on
+    rejected batches, are reported as counters in the profiling stats of each
+    batch.
+
     Args:
 
         mask (:class:`ArrayKey`):
@@ -26,13 +32,39 @@ class Reject(BatchFilter):
             The probability by which a batch that is not valid (less than
             min_masked) is actually rejected. Defaults to 1., i.e. strict
             rejection.
+
+        pushdown (``bool``, optional):
+
+            If set, the mask ratio is also tested by the closest upstream
+            :class:`RandomLocation`, on the mask alone, before the full batch
+            is requested (see :func:`RandomLocation.add_predicate`). This
+            avoids reading and augmenting other arrays for locations that
+            will be rejected. Batches are still tested here as well. The
+            nodes in between have to pass the ROI of the mask through
+            unchanged (unlike, e.g., :class:`ElasticAugment`), otherwise the
+            mask tested by :class:`RandomLocation` differs from the one
+            tested here: in this case, a warning is logged and batches are
+            only tested here. Only used with strict rejection
+            (``reject_probability`` of 1). Defaults to ``False``.
     '''
 
-    def __init__(self, mask, min_masked=0.5, reject_probability=1.):
+    def __init__(
+            self,
+            mask,
+            min_masked=0.5,
+            reject_probability=1.,
+            pushdown=False):
 
         self.mask = mask
         self.min_masked = min_masked
         self.reject_probability = reject_probability
+        self.pushdown = pushdown
+
+        # the RandomLocation testing the mask, and the ROI of the mask
+        # requested from this node (per thread, shared with the copies of
+        # thread workers of PreCache)
+        self.pushdown_target = None
+        self.requested_mask = threading.local()
 
     def setup(self):
 
@@ -40,6 +72,9 @@ class Reject(BatchFilter):
             "Reject can only be used if %s is provided"%self.mask)
         self.upstream_provider = self.get_upstream_provider()
 
+        if self.pushdown:
+            self.__push_down()
+
     def provide(self, request):
 
         report_next_timeout = 10
@@ -51,12 +86,20 @@ class Reject(BatchFilter):
         assert self.mask in request, (
             "Reject can only be used if a GT mask is requested")
 
+        node_name = type(self).__name__
+        rejected_seconds = 0
+
+        self.requested_mask.roi = request[self.mask].roi
+
         have_good_batch = False
         while not have_good_batch:
 
+            request_timing = Timing(self)
+            request_timing.start()
+
             batch = self.upstream_provider.request_batch(request)
             mask_ratio = batch.arrays[self.mask].data.mean()
-            have_good_batch = mask_ratio>self.min_masked
+            have_good_batch = self.__is_min_masked(mask_ratio)
 
             if not have_good_batch and self.reject_probability < 1.:
                 have_good_batch = random.random() > self.reject_probability
@@ -68,6 +111,9 @@ class Reject(BatchFilter):
                     mask_ratio, batch.arrays[self.mask].spec.roi)
                 num_rejected += 1
 
+                request_timing.stop()
+                rejected_seconds += request_timing.elapsed()
+
                 if timing.elapsed() > report_next_timeout:
 
                     logger.warning(
@@ -81,7 +127,61 @@ class Reject(BatchFilter):
                     "accepted batch with mask ratio %f at %s",
                     mask_ratio, batch.arrays[self.mask].spec.roi)
 
+        self.requested_mask.roi = None
+
         timing.stop()
         batch.profiling_stats.add(timing)
+        batch.profiling_stats.add_to_counter(node_name, 'accepted', 1)
+        batch.profiling_stats.add_to_counter(node_name, 'rejected', num_rejected)
+        batch.profiling_stats.add_to_counter(
+            node_name, 'rejected seconds', rejected_seconds)
 
         return batch
+
+    def __is_min_masked(self, mask_ratio):
+
+        return mask_ratio > self.min_masked
+
+    def __accepts_mask(self, batch):
+
+        mask_roi = getattr(self.requested_mask, 'roi', None)
+        if mask_roi is None:
+            # not requested through this node
+            return True
+
+        if batch.arrays[self.mask].spec.roi != mask_roi:
+            logger.warning(
+                "Not pushing mask test of %s upstream anymore, nodes between "
+                "%s and this node change the ROI of the mask (to %s, "
+                "requested %s)",
+                self.mask, self.pushdown_target,
+                batch.arrays[self.mask].spec.roi, mask_roi)
+            self.pushdown_target.remove_predicate(
+                [self.mask],
+                self.__accepts_mask)
+            return True
+
+        return self.__is_min_masked(batch.arrays[self.mask].data.mean())
+
+    def __push_down(self):
+
+        if self.reject_probability < 1.:
+            logger.warning(
+                "Not pushing mask test of %s upstream, only supported for "
+                "strict rejection (reject_probability=1)", self.mask)
+            return
+
+        # find the closest upstream RandomLocation
+        provider = self.upstream_provider
+        while not isinstance(provider, RandomLocation):
+            if not isinstance(provider, BatchFilter):
+                logger.warning(
+                    "Not pushing mask test of %s upstream, there is no "
+                    "RandomLocation upstream", self.mask)
+                return
+            provider = provider.get_upstream_provider()
+
+        logger.info(
+            "testing mask ratio of %s already in %s", self.mask, provider)
+        self.pushdown_target = provider
+        provider.add_predicate([self.mask], self.__accepts_mask)
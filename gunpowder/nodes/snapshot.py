@@ -2,8 +2,10 @@ import logging
 import os
 
 from .batch_filter import BatchFilter
+from gunpowder.background_writer import BackgroundWriter
 from gunpowder.batch_request import BatchRequest
 from gunpowder.ext import h5py
+from gunpowder.shared_memory_pool import SharedMemoryPool
 
 logger = logging.getLogger(__name__)
 
@@ -53,6 +55,26 @@ class Snapshot(BatchFilter):
             A dictionary from array keys to datatype (eg. ``np.int8``). If
             given, arrays are stored using this type. The original arrays
             within the pipeline remain unchanged.
+
+        asynchronous (``bool``):
+
+            If set, snapshots are written by a separate process, such that
+            compression and disk I/O do not stall the pipeline. The arrays to
+            store are copied into a bounded queue (through shared memory), the
+            rest happens in the writer process. All queued snapshots are
+            written when the pipeline is torn down.
+
+        queue_size (``int``):
+
+            How many snapshots to queue at most in asynchronous mode.
+
+        block_when_full (``bool``):
+
+            What to do in asynchronous mode if the queue is full because the
+            writer falls behind: wait until there is space (``True``), or drop
+            the snapshot (``False``, default), such that the pipeline is never
+            blocked. Dropped snapshots are counted in the profiling
+            statistics.
         '''
 
     def __init__(
@@ -63,7 +85,10 @@ class Snapshot(BatchFilter):
             every=1,
             additional_request=None,
             compression_type=None,
-            dataset_dtypes=None):
+            dataset_dtypes=None,
+            asynchronous=False,
+            queue_size=2,
+            block_when_full=False):
         self.dataset_names = dataset_names
         self.output_dir = output_dir
         self.output_filename = output_filename
@@ -75,6 +100,17 @@ class Snapshot(BatchFilter):
             self.dataset_dtypes = {}
         else:
             self.dataset_dtypes = dataset_dtypes
+        self.asynchronous = asynchronous
+        self.queue_size = queue_size
+        self.block_when_full = block_when_full
+        self.writer = None
+
+    def teardown(self):
+
+        if self.writer is not None:
+            logger.info("Waiting for pending snapshots...")
+            self.writer.stop()
+        self.writer = None
 
     def prepare(self, request):
 
@@ -90,42 +126,88 @@ class Snapshot(BatchFilter):
 
         if self.record_snapshot:
 
-            try:
-                os.makedirs(self.output_dir)
-            except:
-                pass
-
             snapshot_name = os.path.join(
                 self.output_dir,
                 self.output_filename.format(
                     id=str(batch.id).zfill(8),
                     iteration=int(batch.iteration or 0)))
-            logger.info('saving to %s' %snapshot_name)
-            with h5py.File(snapshot_name, 'w') as f:
 
-                for (array_key, array) in batch.arrays.items():
+            if self.asynchronous:
+                self.__enqueue(batch, snapshot_name)
+            else:
+                self.write(batch, snapshot_name)
 
-                    if array_key not in self.dataset_names:
-                        continue
+        self.n += 1
 
-                    ds_name = self.dataset_names[array_key]
+    def write(self, batch, snapshot_name):
+        '''Store the arrays of ``batch`` in a new file ``snapshot_name``.'''
 
-                    offset = array.spec.roi.get_offset()
-                    if array_key in self.dataset_dtypes:
-                        dtype = self.dataset_dtypes[array_key]
-                        dataset = f.create_dataset(name=ds_name, data=array.data.astype(dtype), compression=self.compression_type)
-                    else:
-                        dataset = f.create_dataset(name=ds_name, data=array.data, compression=self.compression_type)
-                    
-                    dataset.attrs['offset'] = offset
-                    dataset.attrs['resolution'] = self.spec[array_key].voxel_size
+        try:
+            os.makedirs(self.output_dir)
+        except:
+            pass
 
-                    # if array has attributes, add them to the dataset
-                    for attribute_name, attribute in array.attrs.items():
-                        dataset.attrs[attribute_name] = attribute
+        logger.info('saving to %s' %snapshot_name)
+        with h5py.File(snapshot_name, 'w') as f:
 
-                if batch.loss is not None:
-                    f['/'].attrs['loss'] = batch.loss
+            for (array_key, array) in batch.arrays.items():
 
-        self.n += 1
+                if array_key not in self.dataset_names:
+                    continue
+
+                ds_name = self.dataset_names[array_key]
+
+                offset = array.spec.roi.get_offset()
+                if array_key in self.dataset_dtypes:
+                    dtype = self.dataset_dtypes[array_key]
+                    dataset = f.create_dataset(name=ds_name, data=array.data.astype(dtype), compression=self.compression_type)
+                else:
+                    dataset = f.create_dataset(name=ds_name, data=array.data, compression=self.compression_type)
+
+                dataset.attrs['offset'] = offset
+                dataset.attrs['resolution'] = self.spec[array_key].voxel_size
+
+                # if array has attributes, add them to the dataset
+                for attribute_name, attribute in array.attrs.items():
+                    dataset.attrs[attribute_name] = attribute
+
+            if batch.loss is not None:
+                f['/'].attrs['loss'] = batch.loss
+
+    def __enqueue(self, batch, snapshot_name):
+
+        keys = [key for key in batch.arrays if key in self.dataset_names]
+
+        if self.writer is None:
+
+            # leave some headroom for batches of slightly varying sizes
+            batch_size = sum(batch.arrays[key].data.nbytes for key in keys)
+            slab_size = (
+                int(batch_size*1.1) +
+                len(keys)*SharedMemoryPool.alignment)
+
+            self.writer = BackgroundWriter(
+                self,
+                self.write,
+                queue_size=self.queue_size,
+                slab_size=slab_size)
+            self.writer.start()
+
+        node_name = type(self).__name__
+        stats = batch.profiling_stats
+
+        queued = self.writer.put(
+            batch,
+            snapshot_name,
+            keys=keys,
+            block=self.block_when_full)
+
+        if not queued:
+            logger.warning(
+                "snapshot writer is busy, dropping snapshot %s",
+                snapshot_name)
+            stats.add_to_counter(node_name, 'snapshots dropped')
 
+        for timing, num_bytes in self.writer.get_reports():
+            stats.add(timing)
+            stats.add_to_counter(node_name, 'snapshots written')
@@ -0,0 +1,83 @@
+import json
+import logging
+
+from .batch_filter import BatchFilter
+
+logger = logging.getLogger(__name__)
+
+class WriteChromeTrace(BatchFilter):
+    '''Write the timings of every batch passing through this node to a file in
+    the Chrome trace event format, to be viewed in ``chrome://tracing`` or
+    `Perfetto <https://ui.perfetto.dev>`_.
+
+    Each ``prepare``, ``process``, and ``provide`` call of the upstream nodes
+    (and the time a batch spent waiting in a :class:`PreCache`) becomes a span
+    on the timeline of the process and thread it was executed in, tagged with
+    the ID of the batch. Spans from different processes share the same clock.
+
+    Args:
+
+        filename (``string``):
+
+            The file to write the trace to. Will be overwritten.
+
+        every (``int``):
+
+            Flush the file every that many batches. The file is completed
+            when the pipeline is torn down, but viewers also accept
+            incomplete files.
+    '''
+
+    def __init__(self, filename, every=10):
+
+        self.filename = filename
+        self.every = every
+        self.file = None
+        self.n = 0
+        self.num_events = 0
+
+    def setup(self):
+
+        self.file = open(self.filename, 'w')
+        self.file.write('[\n')
+        self.n = 0
+        self.num_events = 0
+
+    def teardown(self):
+
+        if self.file is None:
+            return
+
+        self.file.write('\n]\n')
+        self.file.close()
+        self.file = None
+
+        logger.info(
+            "wrote %d trace events to %s",
+            self.num_events, self.filename)
+
+    def process(self, batch, request):
+
+        events = batch.profiling_stats.get_events()
+
+        for node_name, method_name, start, stop, pid, thread_id in events:
+
+            event = {
+                'name': node_name if method_name is None else node_name + '.' + method_name,
+                'cat': node_name,
+                'ph': 'X',
+                'ts': start*1e6,
+                'dur': (stop - start)*1e6,
+                'pid': pid,
+                'tid': thread_id,
+                'args': {'batch_id': batch.id}
+            }
+
+            if self.num_events > 0:
+                self.file.write(',\n')
+            self.file.write(json.dumps(event))
+            self.num_events += 1
+
+        self.n += 1
+        if self.n%self.every == 0:
+            self.file.flush()
@@ -0,0 +1,190 @@
+import logging
+import numpy as np
+import os
+
+from gunpowder.batch import Batch
+from gunpowder.chunked_array import ChunkedArray
+from gunpowder.coordinate import Coordinate
+from gunpowder.profiling import Timing
+from gunpowder.roi import Roi
+from gunpowder.thread_pool import ProcessThreadPool
+from gunpowder.array import Array
+from gunpowder.array_spec import ArraySpec
+from .batch_provider import BatchProvider
+
+logger = logging.getLogger(__name__)
+
+class ZarrSource(BatchProvider):
+    '''A zarr data source.
+
+    Provides arrays from zarr datasets (directories of independently
+    compressed chunks, see :class:`ChunkedArray`), for each array key given.
+    The chunks of a request are read and decompressed concurrently by a pool
+    of threads, without the global lock that serializes HDF5 reads.
+
+    Follows the same conventions as :class:`Hdf5Source`: If the attribute
+    ``resolution`` is set in a dataset, it will be used as the array's
+    ``voxel_size``. If the attribute ``offset`` is set, it will be used as the
+    offset of the :class:`Roi` for this array (in world units).
+
+    Args:
+
+        filename (``string``):
+
+            The zarr container (a directory).
+
+        datasets (``dict``, :class:`ArrayKey` -> ``string``):
+
+            Dictionary of array keys to dataset names that this source offers.
+
+        array_specs (``dict``, :class:`ArrayKey` -> :class:`ArraySpec`, optional):
+
+            An optional dictionary of array keys to array specs to overwrite
+            the array specs automatically determined from the datasets. Only
+            fields that are not ``None`` in the given :class:`ArraySpec` will
+            be used.
+
+        num_threads (``int``):
+
+            How many chunks to read in parallel. Each process (e.g., a worker
+            of :class:`PreCache`) starts its own threads on its first request.
+    '''
+
+    def __init__(
+            self,
+            filename,
+            datasets,
+            array_specs=None,
+            num_threads=4):
+
+        self.filename = filename
+        self.datasets = datasets
+
+        if array_specs is None:
+            self.array_specs = {}
+        else:
+            self.array_specs = array_specs
+
+        self.num_threads = num_threads
+        self.ndims = None
+        self.arrays = {}
+
+        self.__pool = ProcessThreadPool(self.num_threads)
+
+    def setup(self):
+
+        for (array_key, ds_name) in self.datasets.items():
+
+            path = os.path.join(self.filename, ds_name)
+            if not os.path.exists(os.path.join(path, '.zarray')):
+                raise RuntimeError("%s not in %s"%(ds_name, self.filename))
+
+            array = ChunkedArray(path)
+            self.arrays[array_key] = array
+
+            self.provides(array_key, self.__read_spec(array_key, array, ds_name))
+
+    def teardown(self):
+
+        self.__pool.close()
+
+    def provide(self, request):
+
+        timing = Timing(self)
+        timing.start()
+
+        batch = Batch()
+
+        for (array_key, request_spec) in request.array_specs.items():
+
+            logger.debug("Reading %s in %s...", array_key, request_spec.roi)
+
+            voxel_size = self.spec[array_key].voxel_size
+
+            # scale request roi to voxel units
+            dataset_roi = request_spec.roi/voxel_size
+
+            # shift request roi into dataset
+            dataset_roi = dataset_roi - self.spec[array_key].roi.get_offset()/voxel_size
+
+            # create array spec
+            array_spec = self.spec[array_key].copy()
+            array_spec.roi = request_spec.roi
+
+            # add array to batch
+            batch.arrays[array_key] = Array(
+                self.arrays[array_key].read(
+                    dataset_roi.get_begin(),
+                    dataset_roi.get_end(),
+                    pool=self.__pool.get()),
+                array_spec)
+
+        logger.debug("done")
+
+        timing.stop()
+        batch.profiling_stats.add(timing)
+
+        return batch
+
+    def __read_spec(self, array_key, array, ds_name):
+
+        dims = Coordinate(array.shape)
+
+        if self.ndims is None:
+            self.ndims = len(dims)
+        else:
+            assert self.ndims == len(dims)
+
+        if array_key in self.array_specs:
+            spec = self.array_specs[array_key].copy()
+        else:
+            spec = ArraySpec()
+
+        if spec.voxel_size is None:
+
+            if 'resolution' in array.attrs:
+                spec.voxel_size = Coordinate(array.attrs['resolution'])
+            else:
+                spec.voxel_size = Coordinate((1,)*self.ndims)
+                logger.warning("WARNING: File %s does not contain resolution information "
+                               "for %s (dataset %s), voxel size has been set to %s. This "
+                               "might not be what you want.",
+                               self.filename, array_key, ds_name, spec.voxel_size)
+
+        if spec.roi is None:
+
+            if 'offset' in array.attrs:
+                offset = Coordinate(array.attrs['offset'])
+            else:
+                offset = Coordinate((0,)*self.ndims)
+
+            spec.roi = Roi(offset, dims*spec.voxel_size)
+
+        if spec.dtype is not None:
+            assert spec.dtype == array.dtype, ("dtype %s provided in array_specs for %s, "
+                                               "but differs from dataset %s dtype %s"%
+                                               (self.array_specs[array_key].dtype,
+                                                array_key, ds_name, array.dtype))
+        else:
+            spec.dtype = array.dtype
+
+        if spec.interpolatable is None:
+
+            spec.interpolatable = spec.dtype in [
+                np.float,
+                np.float32,
+                np.float64,
+                np.float128,
+                np.uint8 # assuming this is not used for labels
+            ]
+            logger.warning("WARNING: You didn't set 'interpolatable' for %s "
+                           "(dataset %s). Based on the dtype %s, it has been "
+                           "set to %s. This might not be what you want.",
+                           array_key, ds_name, spec.dtype,
+                           spec.interpolatable)
+
+        return spec
+
+    def __repr__(self):
+
+        return self.filename
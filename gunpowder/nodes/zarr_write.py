@@ -0,0 +1,165 @@
+import logging
+import os
+
+from multiprocessing.pool import ThreadPool
+
+from .batch_filter import BatchFilter
+from gunpowder.chunked_array import ChunkedArray
+
+logger = logging.getLogger(__name__)
+
+class ZarrWrite(BatchFilter):
+    '''Assemble arrays of passing batches in one zarr container. This is the
+    equivalent of :class:`Hdf5Write` for chunked directories, see
+    :class:`ZarrSource`. The chunks covered by a batch are compressed and
+    written concurrently by a pool of threads.
+
+    Args:
+
+        dataset_names (``dict``, :class:`ArrayKey` -> ``string``):
+
+            A dictionary from array keys to names of the datasets to store them
+            in.
+
+        output_dir (``string``):
+
+            The directory to save the zarr container in. Will be created, if
+            it does not exist.
+
+        output_filename (``string``):
+
+            The name of the zarr container (a directory).
+
+        chunk_shape (``tuple`` of ``int``, optional):
+
+            The shape of the chunks in voxels, for the spatial dimensions. If
+            not given, the shape of the first batch is used. Batches that are
+            aligned with the chunks (e.g., from a :class:`Scan`) write whole
+            chunks, others have to read and update the chunks they partially
+            cover.
+
+        compression_level (``int``):
+
+            The zlib compression level, between 0 and 9.
+
+        dataset_dtypes (``dict``, :class:`ArrayKey` -> data type):
+
+            A dictionary from array keys to datatype (eg. ``np.int8``). If
+            given, arrays are stored using this type. The original arrays
+            within the pipeline remain unchanged.
+
+        num_threads (``int``):
+
+            How many chunks to compress and write in parallel.
+        '''
+
+    def __init__(
+            self,
+            dataset_names,
+            output_dir='.',
+            output_filename='output.zarr',
+            chunk_shape=None,
+            compression_level=5,
+            dataset_dtypes=None,
+            num_threads=4):
+
+        self.dataset_names = dataset_names
+        self.output_dir = output_dir
+        self.output_filename = output_filename
+        self.chunk_shape = chunk_shape
+        self.compression_level = compression_level
+        if dataset_dtypes is None:
+            self.dataset_dtypes = {}
+        else:
+            self.dataset_dtypes = dataset_dtypes
+        self.num_threads = num_threads
+        self.datasets = None
+        self.pool = None
+
+    def teardown(self):
+
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+        self.pool = None
+
+    def create_output_file(self, batch):
+
+        try:
+            os.makedirs(self.output_dir)
+        except:
+            pass
+
+        filename = os.path.join(self.output_dir, self.output_filename)
+        self.datasets = {}
+
+        for (array_key, dataset_name) in self.dataset_names.items():
+
+            logger.debug("Create dataset for %s", array_key)
+
+            assert array_key in self.spec, (
+                "Asked to store %s, but is not provided upstream."%array_key)
+            assert array_key in batch.arrays, (
+                "Asked to store %s, but is not part of batch."%array_key)
+
+            batch_shape = batch.arrays[array_key].data.shape
+
+            total_roi = self.spec[array_key].roi
+            dims = total_roi.dims()
+
+            # extends of spatial dimensions
+            data_shape = total_roi.get_shape()//self.spec[array_key].voxel_size
+            logger.debug("Shape in voxels: %s", data_shape)
+            # add channel dimensions (if present)
+            data_shape = batch_shape[:-dims] + data_shape
+            logger.debug("Shape with channel dimensions: %s", data_shape)
+
+            if self.chunk_shape is not None:
+                chunk_shape = tuple(self.chunk_shape)
+            else:
+                chunk_shape = batch_shape[-dims:]
+            chunk_shape = batch_shape[:-dims] + chunk_shape
+
+            if array_key in self.dataset_dtypes:
+                dtype = self.dataset_dtypes[array_key]
+            else:
+                dtype = batch.arrays[array_key].data.dtype
+
+            self.datasets[array_key] = ChunkedArray.create(
+                filename,
+                dataset_name,
+                shape=data_shape,
+                chunks=chunk_shape,
+                dtype=dtype,
+                compression_level=self.compression_level,
+                attrs={
+                    'offset': [int(o) for o in total_roi.get_offset()],
+                    'resolution': [int(v) for v in self.spec[array_key].voxel_size]
+                })
+
+        if self.num_threads > 1:
+            self.pool = ThreadPool(self.num_threads)
+
+    def process(self, batch, request):
+
+        if self.datasets is None:
+            logger.info("Creating zarr container...")
+            self.create_output_file(batch)
+
+        for array_key, dataset in self.datasets.items():
+
+            roi = batch.arrays[array_key].spec.roi
+            data = batch.arrays[array_key].data
+            total_roi = self.spec[array_key].roi
+
+            assert total_roi.contains(roi), (
+                "ROI %s of %s not in upstream provided ROI %s"%(
+                    roi, array_key, total_roi))
+
+            data_roi = (roi - total_roi.get_offset())//self.spec[array_key].voxel_size
+            dims = data_roi.dims()
+            num_channel_dims = max(0, len(dataset.shape) - dims)
+
+            begin = (0,)*num_channel_dims + tuple(data_roi.get_begin())
+
+            dataset.write(begin, data.astype(dataset.dtype, copy=False), pool=self.pool)
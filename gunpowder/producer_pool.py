@@ -2,27 +2,164 @@ try:
     import Queue
 except:
     import queue as Queue
+import ctypes
+import errno
+import fcntl
 import logging
 import multiprocessing
 import os
+import select
+import signal
 import sys
-import time
+import threading
 import traceback
 
+from gunpowder.ext import threadpoolctl, NoSuchModule
+
 logger = logging.getLogger(__name__)
 
+# environment variables limiting the threads of native libraries
+_thread_limit_variables = [
+    'OMP_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS'
+]
+
+# write ends of the control pipes of all running pools of this process, to be
+# closed in forked watchdogs (otherwise, a watchdog would keep the control pipe
+# of another pool open and prevent it from noticing that the parent died)
+_control_pipes = set()
+
 class NoResult(Exception):
     pass
 
 class WorkersDied(Exception):
     pass
 
-class ProducerPool(object):
+class WorkerRestarted(Exception):
+    '''Raised by :func:`ProducerPool.get` after a worker died and was
+    restarted, since the item it was producing got lost.'''
 
-    def __init__(self, callables, queue_size=10):
-        self.__watch_dog = multiprocessing.Process(target=self.__run_watch_dog, args=(callables,))
-        self.__stop = multiprocessing.Event()
-        self.__result_queue = multiprocessing.Queue(queue_size)
+    def __init__(self, worker):
+        super(WorkerRestarted, self).__init__(worker)
+        self.worker = worker
+
+    def __str__(self):
+        return "worker %d died and was restarted"%self.worker
+
+class ProducerPool(object):
+    '''A pool of workers repeatedly calling the given callables and placing
+    their results in a queue.
+
+    Args:
+
+        callables (list of callables):
+
+            One callable per worker. Thread workers skip results that are
+            ``None``.
+
+        queue_size (``int``):
+
+            How many results to hold at most in the result queue.
+
+        executor (``string``):
+
+            Either ``'process'`` (default) to run each callable in its own
+            process, or ``'thread'`` to run them in threads of the calling
+            process. Thread workers hand their results over by reference,
+            which avoids forking and pickling. This pays off if the callables
+            spend most of their time in code that releases the GIL.
+
+        max_restarts (``int``):
+
+            How often worker processes that died (e.g., killed by the OOM
+            killer) are restarted in total. Only the dead worker is restarted,
+            the others continue to produce results. If the budget is used up,
+            the whole pool shuts down and :func:`get` raises
+            :class:`WorkersDied`. Thread workers do not die, since they catch
+            all exceptions.
+
+        num_workers (``int``, optional):
+
+            How many of the callables to run initially. Defaults to all of
+            them. See :func:`set_num_workers`.
+
+        cpu_sets (list of lists of ``int``, optional):
+
+            CPUs to pin the workers to. Worker ``i`` runs on the CPUs
+            ``cpu_sets[i%len(cpu_sets)]``. Requires Linux (uses
+            ``os.sched_setaffinity``, or ``sched_setaffinity`` of the C library
+            on Python 2), a ``RuntimeError`` is raised otherwise. Thread
+            workers pin only their own thread.
+
+        num_threads (``int``, optional):
+
+            Limit the threads that native libraries (OpenMP, MKL, OpenBLAS,
+            numexpr) start in each worker process. Sets the corresponding
+            environment variables when a worker starts, which affects libraries
+            that are loaded or initialized afterwards. Libraries that were
+            already loaded before the fork are limited through
+            ``threadpoolctl``, if installed. Has no effect for thread workers,
+            since the limits are per process.
+
+    The pool does not poll: The watchdog of worker processes sleeps until a
+    worker exits (``SIGCHLD``) or the pool is stopped or resized, workers block
+    while the result queue is full, and :func:`get` blocks until either a
+    result arrives or the watchdog exits.
+    '''
+
+    def __init__(
+            self,
+            callables,
+            queue_size=10,
+            executor='process',
+            max_restarts=10,
+            num_workers=None,
+            cpu_sets=None,
+            num_threads=None):
+
+        assert executor in ['process', 'thread'], (
+            "executor has to be 'process' or 'thread', got %s"%executor)
+        self.__executor = executor
+        self.__max_restarts = max_restarts
+        self.__restarts = multiprocessing.Array('i', len(callables))
+        self.__callables = callables
+        self.__cpu_sets = cpu_sets
+        self.__num_threads = num_threads
+
+        if cpu_sets is not None and not _can_set_cpu_affinity():
+            raise RuntimeError(
+                "cpu_sets given, but CPU affinities can not be set on this "
+                "platform (needs os.sched_setaffinity or sched_setaffinity of "
+                "the C library)")
+
+        if num_threads is not None and executor == 'thread':
+            logger.warning(
+                "num_threads has no effect for thread workers")
+
+        # workers with an index past this number retire
+        if num_workers is None:
+            num_workers = len(callables)
+        self.__num_workers = multiprocessing.Value(
+            'i',
+            max(0, min(num_workers, len(callables))))
+
+        if executor == 'process':
+            self.__watch_dog = multiprocessing.Process(target=self.__run_watch_dog, args=(callables,))
+            self.__result_queue = multiprocessing.Queue(queue_size)
+            self.__control_pipe = None
+            self.__life_pipe = None
+            self.__wakeup_pipe = None
+        else:
+            # retired threads are replaced by None
+            self.__workers = [ None ]*len(callables)
+            self.__resize_lock = threading.Lock()
+            self.__stop = threading.Event()
+            self.__result_queue = Queue.Queue(queue_size)
+
+        self.__started = False
 
     def __del__(self):
         self.stop()
@@ -30,12 +167,29 @@ class ProducerPool(object):
     def start(self):
         '''Start the pool of producers.'''
 
-        if self.__watch_dog.is_alive():
+        if self.alive():
             logger.warning("trying to start workers, but they are already running")
             return
 
-        self.__stop.clear()
-        self.__watch_dog.start()
+        self.__started = True
+
+        if self.__executor == 'process':
+
+            # the parent writes to (or, when dying, closes) the control pipe
+            # to wake up the watchdog, the watchdog holds the write end of the
+            # life pipe until it exits
+            self.__control_pipe = os.pipe()
+            self.__life_pipe = os.pipe()
+            _control_pipes.add(self.__control_pipe[1])
+
+            self.__watch_dog.start()
+
+            os.close(self.__life_pipe[1])
+
+        else:
+
+            self.__stop.clear()
+            self.__start_thread_workers()
 
     def get(self, timeout=0):
         '''Return the next result from the producer pool.
@@ -44,21 +198,26 @@ class ProducerPool(object):
         seconds, exception NoResult is raised.
         '''
 
-        block = False
-        if timeout == 0:
-            timeout = 1
-            block = True
+        return self.__get(None if timeout == 0 else timeout)
+
+    def get_nowait(self):
+        '''Return the next result from the producer pool, if there is one.
+        Raises NoResult otherwise.'''
+
+        return self.__get(0)
+
+    def __get(self, timeout):
 
         item = None
-        while item == None:
+        while item is None:
 
             if not self.alive():
                 raise WorkersDied()
 
             try:
-                item = self.__result_queue.get(timeout=timeout)
+                item = self.__get_item(timeout)
             except Queue.Empty:
-                if not block:
+                if timeout is not None:
                     raise NoResult()
 
         if isinstance(item, Exception):
@@ -68,15 +227,109 @@ class ProducerPool(object):
     def stop(self):
         '''Stop the pool of producers.
 
-        Items currently being produced will not be waited for and be discarded.'''
+        Items currently being produced will not be waited for and be discarded.
+        Thread workers can not be terminated, for them this call waits until
+        their current item is produced.'''
+
+        if not self.__started:
+            return
+        self.__started = False
+
+        if self.__executor == 'process':
+
+            try:
+                os.write(self.__control_pipe[1], b'x')
+            except OSError:
+                pass
+            self.__watch_dog.join()
+
+            _control_pipes.discard(self.__control_pipe[1])
+            for fd in self.__control_pipe + (self.__life_pipe[0],):
+                os.close(fd)
+
+        else:
+
+            self.__stop.set()
+            for worker in list(self.__workers):
+                while worker is not None and worker.is_alive():
+                    # unblock workers waiting to place their result
+                    self.__drain()
+                    worker.join(0.1)
+
+    def set_num_workers(self, num_workers):
+        '''Change the number of running workers. Workers are added or retired
+        in the order of the callables, i.e., worker ``i`` runs if ``i <
+        num_workers``. Retired workers exit after finishing their current
+        item. The number is clamped to the number of callables.'''
+
+        num_workers = max(0, min(num_workers, len(self.__callables)))
+
+        if self.__executor == 'process':
+
+            self.__num_workers.value = num_workers
+            if self.__started:
+                # wake up the watchdog to start new workers
+                os.write(self.__control_pipe[1], b'r')
+
+        else:
+
+            with self.__resize_lock:
+                self.__num_workers.value = num_workers
+            if self.__started:
+                self.__start_thread_workers()
+
+    def get_num_workers(self):
+        '''Get the number of workers that should be running.'''
+        return self.__num_workers.value
 
-        self.__stop.set()
-        self.__watch_dog.join()
+    def get_configuration(self):
+        '''Get a dictionary describing how the workers are run.'''
+
+        return {
+            'executor': self.__executor,
+            'num_workers': self.__num_workers.value,
+            'max_workers': len(self.__callables),
+            'cpu_sets': self.__cpu_sets,
+            'num_threads': self.__num_threads
+        }
+
+    def get_restarts(self):
+        '''Get the number of times each worker has been restarted.'''
+        return list(self.__restarts)
 
     def alive(self):
-        '''Test if the pool is alive (i.e., all workers are running).
+        '''Test if the pool is alive (i.e., all workers are running or being
+        restarted).
         '''
-        return self.__watch_dog.is_alive()
+
+        if self.__executor == 'process':
+            return self.__watch_dog.is_alive()
+
+        # thread workers catch all exceptions and only exit when retired
+        return self.__started and not self.__stop.is_set()
+
+    def __get_item(self, timeout):
+
+        if self.__executor == 'thread':
+            return self.__result_queue.get(timeout=timeout)
+
+        # wait for a result or the end of the watchdog, whatever comes first
+        readable = _wait(
+            [self.__result_queue._reader, self.__life_pipe[0]],
+            timeout)
+
+        if self.__result_queue._reader not in readable:
+            raise Queue.Empty()
+
+        return self.__result_queue.get()
+
+    def __drain(self):
+
+        try:
+            while True:
+                self.__result_queue.get_nowait()
+        except Queue.Empty:
+            pass
 
     def __run_watch_dog(self, callables):
 
@@ -85,26 +338,54 @@ class ProducerPool(object):
         logger.debug("watchdog started with PID " + str(os.getpid()))
         logger.debug("parent PID " + str(parent_pid))
 
-        workers = [ multiprocessing.Process(target=self.__run_worker, args=(c,)) for c in callables ]
+        for fd in _control_pipes:
+            os.close(fd)
+        # the numbers of the closed fds get reused, pools started in this
+        # process (or its workers) must not close them again
+        _control_pipes.clear()
+        os.close(self.__life_pipe[0])
+
+        # get woken up whenever a worker exits
+        self.__wakeup_pipe = os.pipe()
+        flags = fcntl.fcntl(self.__wakeup_pipe[1], fcntl.F_GETFL)
+        fcntl.fcntl(self.__wakeup_pipe[1], fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        signal.signal(signal.SIGCHLD, _ignore_signal)
+        signal.set_wakeup_fd(self.__wakeup_pipe[1])
+
+        # retired (or not yet started) workers are None
+        workers = [ None ]*len(callables)
 
         try:
 
-            logger.debug("starting %d workers"%len(workers))
-            for worker in workers:
-                worker.start()
+            logger.debug("starting %d workers"%self.__num_workers.value)
+            self.__restart_dead_workers(workers, callables)
 
-            while not self.__stop.wait(1):
-                if os.getppid() != parent_pid:
-                    logger.error("parent of producer pool died, shutting down")
-                    break
-                if not self.__all_workers_alive(workers):
-                    logger.error("at least one of my workers died, shutting down")
+            while True:
+
+                readable = _wait([self.__control_pipe[0], self.__wakeup_pipe[0]])
+
+                if self.__control_pipe[0] in readable:
+                    # EOF if the parent died, 'x' for stop, 'r' for resize
+                    message = os.read(self.__control_pipe[0], 1024)
+                    if not message:
+                        logger.error("parent of producer pool died, shutting down")
+                        break
+                    if b'x' in message:
+                        break
+
+                if self.__wakeup_pipe[0] in readable:
+                    os.read(self.__wakeup_pipe[0], 1024)
+
+                if not self.__restart_dead_workers(workers, callables):
+                    logger.error("at least one of my workers died and the restart budget is used up, shutting down")
                     break
         except:
             pass
 
         finally:
 
+            workers = [ worker for worker in workers if worker is not None ]
+
             logger.info("terminating workers...")
             for worker in workers:
                 worker.terminate()
@@ -115,42 +396,254 @@ class ProducerPool(object):
 
             logger.info("done")
 
-    def __run_worker(self, target):
+    def __run_worker(self, index, target):
+
+        # don't inherit the watchdog's pipes and signal handling
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        for fd in self.__wakeup_pipe + (self.__control_pipe[0], self.__life_pipe[1]):
+            os.close(fd)
+
+        # get killed when the watchdog dies, instead of waiting forever for
+        # space in the result queue
+        _set_parent_death_signal(signal.SIGKILL)
+
+        self.__apply_cpu_set(index)
+        if self.__num_threads is not None:
+            _limit_threads(self.__num_threads)
 
         parent_pid = os.getppid()
 
         logger.debug("worker started with PID " + str(os.getpid()))
         logger.debug("parent PID " + str(parent_pid))
 
-        result = None
         while True:
 
             if os.getppid() != parent_pid:
                 logger.debug("worker %d: watch-dog died, stopping"%os.getpid())
                 break
 
-            if result is None:
+            if index >= self.__num_workers.value:
+                logger.debug("worker %d retires", index)
+                # the queue's feeder thread might still hold the previous
+                # result, flush it before _exit kills the thread (waits
+                # while the queue is full)
+                self.__result_queue.close()
+                self.__result_queue.join_thread()
+                # exit code 0 tells the watchdog not to count this as a death
+                os._exit(0)
+
+            try:
+                result = target()
+            except Exception as e:
+                result = e
+                traceback.print_exc()
+                # don't stop on normal exceptions -- place them in result queue 
+                # and let them be handled by caller
+            except:
+                logger.error("received error: " + str(sys.exc_info()[0]))
+                # this is most likely a keyboard interrupt, stop process
+                break
+
+            # blocks while the result queue is full
+            self.__result_queue.put(result)
 
-                try:
-                    result = target()
-                except Exception as e:
-                    result = e
-                    traceback.print_exc()
-                    # don't stop on normal exceptions -- place them in result queue 
-                    # and let them be handled by caller
-                except:
-                    logger.error("received error: " + str(sys.exc_info()[0]))
-                    # this is most likely a keyboard interrupt, stop process
+        logger.debug("worker with PID " + str(os.getpid()) + " exiting")
+        os._exit(1)
+
+    def __run_thread_worker(self, index, target):
+
+        logger.debug("worker thread %s started", threading.current_thread().name)
+
+        self.__apply_cpu_set(index)
+
+        while not self.__stop.is_set():
+
+            with self.__resize_lock:
+                if index >= self.__num_workers.value:
+                    logger.debug("worker %d retires", index)
+                    self.__workers[index] = None
                     break
 
             try:
-                self.__result_queue.put(result, timeout=1)
-                result = None
+                result = target()
+            except Exception as e:
+                result = e
+                traceback.print_exc()
+
+            if result is None:
+                continue
+
+            # blocks while the result queue is full, stop() drains the queue
+            self.__result_queue.put(result)
+
+        logger.debug("worker thread %s exiting", threading.current_thread().name)
+
+    def __apply_cpu_set(self, index):
+
+        if self.__cpu_sets is None:
+            return
+
+        cpu_set = self.__cpu_sets[index%len(self.__cpu_sets)]
+
+        _set_cpu_affinity(cpu_set)
+        logger.debug("worker %d runs on CPUs %s", index, cpu_set)
+
+    def __start_thread_workers(self):
+
+        with self.__resize_lock:
+            for i in range(self.__num_workers.value):
+                if self.__workers[i] is not None:
+                    continue
+                worker = threading.Thread(
+                    target=self.__run_thread_worker,
+                    args=(i, self.__callables[i]))
+                worker.daemon = True
+                worker.start()
+                self.__workers[i] = worker
+
+    def __restart_dead_workers(self, workers, callables):
+        '''Start workers that are missing, restart workers that died. Returns
+        ``False`` if a worker died but can not be restarted anymore.'''
+
+        num_workers = self.__num_workers.value
+
+        for i, worker in enumerate(workers):
+
+            if worker is not None and worker.is_alive():
+                continue
+
+            # workers that are not running yet or exited after retiring
+            retired = worker is None or worker.exitcode == 0
+            if worker is not None:
+                worker.join()
+                workers[i] = None
+
+            if i >= num_workers:
+                continue
+
+            if not retired:
+
+                if sum(self.__restarts) >= self.__max_restarts:
+                    return False
+
+                logger.warning(
+                    "worker %d (PID %d) died with exit code %s, restarting it",
+                    i, worker.pid, worker.exitcode)
+
+            workers[i] = multiprocessing.Process(
+                target=self.__run_worker,
+                args=(i, callables[i]))
+            workers[i].start()
+
+            if retired:
+                continue
+
+            with self.__restarts.get_lock():
+                self.__restarts[i] += 1
+
+            # notify the consumer, unless the queue is full anyway
+            try:
+                self.__result_queue.put_nowait(WorkerRestarted(i))
             except Queue.Full:
-                logger.debug("worker %d: result queue is full, waiting to place my result"%os.getpid())
+                pass
 
-        logger.debug("worker with PID " + str(os.getpid()) + " exiting")
-        os._exit(1)
+        return True
+
+def _wait(fds, timeout=None):
+    '''Wait until at least one of the given file descriptors (or objects with
+    a ``fileno()`` method) is readable. Returns the readable ones.'''
+
+    while True:
+        try:
+            readable, _, _ = select.select(fds, [], [], timeout)
+            return readable
+        except (select.error, OSError) as e:
+            if e.args[0] != errno.EINTR:
+                raise
+
+def _limit_threads(num_threads):
+    '''Limit the number of threads native libraries use in this process.'''
+
+    for variable in _thread_limit_variables:
+        os.environ[variable] = str(num_threads)
+
+    # libraries already loaded have read the environment variables before
+    if not isinstance(threadpoolctl, NoSuchModule):
+        threadpoolctl.threadpool_limits(num_threads)
+
+def _get_libc():
+
+    if not sys.platform.startswith('linux'):
+        return None
+
+    try:
+        # libc is already loaded into the interpreter
+        libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return None
+
+    if not hasattr(libc, 'sched_setaffinity'):
+        return None
+
+    return libc
+
+def _can_set_cpu_affinity():
+
+    return hasattr(os, 'sched_setaffinity') or _get_libc() is not None
+
+# CPU masks passed to the C library, large enough for the default CPU_SETSIZE
+# of glibc
+_cpu_mask_size = 1024
+_cpu_mask_bits = 8*ctypes.sizeof(ctypes.c_ulong)
+_cpu_mask_type = ctypes.c_ulong*(_cpu_mask_size//_cpu_mask_bits)
+
+def _set_cpu_affinity(cpus):
+    '''Pin the calling thread to the given CPUs.'''
+
+    # on Linux, PID 0 refers to the calling thread
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+        return
+
+    mask = _cpu_mask_type()
+    for cpu in cpus:
+        assert 0 <= cpu < _cpu_mask_size, "invalid CPU %d"%cpu
+        mask[cpu//_cpu_mask_bits] |= 1 << (cpu%_cpu_mask_bits)
+
+    if _get_libc().sched_setaffinity(0, ctypes.sizeof(mask), mask) != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+
+def _get_cpu_affinity():
+    '''Get the CPUs the calling thread can run on.'''
+
+    if hasattr(os, 'sched_getaffinity'):
+        return os.sched_getaffinity(0)
+
+    mask = _cpu_mask_type()
+    if _get_libc().sched_getaffinity(0, ctypes.sizeof(mask), mask) != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+
+    return set(
+        cpu
+        for cpu in range(_cpu_mask_size)
+        if mask[cpu//_cpu_mask_bits] & (1 << (cpu%_cpu_mask_bits)))
+
+def _ignore_signal(signum, frame):
+    pass
+
+def _set_parent_death_signal(signum):
+    '''Ask the kernel to send ``signum`` to this process when its parent dies.
+    Only supported on Linux, no-op elsewhere.'''
+
+    if not sys.platform.startswith('linux'):
+        return
 
-    def __all_workers_alive(self, workers):
-        return all([ worker.is_alive() for worker in workers ])
+    try:
+        # libc is already loaded into the interpreter
+        PR_SET_PDEATHSIG = 1
+        ctypes.CDLL(None).prctl(PR_SET_PDEATHSIG, signum)
+    except (OSError, AttributeError):
+        logger.debug("could not set parent death signal")
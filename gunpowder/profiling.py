@@ -1,30 +1,65 @@
-import copy
-import numpy as np
+import math
+import os
+import threading
 import time
 
 from .freezable import Freezable
 
-class Timing(Freezable):
-
-    def __init__(self, node, method_name=None):
+# monotonic wall clock with high resolution, the same for all processes on a
+# machine
+_wall_clock = getattr(time, 'perf_counter', time.time)
+
+# CPU time of the calling thread (or process, if not available)
+_cpu_clock = getattr(
+    time, 'thread_time', getattr(
+        time, 'process_time', time.clock if hasattr(time, 'clock') else None))
+
+# relative accuracy of the quantiles reported by TimingSummary
+_quantile_accuracy = 0.01
+_gamma = (1 + _quantile_accuracy)/(1 - _quantile_accuracy)
+_log_gamma = math.log(_gamma)
+
+class Timing(object):
+
+    __slots__ = (
+        '__name',
+        '__method_name',
+        '__start',
+        '__cpu_start',
+        '__first_start',
+        '__last_stop',
+        '__time',
+        '__cpu_time',
+        '__cpu')
+
+    def __init__(self, node, method_name=None, cpu=True):
+        '''If ``cpu`` is not set, only the wall time is measured. This is
+        needed for timings that are stopped in another thread or process than
+        the one that started them.'''
         self.__name = type(node).__name__
         self.__method_name = method_name
         self.__start = 0
+        self.__cpu_start = 0
         self.__first_start = 0
         self.__last_stop = 0
         self.__time = 0
-        self.freeze()
+        self.__cpu_time = 0
+        self.__cpu = cpu
 
     def start(self):
-        self.__start = time.time()
+        self.__start = _wall_clock()
+        if self.__cpu:
+            self.__cpu_start = _cpu_clock()
         if self.__first_start == 0:
             self.__first_start = self.__start
 
     def stop(self):
         if self.__start == 0:
             return
-        t = time.time()
+        t = _wall_clock()
         self.__time += (t - self.__start)
+        if self.__cpu:
+            self.__cpu_time += (_cpu_clock() - self.__cpu_start)
         self.__start = 0
         self.__last_stop = t
 
@@ -34,7 +69,19 @@ class Timing(Freezable):
         if self.__start == 0:
             return self.__time
 
-        return self.__time + (time.time() - self.__start)
+        return self.__time + (_wall_clock() - self.__start)
+
+    def cpu_time(self):
+        '''Accumulated CPU time of the calling thread between calls to start()
+        and stop(), ``None`` if only the wall time is measured.'''
+
+        if not self.__cpu:
+            return None
+
+        if self.__start == 0:
+            return self.__cpu_time
+
+        return self.__cpu_time + (_cpu_clock() - self.__cpu_start)
 
     def span(self):
         '''Timestamps of the first call to start() and last call to stop().'''
@@ -46,43 +93,161 @@ class Timing(Freezable):
     def get_method_name(self):
         return self.__method_name
 
-class TimingSummary(Freezable):
-    '''Holds repeated Timings of the same node/method to be queried for statistics.'''
+class TimingSummary(object):
+    '''Statistics over repeated Timings of the same node/method.
+
+    Individual timings are not stored. Instead, the summary keeps counts, sums,
+    extrema, and a histogram with logarithmically sized bins (which estimates
+    quantiles with a relative error of at most 1%). The size of a summary does
+    therefore not grow with the number of timings, and merging two summaries
+    takes constant time.
+    '''
+
+    __slots__ = (
+        '__count',
+        '__sum',
+        '__cpu_sum',
+        '__cpu_count',
+        '__min',
+        '__max',
+        '__first_start',
+        '__last_stop',
+        '__bins')
 
     def __init__(self):
-        self.timings = []
-        self.times = []
-        self.freeze()
+        self.__count = 0
+        self.__sum = 0.0
+        self.__cpu_sum = 0.0
+        self.__cpu_count = 0
+        self.__min = float('inf')
+        self.__max = float('-inf')
+        self.__first_start = float('inf')
+        self.__last_stop = float('-inf')
+        # bin index -> count, bin None holds zero times
+        self.__bins = {}
 
     def add(self, timing):
         '''Add a Timing to this summary.'''
-        self.timings.append(timing)
-        self.times.append(timing.elapsed())
+
+        elapsed = timing.elapsed()
+        first_start, last_stop = timing.span()
+
+        self.__count += 1
+        self.__sum += elapsed
+        cpu_time = timing.cpu_time()
+        if cpu_time is not None:
+            self.__cpu_sum += cpu_time
+            self.__cpu_count += 1
+        self.__min = min(self.__min, elapsed)
+        self.__max = max(self.__max, elapsed)
+        self.__first_start = min(self.__first_start, first_start)
+        self.__last_stop = max(self.__last_stop, last_stop)
+
+        if elapsed > 0:
+            b = int(math.ceil(math.log(elapsed)/_log_gamma))
+        else:
+            b = None
+        self.__bins[b] = self.__bins.get(b, 0) + 1
 
     def merge(self, other):
         '''Merge another summary into this one.'''
-        for timing in other.timings:
-            self.add(timing)
+
+        self.__count += other.__count
+        self.__sum += other.__sum
+        self.__cpu_sum += other.__cpu_sum
+        self.__cpu_count += other.__cpu_count
+        self.__min = min(self.__min, other.__min)
+        self.__max = max(self.__max, other.__max)
+        self.__first_start = min(self.__first_start, other.__first_start)
+        self.__last_stop = max(self.__last_stop, other.__last_stop)
+
+        for b, count in other.__bins.items():
+            self.__bins[b] = self.__bins.get(b, 0) + count
+
+    def copy(self):
+
+        other = TimingSummary()
+        other.merge(self)
+        return other
 
     def counts(self):
-        return len(self.times)
+        return self.__count
 
     def min(self):
-        return np.min(self.times)
+        return self.__min
 
     def max(self):
-        return np.max(self.times)
+        return self.__max
 
     def mean(self):
-        return np.mean(self.times)
+        return self.__sum/self.__count
 
     def median(self):
-        return np.median(self.times)
+        return self.quantile(0.5)
+
+    def quantile(self, q):
+        '''Estimate the ``q``-quantile of the times, for ``q`` in ``[0,1]``.'''
+
+        rank = q*(self.__count - 1)
+
+        cumulative = 0
+        for b in sorted(self.__bins, key=lambda b: float('-inf') if b is None else b):
+            cumulative += self.__bins[b]
+            if cumulative > rank:
+                if b is None:
+                    return 0.0
+                value = 2.0*_gamma**b/(_gamma + 1)
+                return max(self.__min, min(self.__max, value))
+
+        return self.__max
+
+    def total(self):
+        '''Sum of all times.'''
+        return self.__sum
+
+    def cpu_total(self):
+        '''Sum of all CPU times (of Timings that measured CPU time).'''
+        return self.__cpu_sum
+
+    def cpu_mean(self):
+        '''Mean CPU time of the Timings that measured CPU time, ``None`` if
+        none did.'''
+        if self.__cpu_count == 0:
+            return None
+        return self.__cpu_sum/self.__cpu_count
+
+    def span(self):
+        '''Timestamps of the first call to start() and last call to stop() over
+        all Timings added.'''
+        return self.__first_start, self.__last_stop
+
+    def __getstate__(self):
+        return (
+            self.__count, self.__sum, self.__cpu_sum, self.__cpu_count,
+            self.__min, self.__max, self.__first_start, self.__last_stop,
+            self.__bins)
+
+    def __setstate__(self, state):
+        (
+            self.__count, self.__sum, self.__cpu_sum, self.__cpu_count,
+            self.__min, self.__max, self.__first_start, self.__last_stop,
+            self.__bins) = state
 
 class ProfilingStats(Freezable):
+    '''Profiling statistics of a batch, or accumulated over several batches.
+
+    Besides the :class:`TimingSummaries<TimingSummary>`, the statistics of a
+    batch keep one event per added :class:`Timing`, a tuple ``(node_name,
+    method_name, start, stop, pid, thread_id)``, such that the spans of a
+    single batch can be put on a timeline (see :class:`WriteChromeTrace`).
+    Events are not merged into accumulated statistics.
+    '''
 
     def __init__(self):
         self.__summaries = {}
+        self.__configurations = {}
+        self.__counters = {}
+        self.__events = []
         self.freeze()
 
     def add(self, timing):
@@ -94,16 +259,56 @@ class ProfilingStats(Freezable):
 
         if id not in self.__summaries:
             self.__summaries[id] = TimingSummary()
-        self.__summaries[id].add(copy.deepcopy(timing))
+        self.__summaries[id].add(timing)
+
+        start, stop = timing.span()
+        if start > 0:
+            self.__events.append((
+                node_name,
+                method_name,
+                start,
+                stop,
+                os.getpid(),
+                threading.current_thread().ident))
+
+    def get_events(self):
+        '''Get the events of the timings added to this instance.'''
+        return self.__events
 
     def merge_with(self, other):
         '''Combine statitics of two ProfilingStats.'''
 
         for id, summary in other.__summaries.items():
             if id in self.__summaries:
-                self.__summaries[id].merge(copy.deepcopy(summary))
+                self.__summaries[id].merge(summary)
             else:
-                self.__summaries[id] = copy.deepcopy(summary)
+                self.__summaries[id] = summary.copy()
+
+        self.__configurations.update(other.__configurations)
+
+        for id, value in other.__counters.items():
+            self.__counters[id] = self.__counters.get(id, 0) + value
+
+    def add_to_counter(self, node_name, counter_name, value=1):
+        '''Increase a counter of a node (e.g., cache hits) by ``value``.
+        Counters are summed when merging ProfilingStats.'''
+
+        id = (node_name, counter_name)
+        self.__counters[id] = self.__counters.get(id, 0) + value
+
+    def get_counters(self):
+        '''Get a dictionary (node_name,counter_name) -> value.'''
+        return self.__counters
+
+    def set_configuration(self, node_name, configuration):
+        '''Record how a node was configured (e.g., how many workers it used),
+        as a dictionary of settings.'''
+
+        self.__configurations[node_name] = configuration
+
+    def get_configurations(self):
+        '''Get a dictionary node_name -> configuration.'''
+        return self.__configurations
 
     def get_timing_summaries(self):
         '''Get a dictionary (node_name,method_name) -> TimingSummary.'''
@@ -118,17 +323,17 @@ class ProfilingStats(Freezable):
         return self.__summaries[(node_name,method_name)]
 
     def span(self):
-        '''Timestamps of the first call to start() and last call to stop() over 
+        '''Timestamps of the first call to start() and last call to stop() over
         all Timings added.'''
 
-        spans = [t.span() for (_, summary) in self.__summaries.items() for t in summary.timings]
+        spans = [summary.span() for summary in self.__summaries.values()]
         first_start = min([span[0] for span in spans])
         last_stop = max([span[1] for span in spans])
 
         return first_start, last_stop
 
     def span_time(self):
-        '''Time between the first call to start() and last call to stop() over 
+        '''Time between the first call to start() and last call to stop() over
         any timing.'''
 
         start, stop = self.span()
@@ -128,6 +128,31 @@ class ProviderSpec(Freezable):
                 "Only ArrayKey or PointsKey can be used as keys in a "
                 "%s."%type(self).__name__)
 
+    def copy(self):
+        '''Create a copy of this spec.
+
+        Only the contained specs are copied, which is considerably cheaper than
+        a ``deepcopy``.
+        '''
+
+        provider_spec = type(self).__new__(type(self))
+        provider_spec.__dict__.update(self.__dict__)
+        provider_spec.array_specs = {
+            key: spec.copy()
+            for key, spec in self.array_specs.items()
+        }
+        provider_spec.points_specs = {
+            key: spec.copy()
+            for key, spec in self.points_specs.items()
+        }
+        return provider_spec
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
     def items(self):
         '''Provides a generator iterating over key/value pairs.'''
 
@@ -1,4 +1,3 @@
-import copy
 from .coordinate import Coordinate
 from .freezable import Freezable
 import numbers
@@ -321,7 +320,17 @@ class Roi(Freezable):
 
     def copy(self):
         '''Create a copy of this ROI.'''
-        return copy.deepcopy(self)
+
+        # offset and shape are immutable Coordinates, they can be shared
+        roi = type(self).__new__(type(self))
+        roi.__dict__.update(self.__dict__)
+        return roi
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return self.copy()
 
     def __add__(self, other):
 
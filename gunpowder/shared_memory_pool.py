@@ -0,0 +1,147 @@
+try:
+    import Queue
+except:
+    import queue as Queue
+import ctypes
+import logging
+import multiprocessing
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class SharedMemoryPool(object):
+    '''A pool of reusable shared memory slabs to transport the array data of
+    :class:`Batches<Batch>` between processes without pickling.
+
+    The pool has to be created before the worker processes are forked. A
+    worker calls :func:`pack` on a batch, which copies the data of all arrays
+    into a free slab and strips them from the batch. Only the (small) rest of
+    the batch is sent through the result queue. The consumer calls
+    :func:`unpack`, which replaces the array data with numpy views into the
+    slab. The slab is returned to the pool as soon as the last of these views
+    is garbage collected.
+
+    If no slab is free or the batch does not fit into a slab, :func:`pack`
+    returns the batch unchanged, such that it will be pickled as usual.
+
+    Args:
+
+        num_slabs (``int``):
+
+            How many slabs to allocate.
+
+        slab_size (``int``):
+
+            The size of each slab in bytes.
+    '''
+
+    # alignment of each array inside a slab, in bytes
+    alignment = 64
+
+    def __init__(self, num_slabs, slab_size):
+
+        self.num_slabs = num_slabs
+        self.slab_size = slab_size
+        self.__slabs = [
+            multiprocessing.RawArray(ctypes.c_char, slab_size)
+            for _ in range(num_slabs)
+        ]
+        self.__free_slabs = multiprocessing.Queue()
+        for i in range(num_slabs):
+            self.__free_slabs.put(i)
+
+        logger.debug(
+            "allocated %d shared memory slabs of %d bytes",
+            num_slabs, slab_size)
+
+    def pack(self, batch):
+        '''Move the array data of ``batch`` into a free slab. Returns a
+        :class:`PackedBatch` on success, or ``batch`` if it can not be
+        transported through shared memory.'''
+
+        layout = {}
+        size = 0
+        for key, array in batch.arrays.items():
+            data = array.data
+            if data.dtype.hasobject or data.dtype.fields is not None:
+                return batch
+            layout[key] = (size, data.shape, data.dtype.str)
+            size += self.__aligned(data.nbytes)
+
+        if size > self.slab_size:
+            logger.debug(
+                "batch of %d bytes does not fit into shared memory slab of %d "
+                "bytes", size, self.slab_size)
+            return batch
+
+        try:
+            slab = self.__free_slabs.get_nowait()
+        except Queue.Empty:
+            logger.debug("no free shared memory slab, sending batch as is")
+            return batch
+
+        for key, array in batch.arrays.items():
+            offset, shape, dtype = layout[key]
+            target = np.asarray(_SlabView(self.__address(slab, offset), shape, dtype))
+            target[...] = array.data
+            array.data = None
+
+        return PackedBatch(batch, slab, layout)
+
+    def unpack(self, batch):
+        '''Restore the array data of a :class:`PackedBatch` as views into its
+        slab. Returns the restored :class:`Batch`. Other batches are returned
+        as they are.'''
+
+        if not isinstance(batch, PackedBatch):
+            return batch
+
+        lease = _SlabLease(self, batch.slab)
+        for key, (offset, shape, dtype) in batch.layout.items():
+            batch.batch.arrays[key].data = np.asarray(
+                _SlabView(self.__address(batch.slab, offset), shape, dtype, lease))
+
+        return batch.batch
+
+    def release(self, slab):
+        '''Return a slab to the pool.'''
+        self.__free_slabs.put(slab)
+
+    def __address(self, slab, offset):
+        return ctypes.addressof(self.__slabs[slab]) + offset
+
+    def __aligned(self, nbytes):
+        return (nbytes + self.alignment - 1)//self.alignment*self.alignment
+
+class PackedBatch(object):
+    '''A :class:`Batch` whose array data was moved into a shared memory slab.
+    '''
+
+    def __init__(self, batch, slab, layout):
+        self.batch = batch
+        self.slab = slab
+        self.layout = layout
+
+class _SlabLease(object):
+    '''Returns a slab to the pool when garbage collected.'''
+
+    def __init__(self, pool, slab):
+        self.pool = pool
+        self.slab = slab
+
+    def __del__(self):
+        self.pool.release(self.slab)
+
+class _SlabView(object):
+    '''Exposes a region of a slab to numpy. Arrays created from this object
+    (and all views derived from them) keep a reference to it, and thus to the
+    lease of the slab.'''
+
+    def __init__(self, address, shape, dtype, lease=None):
+        self.lease = lease
+        self.__array_interface__ = {
+            'shape': tuple(shape),
+            'typestr': dtype,
+            'data': (address, False),
+            'version': 3
+        }
@@ -0,0 +1,61 @@
+import os
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+# thread pools inherited through a fork, their threads do not exist in the
+# child process. They are kept here, since cleaning them up after garbage
+# collection could block on locks held by the parent's threads.
+_inherited_pools = []
+
+class ProcessThreadPool(object):
+    '''A ``multiprocessing.pool.ThreadPool`` that is started lazily by each
+    process using it.
+
+    Threads do not survive a fork: a process forked from the one that started
+    the pool (e.g., a worker of :class:`PreCache`) starts a new pool on its
+    first call to :func:`get`. Threads sharing this object share the pool.
+
+    Args:
+
+        num_threads (``int``):
+
+            The number of threads of the pool. If smaller than 2, no pool is
+            started and :func:`get` returns ``None``.
+    '''
+
+    def __init__(self, num_threads):
+
+        self.num_threads = num_threads
+
+        self.__pool = None
+        self.__pid = None
+        self.__lock = threading.Lock()
+
+    def get(self):
+        '''Get the thread pool of the calling process, start it if needed.'''
+
+        if self.num_threads <= 1:
+            return None
+
+        pid = os.getpid()
+        if self.__pool is not None and self.__pid == pid:
+            return self.__pool
+
+        with self.__lock:
+            if self.__pool is None or self.__pid != pid:
+                if self.__pool is not None:
+                    _inherited_pools.append(self.__pool)
+                self.__pool = ThreadPool(self.num_threads)
+                self.__pid = pid
+
+        return self.__pool
+
+    def close(self):
+        '''Stop the threads, if they were started by the calling process.'''
+
+        if self.__pool is not None and self.__pid == os.getpid():
+            self.__pool.close()
+            self.__pool.join()
+        self.__pool = None
+        self.__pid = None
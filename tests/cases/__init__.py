@@ -4,21 +4,30 @@ from .add_affinities import TestAddAffinities
 from .add_boundary_distance_gradients import TestAddBoundaryDistanceGradients
 from .add_vector_map import TestAddVectorMap
 from .balance_labels import TestBalanceLabels
+from .batch_request import TestBatchRequest
 from .crop import TestCrop
 from .downsample import TestDownSample
 from .dvid_source import TestDvidSource
 from .elastic_augment_points import TestElasticAugment
 from .hdf5_source import TestHdf5Source
 from .hdf5_write import TestHdf5Write
+from .klb_source import TestKlbSource
+from .materialize import TestMaterialize
+from .memmap_source import TestMemmapSource
 from .merge_provider import TestMergeProvider
 from .normalize import TestNormalize
 from .pad import TestPad
 from .points_keys import TestPointsKeys
 from .precache import TestPreCache
 from .prepare_malis import TestPrepareMalis
+from .producer_pool import TestProducerPool
 from .profiling import TestProfiling
 from .provider_test import ProviderTest
 from .random_location import TestRandomLocation
 from .rasterize_points import TestRasterizePoints
+from .reject import TestReject
 from .scan import TestScan
+from .snapshot import TestSnapshot
 from .tensorflow_train import TestTensorflowTrain
+from .zarr_source import TestZarrSource
+from .zarr_write import TestZarrWrite
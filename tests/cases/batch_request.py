@@ -0,0 +1,52 @@
+from .provider_test import ProviderTest
+from gunpowder import *
+
+class ShiftRequest(BatchFilter):
+
+    def prepare(self, request):
+        request[ArrayKeys.RAW].roi.set_offset((0, 0, 0))
+
+    def process(self, batch, request):
+        batch.arrays[ArrayKeys.RAW].spec.roi = request[ArrayKeys.RAW].roi
+
+class PassRequest(BatchFilter):
+
+    def process(self, batch, request):
+        pass
+
+class TestBatchRequest(ProviderTest):
+
+    def test_copy(self):
+
+        request = BatchRequest()
+        request.add(ArrayKeys.RAW, (10, 10, 10), voxel_size=(1, 1, 1))
+        request.add(PointsKey('PRESYN'), (20, 20, 20))
+
+        copy = request.copy()
+
+        self.assertTrue(isinstance(copy, BatchRequest))
+        self.assertEqual(copy, request)
+
+        copy[ArrayKeys.RAW].roi.set_offset((1, 1, 1))
+        copy[PointsKeys.PRESYN].roi = Roi((0, 0, 0), (1, 1, 1))
+        del copy[ArrayKeys.RAW]
+
+        self.assertTrue(ArrayKeys.RAW in request)
+        self.assertEqual(request[ArrayKeys.RAW].roi, Roi((5, 5, 5), (10, 10, 10)))
+        self.assertEqual(request[PointsKeys.PRESYN].roi, Roi((0, 0, 0), (20, 20, 20)))
+
+    def test_request_unchanged(self):
+
+        pipeline = (
+            self.test_source +
+            PassRequest() +
+            ShiftRequest() +
+            PassRequest())
+
+        original_roi = self.test_request[ArrayKeys.RAW].roi.copy()
+
+        with build(pipeline):
+            batch = pipeline.request_batch(self.test_request)
+
+        self.assertEqual(self.test_request[ArrayKeys.RAW].roi, original_roi)
+        self.assertEqual(batch.arrays[ArrayKeys.RAW].spec.roi, original_roi)
@@ -1,3 +1,4 @@
+from .dvid_stand_in import DvidStandIn
 from .provider_test import ProviderTest
 from gunpowder import *
 import numpy as np
@@ -61,3 +62,81 @@ class TestDvidSource(ProviderTest):
             self.assertEqual(batch.arrays[raw].spec.voxel_size, (8, 8, 8))
             self.assertEqual(batch.arrays[seg].spec.voxel_size, (8, 8, 8))
             self.assertEqual(batch.arrays[mask].spec.voxel_size, (8, 8, 8))
+
+    def test_stand_in(self):
+
+        raw_data = np.random.randint(0, 255, size=(40, 50, 60)).astype(np.uint8)
+        seg_data = np.random.randint(0, 10, size=(40, 50, 60)).astype(np.uint64)
+        mask_data = np.zeros((40, 50, 60), dtype=np.uint8)
+        mask_data[10:30] = 1
+
+        raw = ArrayKey('RAW')
+        seg = ArrayKey('SEG')
+        mask = ArrayKey('MASK')
+
+        # DvidSource takes VoxelSize as given (in x, y, z) and shifts
+        # requests by the offset of the provided ROI, the stand-in expects
+        # absolute voxel coordinates
+        with DvidStandIn(
+                {'grayscale': raw_data, 'groundtruth': seg_data},
+                rois={'roi': mask_data},
+                offset=(10, 20, 30),
+                voxel_size=(4, 2, 1)) as server:
+
+            for cache_size in [None, 10*1024**2]:
+
+                source = DvidSource(
+                    'localhost',
+                    server.port,
+                    'abc',
+                    datasets={raw: 'grayscale', seg: 'groundtruth'},
+                    masks={mask: 'roi'},
+                    array_specs={
+                        raw: ArraySpec(interpolatable=True),
+                        seg: ArraySpec(interpolatable=False)
+                    },
+                    cache_size=cache_size,
+                    tile_shape=(16, 16, 16))
+
+                pipeline = source + PreCache(num_workers=2, cache_size=2)
+
+                with build(pipeline):
+
+                    self.assertEqual(
+                        source.spec[raw].roi,
+                        Roi((10, 40, 120), (40, 100, 240)))
+                    self.assertEqual(source.spec[raw].voxel_size, (1, 2, 4))
+                    self.assertEqual(source.spec[seg].dtype, np.uint64)
+                    self.assertEqual(source.spec[mask].roi, source.spec[raw].roi)
+
+                    for i, node in enumerate([source, source, pipeline]):
+
+                        num_requests = server.num_requests
+
+                        roi = Roi((22, 90, 260), (25, 40, 80))
+                        batch = node.request_batch(
+                            BatchRequest({
+                                raw: ArraySpec(roi=roi),
+                                seg: ArraySpec(roi=roi),
+                                mask: ArraySpec(roi=roi)
+                            })
+                        )
+
+                        # voxels (22, 45, 65) to (47, 65, 85), shifted by
+                        # the offset in DvidSource and again in the stand-in
+                        index = (slice(2, 27), slice(5, 25), slice(5, 25))
+                        self.assertTrue(np.array_equal(
+                            batch.arrays[raw].data, raw_data[index]))
+                        self.assertTrue(np.array_equal(
+                            batch.arrays[seg].data, seg_data[index]))
+                        self.assertTrue(np.array_equal(
+                            batch.arrays[mask].data, mask_data[index]))
+
+                        # the repeated request is served from the cache
+                        if cache_size is not None and i == 1:
+                            self.assertEqual(
+                                server.num_requests, num_requests)
+                            self.assertEqual(
+                                batch.profiling_stats.get_counters()[
+                                    ('DvidSource', 'cache misses')],
+                                0)
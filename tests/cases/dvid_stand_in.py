@@ -0,0 +1,192 @@
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+import json
+import socket
+import threading
+import time
+
+import numpy as np
+
+class _Server(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients (e.g., worker processes) may go away without closing their
+        # connections
+        pass
+
+class DvidStandIn(object):
+    '''A local HTTP server mimicking the DVID endpoints used by
+    :class:`DvidSource`: ``info`` and ``raw`` of grayscale (``uint8blk``) and
+    label (``labelblk``) instances, and ``mask`` of ROIs.
+
+    Args:
+
+        instances (``dict``, ``string`` -> ``ndarray``):
+
+            The data instances to serve, in z, y, x order.
+
+        rois (``dict``, ``string`` -> ``ndarray``):
+
+            The ROIs to serve, as binary masks in z, y, x order.
+
+        offset (``tuple`` of ``int``):
+
+            The offset of all instances and ROIs in voxels (z, y, x).
+
+        voxel_size (``tuple`` of ``int``):
+
+            The voxel size to report (z, y, x).
+
+        latency (``float``):
+
+            Seconds to wait before answering a data request, to simulate a
+            remote server.
+
+    Use as a context manager, the port of the server is in ``port``. The
+    number of data requests served is counted in ``num_requests``.
+    '''
+
+    def __init__(
+            self,
+            instances,
+            rois=None,
+            offset=(0, 0, 0),
+            voxel_size=(1, 1, 1),
+            latency=0):
+
+        self.instances = instances
+        self.rois = rois if rois is not None else {}
+        self.offset = np.array(offset)
+        self.voxel_size = voxel_size
+        self.latency = latency
+        self.num_requests = 0
+        self.port = None
+
+        self.__lock = threading.Lock()
+        self.__connections = []
+        self.__server = None
+        self.__thread = None
+
+    def __enter__(self):
+
+        stand_in = self
+        lock = self.__lock
+        connections = self.__connections
+
+        class Handler(BaseHTTPRequestHandler):
+
+            protocol_version = 'HTTP/1.1'
+
+            # like DVID, don't delay small writes (the status line and
+            # headers) waiting for ACKs
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                with lock:
+                    connections.append(self.connection)
+
+            def do_GET(self):
+
+                try:
+                    status, body = stand_in._answer(self.path)
+                except Exception as e:
+                    status, body = 400, str(e).encode('utf-8')
+
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.__server = _Server(('localhost', 0), Handler)
+        self.port = self.__server.server_address[1]
+        self.__thread = threading.Thread(target=self.__server.serve_forever)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+        return self
+
+    def __exit__(self, *args):
+
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__thread.join()
+
+        # end kept-alive connections, such that their handler threads finish
+        with self.__lock:
+            for connection in self.__connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+
+    def _answer(self, path):
+
+        # /api/node/<uuid>/<name>/<endpoint>/...
+        parts = path.strip('/').split('/')
+        name, endpoint, args = parts[3], parts[4], parts[5:]
+
+        if endpoint == 'info':
+            return 200, json.dumps(self.__info(name)).encode('utf-8')
+
+        if endpoint == 'raw':
+            data = self.instances[name]
+        elif endpoint == 'mask':
+            data = self.rois[name]
+        else:
+            return 404, b'unknown endpoint'
+
+        with self.__lock:
+            self.num_requests += 1
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        # <axes>/<size>/<offset>, both in x, y, z
+        size = np.array([int(s) for s in args[1].split('_')][::-1])
+        begin = np.array([int(o) for o in args[2].split('_')][::-1])
+
+        # zero outside of the data, like DVID
+        out = np.zeros(size, dtype=data.dtype)
+        begin = begin - self.offset
+        lo = np.maximum(begin, 0)
+        hi = np.minimum(begin + size, data.shape)
+        if np.all(hi > lo):
+            out[tuple(slice(l - b, h - b) for l, h, b in zip(lo, hi, begin))] = \
+                data[tuple(slice(l, h) for l, h in zip(lo, hi))]
+
+        return 200, out.tobytes()
+
+    def __info(self, name):
+
+        data = self.instances[name]
+
+        if data.dtype == np.uint8:
+            type_name = 'uint8blk'
+        else:
+            type_name = 'labelblk'
+
+        return {
+            'Base': {
+                'TypeName': type_name,
+                'Name': name
+            },
+            'Extended': {
+                'Values': [{'DataType': data.dtype.name}],
+                'BlockSize': [32, 32, 32],
+                'VoxelSize': list(self.voxel_size[::-1]),
+                'MinPoint': [int(o) for o in self.offset[::-1]],
+                'MaxPoint': [
+                    int(o + s)
+                    for o, s in zip(self.offset, data.shape)][::-1]
+            }
+        }
@@ -140,3 +140,80 @@ class TestElasticAugment(unittest.TestCase):
                     loc = Coordinate(int(round(x)) for x in loc)
                     if labels_data_roi.contains(loc):
                         self.assertEqual(labels.data[loc], i)
+
+    def test_pool(self):
+
+        test_labels = ArrayKey('TEST_LABELS')
+        test_points = PointsKey('TEST_POINTS')
+
+        # without jitter and rotation, transformations drawn from the pool
+        # have to be the identity, even if cropped and mirrored
+        elastic_augment = ElasticAugment(
+            [10, 10, 10],
+            [0, 0, 0],
+            [0, 0],
+            pool_size=3,
+            pool_refresh=2,
+            pool_margin=(2, 4, 4),
+            pool_mirror=True)
+
+        source = PointTestSource3D()
+        pipeline = source + elastic_augment
+
+        request_roi = Roi(
+            (-20, -20, -20),
+            (40, 40, 40))
+
+        request = BatchRequest()
+        request[test_labels] = ArraySpec(roi=request_roi)
+        request[test_points] = PointsSpec(roi=request_roi)
+
+        with build(pipeline):
+
+            expected = source.request_batch(request)
+
+            for _ in range(10):
+
+                batch = pipeline.request_batch(request)
+
+                self.assertTrue(np.array_equal(
+                    batch.arrays[test_labels].data,
+                    expected.arrays[test_labels].data))
+                self.assertEqual(
+                    sorted(batch.points[test_points].data.keys()),
+                    sorted(expected.points[test_points].data.keys()))
+
+            pools = list(elastic_augment.transformation_pools.values())
+            self.assertEqual(len(pools), 1)
+            self.assertEqual(len(pools[0]), 3)
+
+        # thread workers of PreCache share the pools
+        elastic_augment = ElasticAugment(
+            [10, 10, 10],
+            [0, 0, 0],
+            [0, 0],
+            pool_size=3,
+            pool_refresh=2,
+            pool_margin=(2, 4, 4),
+            pool_mirror=True)
+        pipeline = (
+            PointTestSource3D() +
+            elastic_augment +
+            PreCache(
+                cache_size=8,
+                num_workers=4,
+                executor='thread'))
+
+        with build(pipeline):
+
+            for _ in range(20):
+
+                batch = pipeline.request_batch(request)
+
+                self.assertTrue(np.array_equal(
+                    batch.arrays[test_labels].data,
+                    expected.arrays[test_labels].data))
+
+            pools = list(elastic_augment.transformation_pools.values())
+            self.assertEqual(len(pools), 1)
+            self.assertEqual(len(pools[0]), 3)
@@ -78,3 +78,154 @@ class TestHdf5Source(ProviderTest):
             self.assertTrue(batch.arrays[raw].spec.interpolatable)
             self.assertTrue(batch.arrays[raw_low].spec.interpolatable)
             self.assertFalse(batch.arrays[seg].spec.interpolatable)
+
+    def test_block_cache(self):
+        path = self.path_to('test_hdf_source.hdf')
+
+        data = np.random.randint(0, 255, size=(40, 40, 40)).astype(np.uint8)
+        with h5py.File(path, 'w') as f:
+            f.create_dataset('raw', data=data, chunks=(10, 10, 10))
+            f['raw'].attrs['resolution'] = (2, 2, 2)
+
+        raw = ArrayKey('RAW')
+
+        # budget of 100 blocks, or 1 block
+        for cache_size in [100*1000, 1000]:
+
+            source = Hdf5Source(
+                path,
+                {raw: 'raw'},
+                array_specs={raw: ArraySpec(interpolatable=True)},
+                cache_size=cache_size)
+
+            with build(source):
+
+                for offset in [(0, 0, 0), (10, 14, 6), (10, 16, 8)]:
+
+                    batch = source.request_batch(
+                        BatchRequest({
+                            raw: ArraySpec(roi=Roi(offset, (30, 40, 50)))
+                        })
+                    )
+
+                    begin = tuple(o//2 for o in offset)
+                    end = tuple(b + s//2 for b, s in zip(begin, (30, 40, 50)))
+                    self.assertTrue(np.array_equal(
+                        batch.arrays[raw].data,
+                        data[begin[0]:end[0], begin[1]:end[1], begin[2]:end[2]]))
+
+                counters = batch.profiling_stats.get_counters()
+                hits = counters[('Hdf5Source', 'cache hits')]
+                misses = counters[('Hdf5Source', 'cache misses')]
+                self.assertEqual(hits + misses, 2*3*3)
+                if cache_size > 1000:
+                    # the last request is within the blocks of the previous one
+                    self.assertEqual(misses, 0)
+                else:
+                    # the cache keeps only the last block of the previous
+                    # request. All blocks are looked up before the missing
+                    # ones are read (and evict it), so that block hits.
+                    self.assertEqual(hits, 1)
+
+    def test_buffer_pool(self):
+        path = self.path_to('test_hdf_source.hdf')
+
+        data = np.random.randint(0, 255, size=(40, 40, 40)).astype(np.uint8)
+        with h5py.File(path, 'w') as f:
+            f['raw'] = data
+
+        raw = ArrayKey('RAW')
+        request = BatchRequest({
+            raw: ArraySpec(roi=Roi((10, 10, 10), (20, 20, 20)))
+        })
+
+        source = Hdf5Source(
+            path,
+            {raw: 'raw'},
+            array_specs={raw: ArraySpec(interpolatable=True)},
+            rdcc_nbytes=1024*1024,
+            rdcc_nslots=521,
+            buffer_pool=BufferPool(max_buffers=2))
+
+        pipeline = source + PreCache(num_workers=2, cache_size=2)
+
+        with build(pipeline):
+
+            batch = source.request_batch(request)
+            address = batch.arrays[raw].data.ctypes.data
+            self.assertTrue(np.array_equal(
+                batch.arrays[raw].data,
+                data[10:30, 10:30, 10:30]))
+
+            # buffer in use, a different one is returned
+            other = source.request_batch(request)
+            self.assertNotEqual(other.arrays[raw].data.ctypes.data, address)
+
+            # buffer is free again
+            del batch
+            batch = source.request_batch(request)
+            self.assertEqual(batch.arrays[raw].data.ctypes.data, address)
+
+            # a view keeps the buffer in use
+            view = batch.arrays[raw].data[5:10]
+            del batch, other
+            batch = source.request_batch(request)
+            self.assertNotEqual(batch.arrays[raw].data.ctypes.data, address)
+            del batch, view
+            batch = source.request_batch(request)
+            self.assertEqual(batch.arrays[raw].data.ctypes.data, address)
+
+            # worker processes open their own file handle
+            for _ in range(10):
+                batch = pipeline.request_batch(request)
+                self.assertTrue(np.array_equal(
+                    batch.arrays[raw].data,
+                    data[10:30, 10:30, 10:30]))
+
+    def test_forked_workers(self):
+        path = self.path_to('test_hdf_source.hdf')
+
+        # every voxel stores its position
+        z, y, x = np.meshgrid(
+            np.arange(32), np.arange(128), np.arange(128), indexing='ij')
+        data = (z*128*128 + y*128 + x).astype(np.uint32)
+        with h5py.File(path, 'w') as f:
+            f.create_dataset(
+                'raw',
+                data=data,
+                chunks=(8, 32, 32),
+                compression='gzip')
+
+        raw = ArrayKey('RAW')
+        source = Hdf5Source(
+            path,
+            {raw: 'raw'},
+            array_specs={raw: ArraySpec(interpolatable=True)})
+        pipeline = (
+            source +
+            RandomLocation() +
+            PreCache(num_workers=4, cache_size=8))
+
+        request = BatchRequest()
+        request.add(raw, (8, 32, 32))
+
+        with build(pipeline):
+
+            # the file is opened in the parent before the workers fork
+            source.request_batch(
+                BatchRequest({
+                    raw: ArraySpec(roi=Roi((0, 0, 0), (8, 8, 8)))
+                })
+            )
+
+            for _ in range(100):
+
+                batch = pipeline.request_batch(request)
+
+                # the random location, from the position in the first voxel
+                z, y, x = np.unravel_index(
+                    batch.arrays[raw].data[0, 0, 0],
+                    data.shape)
+                self.assertTrue(np.array_equal(
+                    batch.arrays[raw].data,
+                    data[z:z+8, y:y+32, x:x+32]))
@@ -1,6 +1,7 @@
 from .provider_test import ProviderTest
 from gunpowder import *
 import numpy as np
+import time
 from gunpowder.ext import h5py
 
 class Hdf5WriteTestSource(BatchProvider):
@@ -94,3 +95,120 @@ class TestHdf5Write(ProviderTest):
             self.assertEqual(tuple(ds.attrs['offset']), batch_raw.spec.roi.get_offset())
             self.assertEqual(tuple(ds.attrs['resolution']), batch_raw.spec.voxel_size)
             self.assertTrue((stored_raw == batch.arrays[ArrayKeys.RAW].data).all())
+
+    def test_async(self):
+        path = self.path_to('hdf5_write_async_test.hdf')
+
+        source = Hdf5WriteTestSource()
+
+        chunk_request = BatchRequest()
+        chunk_request.add(ArrayKeys.RAW, (400,30,34))
+
+        write = Hdf5Write({
+                ArrayKeys.RAW: 'arrays/raw'
+            },
+            output_filename=path,
+            compression_type='gzip',
+            asynchronous=True,
+            queue_size=2)
+
+        pipeline = (
+            source +
+            write +
+            Scan(chunk_request))
+
+        with build(pipeline):
+
+            full_request = BatchRequest({
+                    ArrayKeys.RAW: pipeline.spec[ArrayKeys.RAW]
+                }
+            )
+
+            batch = pipeline.request_batch(full_request)
+
+        # all writes finished on teardown
+        with h5py.File(path, 'r') as f:
+
+            ds = f['arrays/raw']
+
+            batch_raw = batch.arrays[ArrayKeys.RAW]
+            stored_raw = np.array(ds)
+
+            self.assertEqual(tuple(ds.attrs['offset']), batch_raw.spec.roi.get_offset())
+            self.assertEqual(tuple(ds.attrs['resolution']), batch_raw.spec.voxel_size)
+            self.assertTrue((stored_raw == batch_raw.data).all())
+
+        # the writer process reports back, visible in later batches
+        write = Hdf5Write({
+                ArrayKeys.RAW: 'arrays/raw'
+            },
+            output_filename=self.path_to('hdf5_write_async_stats.hdf'),
+            asynchronous=True)
+
+        pipeline = source + write
+
+        with build(pipeline):
+
+            request = BatchRequest()
+            request[ArrayKeys.RAW] = ArraySpec(
+                roi=Roi((20000, 2000, 2000), (400, 30, 34)))
+
+            stats = None
+            for _ in range(5):
+                batch = pipeline.request_batch(request)
+                if stats is None:
+                    stats = batch.profiling_stats
+                else:
+                    stats.merge_with(batch.profiling_stats)
+            time.sleep(0.5)
+            stats.merge_with(pipeline.request_batch(request).profiling_stats)
+
+        self.assertEqual(stats.get_timing_summary('Hdf5Write', 'enqueue').counts(), 6)
+        self.assertTrue(stats.get_timing_summary('Hdf5Write', 'write').counts() >= 5)
+        self.assertTrue(
+            stats.get_counters()[('Hdf5Write', 'bytes written')] >=
+            5*3*20*15*17*8)
+        configuration = stats.get_configurations()['Hdf5Write']
+        self.assertTrue(0 <= configuration['queue depth'] <= 1)
+
+    def test_chunk_shape(self):
+
+        source = Hdf5WriteTestSource()
+
+        # blocks of (20, 15, 17) voxels, not aligned with the chunks
+        chunk_request = BatchRequest()
+        chunk_request.add(ArrayKeys.RAW, (400,30,34))
+
+        for asynchronous in [False, True]:
+
+            path = self.path_to('hdf5_write_chunks_%s.hdf'%asynchronous)
+
+            pipeline = (
+                source +
+                Hdf5Write({
+                    ArrayKeys.RAW: 'arrays/raw'
+                },
+                output_filename=path,
+                compression_type='gzip',
+                chunk_shape=(8, 8, 8),
+                asynchronous=asynchronous) +
+                Scan(chunk_request))
+
+            # leave parts of the border chunks empty
+            roi = Roi((20020, 2006, 2010), (1600, 180, 170))
+
+            with build(pipeline):
+
+                batch = pipeline.request_batch(
+                    BatchRequest({ArrayKeys.RAW: ArraySpec(roi=roi)}))
+
+            with h5py.File(path, 'r') as f:
+
+                ds = f['arrays/raw']
+                self.assertEqual(ds.chunks, (3, 8, 8, 8))
+
+                stored_raw = np.array(ds)
+                expected = np.zeros_like(stored_raw)
+                expected[:,1:81,3:93,5:90] = batch.arrays[ArrayKeys.RAW].data
+
+                self.assertTrue((stored_raw == expected).all())
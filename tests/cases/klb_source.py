@@ -0,0 +1,181 @@
+from .provider_test import ProviderTest
+from gunpowder import *
+import gunpowder.nodes.klb_source
+import json
+import numpy as np
+import os
+import threading
+import time
+
+class FakePyklb(object):
+    '''Stands in for ``pyklb``, serves arrays registered for existing (dummy)
+    files and records calls.'''
+
+    def __init__(self):
+        self.arrays = {}
+        self.header_reads = []
+        self.read_threads = set()
+        self.read_outs = []
+        self.lock = threading.Lock()
+
+    def write(self, filename, data):
+        self.arrays[os.path.abspath(filename)] = data
+        with open(filename, 'wb') as f:
+            f.write(data.tostring())
+
+    def readheader(self, filename):
+
+        with self.lock:
+            self.header_reads.append(filename)
+
+        data = self.arrays[os.path.abspath(filename)]
+        return {
+            'imagesize_tczyx': np.array((1, 1) + data.shape),
+            'pixelspacing_tczyx': np.array((1., 1., 1., 2., 3.)),
+            'datatype': data.dtype
+        }
+
+    def readroi_inplace(self, out, filename, lb, ub):
+
+        with self.lock:
+            self.read_threads.add(threading.current_thread().ident)
+            self.read_outs.append(out)
+
+        # give other threads a chance to read at the same time
+        time.sleep(0.01)
+
+        data = self.arrays[os.path.abspath(filename)]
+        out[:] = data[tuple(slice(l, u + 1) for l, u in zip(lb, ub))]
+
+class TestKlbSource(ProviderTest):
+
+    def setUp(self):
+
+        super(TestKlbSource, self).setUp()
+
+        self.pyklb = FakePyklb()
+        self.real_pyklb = gunpowder.nodes.klb_source.pyklb
+        gunpowder.nodes.klb_source.pyklb = self.pyklb
+
+        self.data = np.random.randint(
+            0, 255,
+            size=(4, 10, 20, 30)).astype(np.uint8)
+        for i in range(4):
+            self.pyklb.write(self.frame(i), self.data[i])
+
+    def tearDown(self):
+
+        gunpowder.nodes.klb_source.pyklb = self.real_pyklb
+        super(TestKlbSource, self).tearDown()
+
+    def frame(self, i):
+        return self.path_to('frame_%d.klb'%i)
+
+    def source(self, **kwargs):
+        return KlbSource(
+            self.path_to('frame_*.klb'),
+            ArrayKeys.RAW,
+            ArraySpec(interpolatable=True),
+            **kwargs)
+
+    def test_output(self):
+
+        source = self.source(num_threads=4)
+
+        with build(source):
+
+            self.assertEqual(
+                source.spec[ArrayKeys.RAW].roi,
+                Roi((0, 0, 0, 0), (4, 10, 40, 90)))
+            self.assertEqual(
+                source.spec[ArrayKeys.RAW].voxel_size,
+                (1, 1, 2, 3))
+
+            request = BatchRequest()
+            request[ArrayKeys.RAW] = ArraySpec(
+                roi=Roi((0, 2, 4, 6), (4, 5, 10, 30)))
+            batch = source.request_batch(request)
+
+        self.assertTrue(
+            (batch.arrays[ArrayKeys.RAW].data ==
+             self.data[0:4, 2:7, 2:7, 2:12]).all())
+
+        # frames are read in parallel, directly into the output array
+        self.assertTrue(len(self.pyklb.read_threads) > 1)
+        self.assertEqual(len(self.pyklb.read_outs), 4)
+        for out in self.pyklb.read_outs:
+            self.assertTrue(
+                np.may_share_memory(out, batch.arrays[ArrayKeys.RAW].data))
+
+    def test_header_cache(self):
+
+        cache_file = self.path_to('.klb_headers.json')
+
+        # first setup reads all headers and stores them
+        with build(self.source()):
+            pass
+        self.assertEqual(len(self.pyklb.header_reads), 4)
+        self.assertTrue(os.path.exists(cache_file))
+        with open(cache_file) as f:
+            self.assertEqual(len(json.load(f)), 4)
+
+        # cache hit, no headers are read
+        self.pyklb.header_reads = []
+        source = self.source()
+        with build(source):
+            self.assertEqual(
+                source.spec[ArrayKeys.RAW].roi,
+                Roi((0, 0, 0, 0), (4, 10, 40, 90)))
+            self.assertEqual(source.spec[ArrayKeys.RAW].dtype, np.uint8)
+        self.assertEqual(self.pyklb.header_reads, [])
+
+        # a changed file is read again
+        stat = os.stat(self.frame(2))
+        os.utime(self.frame(2), (stat.st_atime, stat.st_mtime + 10))
+        with build(self.source()):
+            pass
+        self.assertEqual(self.pyklb.header_reads, [self.frame(2)])
+
+        # ...and so is a file of different size
+        self.pyklb.header_reads = []
+        self.pyklb.write(self.frame(1), self.data[1, :5])
+        with self.assertRaises(AssertionError):
+            # headers differ now
+            with build(self.source()):
+                pass
+        self.assertEqual(self.pyklb.header_reads, [self.frame(1)])
+
+    def test_header_cache_unwritable(self):
+
+        cache_file = self.path_to('.klb_headers.json')
+
+        # the cache can not be written (a directory is in the way of the
+        # temporary file, permissions of the directory would not stop root)
+        tmp_file = '%s.%d.tmp'%(cache_file, os.getpid())
+        os.mkdir(tmp_file)
+
+        try:
+
+            for _ in range(2):
+                source = self.source()
+                with build(source):
+                    self.assertEqual(
+                        source.spec[ArrayKeys.RAW].roi,
+                        Roi((0, 0, 0, 0), (4, 10, 40, 90)))
+
+            # headers are read again in each setup
+            self.assertFalse(os.path.exists(cache_file))
+            self.assertEqual(len(self.pyklb.header_reads), 8)
+
+        finally:
+            os.rmdir(tmp_file)
+
+        # a corrupt cache is ignored and replaced
+        with open(cache_file, 'w') as f:
+            f.write('{not json')
+        self.pyklb.header_reads = []
+        with build(self.source()):
+            pass
+        self.assertEqual(len(self.pyklb.header_reads), 4)
+        with open(cache_file) as f:
+            self.assertEqual(len(json.load(f)), 4)
@@ -0,0 +1,144 @@
+from .provider_test import ProviderTest
+from gunpowder import *
+from gunpowder.contrib import ZeroOutConstSections
+import numpy as np
+
+class MaterializeTestSource(BatchProvider):
+
+    def __init__(self, raw_scale=1):
+        self.raw_scale = raw_scale
+        self.requested = []
+
+    def setup(self):
+
+        for key, dtype in [
+                (ArrayKeys.RAW, np.float32),
+                (ArrayKeys.GT_LABELS, np.uint64),
+                (ArrayKeys.GT_MASK, np.uint8)]:
+            self.provides(
+                key,
+                ArraySpec(
+                    roi=Roi((100, 20, 20), (100, 40, 40)),
+                    voxel_size=(10, 2, 2),
+                    dtype=dtype,
+                    interpolatable=False))
+
+    def provide(self, request):
+
+        self.requested.append(sorted(str(k) for k in request.array_specs))
+
+        batch = Batch()
+
+        # the values encode the position (in voxels)
+        for (array_key, spec) in request.array_specs.items():
+
+            roi_voxel = spec.roi//self.spec[array_key].voxel_size
+            data = np.zeros(roi_voxel.get_shape(), dtype=self.spec[array_key].dtype)
+            data += np.arange(
+                roi_voxel.get_begin()[0],
+                roi_voxel.get_end()[0],
+                dtype=data.dtype).reshape((-1, 1, 1))
+            if array_key == ArrayKeys.RAW:
+                data *= self.raw_scale
+
+            spec = self.spec[array_key].copy()
+            spec.roi = request[array_key].roi
+            batch.arrays[array_key] = Array(data, spec)
+
+        return batch
+
+class AddOne(BatchFilter):
+
+    def process(self, batch, request):
+        raw = batch.arrays[ArrayKeys.RAW]
+        raw.make_writeable()
+        raw.data += 1
+
+class TestMaterialize(ProviderTest):
+
+    def test_output(self):
+
+        source = MaterializeTestSource()
+
+        # only RAW fits into the budget
+        materialize = Materialize(
+            keys=[ArrayKeys.RAW, ArrayKeys.GT_LABELS],
+            max_bytes=10*20*20*4)
+        pipeline = source + materialize
+
+        with build(pipeline):
+
+            self.assertEqual(source.requested, [['RAW']])
+            self.assertEqual(list(materialize.arrays.keys()), [ArrayKeys.RAW])
+
+            request = BatchRequest()
+            request[ArrayKeys.RAW] = ArraySpec(roi=Roi((120, 30, 30), (30, 10, 10)))
+            request[ArrayKeys.GT_LABELS] = ArraySpec(roi=Roi((120, 30, 30), (30, 10, 10)))
+
+            batch = pipeline.request_batch(request)
+
+            # GT_LABELS is passed through
+            self.assertEqual(source.requested[-1], ['GT_LABELS'])
+
+            for key in [ArrayKeys.RAW, ArrayKeys.GT_LABELS]:
+                data = batch.arrays[key].data
+                self.assertEqual(data.shape, (3, 5, 5))
+                self.assertTrue((data[:,0,0] == [12, 13, 14]).all())
+
+            # RAW is a read-only view on the kept volume
+            raw = batch.arrays[ArrayKeys.RAW]
+            self.assertFalse(raw.data.flags.writeable)
+            self.assertFalse(raw.data.flags.owndata)
+
+            # only RAW requested, upstream is not asked at all
+            num_requests = len(source.requested)
+            del request[ArrayKeys.GT_LABELS]
+            pipeline.request_batch(request)
+            self.assertEqual(len(source.requested), num_requests)
+
+        # nodes modifying arrays in-place get a copy
+        pipeline = source + Materialize() + AddOne()
+
+        with build(pipeline):
+
+            for _ in range(2):
+                batch = pipeline.request_batch(request)
+                data = batch.arrays[ArrayKeys.RAW].data
+                self.assertTrue((data[:,0,0] == [13, 14, 15]).all())
+
+    def test_in_place_nodes(self):
+
+        request = BatchRequest()
+        for key in [ArrayKeys.RAW, ArrayKeys.GT_LABELS, ArrayKeys.GT_MASK]:
+            request[key] = ArraySpec(roi=Roi((120, 30, 30), (30, 10, 10)))
+
+        # all nodes that modify arrays in-place
+        nodes = [
+            IntensityAugment(ArrayKeys.RAW, 0.9, 1.1, -0.1, 0.1),
+            DefectAugment(ArrayKeys.RAW, prob_missing=0.5, prob_low_contrast=0.5),
+            ExcludeLabels(ArrayKeys.GT_LABELS, [12]),
+            GrowBoundary(ArrayKeys.GT_LABELS, None),
+            GrowBoundary(ArrayKeys.GT_LABELS, ArrayKeys.GT_MASK, only_xy=True),
+            ZeroOutConstSections(ArrayKeys.RAW)
+        ]
+
+        for node in nodes:
+
+            materialize = Materialize()
+            # RAW in [0, 1] for the intensity augmentations
+            pipeline = MaterializeTestSource(0.01) + materialize + node
+
+            with build(pipeline):
+
+                kept = {
+                    key: np.array(array.data)
+                    for key, array in materialize.arrays.items()
+                }
+
+                for _ in range(2):
+                    pipeline.request_batch(request)
+
+                # the kept volumes are unchanged
+                for key, data in kept.items():
+                    self.assertTrue(
+                        (materialize.arrays[key].data == data).all())
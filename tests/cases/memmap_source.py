@@ -0,0 +1,81 @@
+from .provider_test import ProviderTest
+from gunpowder import *
+from gunpowder.ext import h5py
+import json
+import numpy as np
+import os
+
+class TestMemmapSource(ProviderTest):
+
+    def test_output(self):
+
+        data = np.arange(20*30*40, dtype=np.float32).reshape((20, 30, 40))
+        labels = np.random.randint(0, 10, size=(20, 30, 40)).astype(np.uint64)
+
+        # convert from HDF5
+        hdf_path = self.path_to('test_memmap_source.hdf')
+        with h5py.File(hdf_path, 'w') as f:
+            f['volumes/raw'] = data
+            f['volumes/raw'].attrs['offset'] = (10, 20, 30)
+            f['volumes/raw'].attrs['resolution'] = (1, 2, 3)
+
+        output_dir = self.path_to('test_memmap_source')
+        hdf5_to_memmap(hdf_path, ['volumes/raw'], output_dir, block_size=7)
+
+        # a raw file with sidecar
+        labels.tofile(os.path.join(output_dir, 'labels.raw'))
+        with open(os.path.join(output_dir, 'labels.json'), 'w') as f:
+            json.dump({
+                'shape': labels.shape,
+                'dtype': labels.dtype.str,
+                'offset': (10, 20, 30),
+                'resolution': (1, 2, 3)
+            }, f)
+
+        raw = ArrayKey('RAW')
+        gt = ArrayKey('GT_LABELS')
+        source = MemmapSource(
+            output_dir,
+            {
+                raw: 'volumes/raw.npy',
+                gt: 'labels.raw'
+            },
+            array_specs={
+                raw: ArraySpec(interpolatable=True),
+                gt: ArraySpec(interpolatable=False)
+            })
+
+        with build(source):
+
+            self.assertEqual(
+                source.spec[raw].roi,
+                Roi((10, 20, 30), (20, 60, 120)))
+            self.assertEqual(source.spec[raw].voxel_size, (1, 2, 3))
+            self.assertEqual(source.spec[gt].roi, source.spec[raw].roi)
+            self.assertEqual(source.spec[gt].dtype, np.uint64)
+
+            request = BatchRequest({
+                raw: ArraySpec(roi=Roi((15, 24, 33), (10, 30, 60))),
+                gt: ArraySpec(roi=Roi((15, 24, 33), (10, 30, 60)))
+            })
+            batch = source.request_batch(request)
+
+            self.assertTrue(np.array_equal(
+                batch.arrays[raw].data,
+                data[5:15, 2:17, 1:21]))
+            self.assertTrue(np.array_equal(
+                batch.arrays[gt].data,
+                labels[5:15, 2:17, 1:21]))
+
+            # provided arrays are views, writing to them does not change the
+            # files
+            self.assertFalse(batch.arrays[raw].data.flags['OWNDATA'])
+            batch.arrays[raw].data[:] = -1
+
+            batch = source.request_batch(request)
+            self.assertTrue(np.array_equal(
+                batch.arrays[raw].data,
+                data[5:15, 2:17, 1:21]))
+
+        stored = np.load(os.path.join(output_dir, 'volumes/raw.npy'))
+        self.assertTrue(np.array_equal(stored, data))
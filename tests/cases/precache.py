@@ -1,11 +1,52 @@
+import multiprocessing
+import os
+import signal
 import time
 from gunpowder import *
+from gunpowder.producer_pool import WorkersDied, _get_cpu_affinity
 from .provider_test import ProviderTest
 
 class Delay(BatchFilter):
 
+    def __init__(self, seconds=1):
+        self.seconds = seconds
+
     def prepare(self, request):
-        time.sleep(1)
+        time.sleep(self.seconds)
+
+    def process(self, batch, request):
+        pass
+
+class FillWithBatchId(BatchFilter):
+
+    def process(self, batch, request):
+        batch.arrays[ArrayKeys.RAW].data[:] = batch.id%256
+
+class RecordPid(BatchFilter):
+
+    def process(self, batch, request):
+        batch.arrays[ArrayKeys.RAW].attrs['pid'] = os.getpid()
+
+class RecordThreadLimit(BatchFilter):
+
+    def process(self, batch, request):
+        batch.arrays[ArrayKeys.RAW].attrs['omp_num_threads'] = \
+            os.environ.get('OMP_NUM_THREADS')
+        batch.arrays[ArrayKeys.RAW].attrs['cpus'] = _get_cpu_affinity()
+
+class KillWorker(BatchFilter):
+
+    def __init__(self, times):
+        self.times = times
+        self.killed = multiprocessing.Value('i', 0)
+
+    def prepare(self, request):
+        with self.killed.get_lock():
+            kill = self.killed.value < self.times
+            if kill:
+                self.killed.value += 1
+        if kill:
+            os.kill(os.getpid(), signal.SIGKILL)
 
     def process(self, batch, request):
         pass
@@ -41,5 +82,207 @@ class TestPreCache(ProviderTest):
                     batch.arrays[ArrayKeys.RAW].spec.roi ==
                     self.test_request[ArrayKeys.RAW].roi)
 
-            # should be done in a bit more than 1 seconds
+            # workers finish the batches of the previous request they are
+            # working on, then work on the new request first
+            self.assertTrue(time.time() - start < 3)
+
+    def test_priority(self):
+
+        # a single worker, working on one task at a time
+        pipeline = (
+            self.test_source +
+            Delay(0.1) +
+            PreCache(num_workers=1, cache_size=5, executor='thread'))
+
+        other_request = self.test_request.copy()
+        other_request[ArrayKeys.RAW].roi = \
+            other_request[ArrayKeys.RAW].roi.shift((1,1,1))
+
+        with build(pipeline):
+
+            for request in [self.test_request, other_request]*2:
+
+                start = time.time()
+                pipeline.request_batch(request)
+
+                # tasks for the other request are queued, but the worker
+                # finishes at most its current one before working on this
+                # request
+                self.assertTrue(time.time() - start < 0.25)
+
+    def test_shared_memory(self):
+
+        pipeline = (
+            self.test_source +
+            FillWithBatchId() +
+            PreCache(num_workers=5, cache_size=5, shared_memory=True))
+
+        with build(pipeline):
+
+            batches = []
+            for _ in range(30):
+                batch = pipeline.request_batch(self.test_request)
+                self.assertTrue(
+                    batch.arrays[ArrayKeys.RAW].spec.roi ==
+                    self.test_request[ArrayKeys.RAW].roi)
+                self.assertTrue(
+                    (batch.arrays[ArrayKeys.RAW].data == batch.id%256).all())
+                batches.append(batch)
+
+            # all batches are still intact, even though more batches were
+            # requested than there are shared memory slabs
+            for batch in batches:
+                self.assertTrue(
+                    (batch.arrays[ArrayKeys.RAW].data == batch.id%256).all())
+
+            # slabs are reused once batches are dropped
+            del batches
+            del batch
+            for _ in range(30):
+                batch = pipeline.request_batch(self.test_request)
+                self.assertTrue(
+                    (batch.arrays[ArrayKeys.RAW].data == batch.id%256).all())
+
+    def test_alternating_requests(self):
+
+        pipeline = (
+            self.test_source +
+            RecordPid() +
+            PreCache(num_workers=3, cache_size=3, max_cached_requests=2))
+
+        train_request = self.test_request
+        validate_request = self.test_request.copy()
+        validate_request[ArrayKeys.RAW].roi = \
+            validate_request[ArrayKeys.RAW].roi.shift((10, 10, 10))
+        snapshot_request = self.test_request.copy()
+        snapshot_request[ArrayKeys.RAW].roi = \
+            snapshot_request[ArrayKeys.RAW].roi.grow((5, 5, 5), (5, 5, 5))
+
+        with build(pipeline):
+
+            pids = set()
+            for i in range(30):
+                for request in [train_request, validate_request, snapshot_request]:
+                    batch = pipeline.request_batch(request)
+                    self.assertTrue(
+                        batch.arrays[ArrayKeys.RAW].spec.roi ==
+                        request[ArrayKeys.RAW].roi)
+                    pids.add(batch.arrays[ArrayKeys.RAW].attrs['pid'])
+
+            # workers have not been restarted
+            self.assertTrue(len(pids) <= 3)
+
+    def test_threads(self):
+
+        pipeline = (
+            self.test_source +
+            Delay() +
+            RecordPid() +
+            PreCache(num_workers=10, cache_size=10, executor='thread'))
+
+        with build(pipeline):
+
+            start = time.time()
+
+            for _ in range(10):
+                batch = pipeline.request_batch(self.test_request)
+                self.assertTrue(
+                    batch.arrays[ArrayKeys.RAW].spec.roi ==
+                    self.test_request[ArrayKeys.RAW].roi)
+                self.assertEqual(
+                    batch.arrays[ArrayKeys.RAW].attrs['pid'],
+                    os.getpid())
+
+            # threads sleep in parallel
             self.assertTrue(time.time() - start < 2)
+
+    def test_restart_workers(self):
+
+        precache = PreCache(num_workers=3, cache_size=3, max_restarts=2)
+        pipeline = self.test_source + KillWorker(2) + precache
+
+        with build(pipeline):
+
+            # keep requesting, until the watchdog restarted the workers
+            start = time.time()
+            while time.time() - start < 3:
+                batch = pipeline.request_batch(self.test_request)
+                self.assertTrue(
+                    batch.arrays[ArrayKeys.RAW].spec.roi ==
+                    self.test_request[ArrayKeys.RAW].roi)
+
+            self.assertEqual(sum(precache.workers.get_restarts()), 2)
+
+        precache = PreCache(num_workers=3, cache_size=3, max_restarts=2)
+        pipeline = self.test_source + KillWorker(3) + precache
+
+        with build(pipeline):
+
+            with self.assertRaises(WorkersDied):
+                for _ in range(100):
+                    pipeline.request_batch(self.test_request)
+                    time.sleep(0.1)
+
+    def test_autoscale(self):
+
+        # downstream requests every 0.05s, upstream takes 0.2s per batch
+        precache = PreCache(
+            num_workers=10,
+            cache_size=10,
+            min_workers=1)
+        pipeline = self.test_source + Delay(0.2) + precache
+
+        with build(pipeline):
+
+            start = time.time()
+            while time.time() - start < 5:
+                batch = pipeline.request_batch(self.test_request)
+                self.assertTrue(
+                    batch.arrays[ArrayKeys.RAW].spec.roi ==
+                    self.test_request[ArrayKeys.RAW].roi)
+                time.sleep(0.05)
+
+            # about four workers are needed to keep up
+            num_workers = precache.workers.get_num_workers()
+            self.assertTrue(3 <= num_workers <= 8)
+
+        # downstream is slower than a single worker
+        precache = PreCache(
+            num_workers=10,
+            cache_size=4,
+            min_workers=1,
+            executor='thread')
+        pipeline = self.test_source + Delay(0.05) + precache
+
+        with build(pipeline):
+
+            for _ in range(20):
+                pipeline.request_batch(self.test_request)
+                time.sleep(0.1)
+
+            self.assertTrue(precache.workers.get_num_workers() <= 2)
+
+    def test_worker_limits(self):
+
+        pipeline = (
+            self.test_source +
+            RecordThreadLimit() +
+            PreCache(
+                num_workers=2,
+                cache_size=2,
+                cpu_sets=[[0]],
+                num_threads=1))
+
+        with build(pipeline):
+
+            batch = pipeline.request_batch(self.test_request)
+
+            attrs = batch.arrays[ArrayKeys.RAW].attrs
+            self.assertEqual(attrs['omp_num_threads'], '1')
+            self.assertEqual(attrs['cpus'], set([0]))
+
+            configuration = \
+                batch.profiling_stats.get_configurations()['PreCache']
+            self.assertEqual(configuration['num_workers'], 2)
+            self.assertEqual(configuration['cpu_sets'], [[0]])
+            self.assertEqual(configuration['num_threads'], 1)
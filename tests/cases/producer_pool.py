@@ -0,0 +1,126 @@
+import multiprocessing
+import time
+import unittest
+
+import gunpowder.producer_pool
+from gunpowder.producer_pool import ProducerPool, NoResult, _get_cpu_affinity
+
+class CountingProducer(object):
+
+    def __init__(self, seconds=0.01, size=1 << 20):
+        self.seconds = seconds
+        self.size = size
+        self.produced = multiprocessing.Value('i', 0)
+
+    def __call__(self):
+        time.sleep(self.seconds)
+        with self.produced.get_lock():
+            self.produced.value += 1
+        # large enough to still be in the queue's feeder thread when the
+        # worker retires
+        return b'x'*self.size
+
+class CpuAffinityProducer(object):
+
+    def __call__(self):
+        return _get_cpu_affinity()
+
+class ControlPipesProducer(object):
+
+    def __call__(self):
+        return sorted(gunpowder.producer_pool._control_pipes)
+
+class TestProducerPool(unittest.TestCase):
+
+    def test_retire_workers(self):
+
+        producer = CountingProducer()
+        pool = ProducerPool([producer]*4, queue_size=100)
+        pool.start()
+
+        try:
+
+            received = 0
+            for _ in range(10):
+                pool.get()
+                received += 1
+
+            pool.set_num_workers(0)
+
+            # wait until all workers retired
+            produced = -1
+            while producer.produced.value != produced:
+                produced = producer.produced.value
+                time.sleep(0.5)
+
+            try:
+                while True:
+                    pool.get(timeout=1)
+                    received += 1
+            except NoResult:
+                pass
+
+            # no results got lost by retiring workers
+            self.assertEqual(received, producer.produced.value)
+
+        finally:
+            pool.stop()
+
+    def test_cpu_sets(self):
+
+        cpus = sorted(_get_cpu_affinity())
+
+        for executor in ['process', 'thread']:
+
+            pool = ProducerPool(
+                [CpuAffinityProducer()]*2,
+                executor=executor,
+                cpu_sets=[[cpus[0]], cpus[-1:]])
+            pool.start()
+
+            try:
+                affinities = [pool.get() for _ in range(10)]
+            finally:
+                pool.stop()
+
+            # each worker runs on its CPU set
+            for affinity in affinities:
+                self.assertTrue(
+                    affinity in [set(cpus[:1]), set(cpus[-1:])])
+
+        # the calling thread is not affected
+        self.assertEqual(sorted(_get_cpu_affinity()), cpus)
+
+    def test_cpu_sets_unsupported(self):
+
+        can_set_cpu_affinity = gunpowder.producer_pool._can_set_cpu_affinity
+        gunpowder.producer_pool._can_set_cpu_affinity = lambda: False
+
+        try:
+
+            with self.assertRaises(RuntimeError):
+                ProducerPool([CpuAffinityProducer()], cpu_sets=[[0]])
+
+            # not an error if no CPUs are to be pinned
+            ProducerPool([CpuAffinityProducer()])
+
+        finally:
+            gunpowder.producer_pool._can_set_cpu_affinity = \
+                can_set_cpu_affinity
+
+    def test_control_pipes(self):
+
+        control_pipes = set(gunpowder.producer_pool._control_pipes)
+
+        pool = ProducerPool([ControlPipesProducer()]*2)
+        pool.start()
+
+        try:
+            # the watchdog closed the control pipes before forking the
+            # workers, they don't inherit these (possibly reused) fds
+            for _ in range(4):
+                self.assertEqual(pool.get(), [])
+        finally:
+            pool.stop()
+
+        self.assertEqual(gunpowder.producer_pool._control_pipes, control_pipes)
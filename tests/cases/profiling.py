@@ -1,7 +1,26 @@
 from .provider_test import ProviderTest
 from gunpowder import *
+from gunpowder.profiling import Timing, TimingSummary
+import json
+import numpy as np
+import os
+import pickle
 import time
 
+class FixedTiming(object):
+
+    def __init__(self, elapsed):
+        self.__elapsed = elapsed
+
+    def elapsed(self):
+        return self.__elapsed
+
+    def cpu_time(self):
+        return self.__elapsed/2
+
+    def span(self):
+        return (0, self.__elapsed)
+
 class DelayNode(BatchFilter):
 
     def __init__(self, time_prepare, time_process):
@@ -45,3 +64,84 @@ class TestProfiling(ProviderTest):
         # is the upstream time correct?
         self.assertGreaterEqual(profiling_stats.span_time(), 0.1+0.2+0.2+0.3) # total time spend upstream
         self.assertLessEqual(profiling_stats.span_time(), 0.1+0.2+0.2+0.3 + 0.1) # plus bit of tolerance
+
+    def test_summary(self):
+
+        times = np.random.exponential(0.1, size=1000)
+
+        a = TimingSummary()
+        b = TimingSummary()
+        for t in times[:500]:
+            a.add(FixedTiming(t))
+        for t in times[500:]:
+            b.add(FixedTiming(t))
+
+        a.merge(pickle.loads(pickle.dumps(b)))
+
+        self.assertEqual(a.counts(), 1000)
+        self.assertAlmostEqual(a.min(), np.min(times))
+        self.assertAlmostEqual(a.max(), np.max(times))
+        self.assertAlmostEqual(a.mean(), np.mean(times))
+        self.assertAlmostEqual(a.cpu_mean(), np.mean(times)/2)
+
+        # quantiles are accurate up to 1%
+        times = np.sort(times)
+        for q in [0.1, 0.5, 0.9]:
+            expected = times[int(q*(len(times) - 1))]
+            self.assertLessEqual(
+                abs(a.quantile(q) - expected),
+                0.01*expected + 1e-9)
+
+        # timings of wall time only do not count for the CPU mean
+        wall_only = Timing(self, 'wall', cpu=False)
+        wall_only.start()
+        wall_only.stop()
+        self.assertEqual(wall_only.cpu_time(), None)
+
+        a.add(wall_only)
+        self.assertEqual(a.counts(), 1001)
+        self.assertAlmostEqual(a.cpu_mean(), np.mean(times)/2)
+
+        c = TimingSummary()
+        c.add(wall_only)
+        self.assertEqual(c.cpu_mean(), None)
+        a.merge(pickle.loads(pickle.dumps(c)))
+        self.assertAlmostEqual(a.cpu_mean(), np.mean(times)/2)
+
+    def test_chrome_trace(self):
+
+        filename = self.path_to('trace.json')
+
+        pipeline = (
+                self.test_source +
+                DelayNode(0.01, 0.01) +
+                PreCache(num_workers=2, cache_size=2) +
+                WriteChromeTrace(filename)
+        )
+
+        with build(pipeline):
+            batch_ids = [
+                pipeline.request_batch(self.test_request).id
+                for _ in range(4)
+            ]
+
+        with open(filename) as f:
+            events = json.load(f)
+
+        names = set(event['name'] for event in events)
+        self.assertTrue('DelayNode.prepare' in names)
+        self.assertTrue('DelayNode.process' in names)
+        self.assertTrue('PreCache.queue' in names)
+        self.assertTrue('PreCache' in names)
+
+        self.assertEqual(
+            set(event['args']['batch_id'] for event in events),
+            set(batch_ids))
+
+        for event in events:
+            self.assertEqual(event['ph'], 'X')
+            self.assertGreaterEqual(event['dur'], 0)
+            if event['name'].startswith('DelayNode'):
+                # produced in a worker process
+                self.assertNotEqual(event['pid'], os.getpid())
+                self.assertGreaterEqual(event['dur'], 0.01*1e6)
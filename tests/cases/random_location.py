@@ -1,5 +1,7 @@
 from .provider_test import ProviderTest
 from gunpowder import *
+from gunpowder.points import Points, Point
+import h5py
 import numpy as np
 
 class TestSourceRandomLocation(BatchProvider):
@@ -35,6 +37,94 @@ class CustomRandomLocation(RandomLocation):
     def accepts(self, request):
         return request.array_specs[ArrayKeys.RAW].roi.contains((0, 0, 0))
 
+class TestSourceSparseMask(BatchProvider):
+
+    def __init__(self, mask_data):
+        self.mask_data = mask_data
+        self.num_requests = 0
+
+    def setup(self):
+
+        self.provides(
+            ArrayKeys.GT_MASK,
+            ArraySpec(
+                roi=Roi((-40, 0, 20), (200, 60, 60)),
+                voxel_size=(4, 2, 2),
+                interpolatable=False))
+
+    def provide(self, request):
+
+        batch = Batch()
+
+        spec = request[ArrayKeys.GT_MASK].copy()
+        spec.voxel_size = Coordinate((4, 2, 2))
+
+        roi = (spec.roi - Coordinate((-40, 0, 20)))/spec.voxel_size
+        batch.arrays[ArrayKeys.GT_MASK] = Array(
+            self.mask_data[roi.get_bounding_box()],
+            spec)
+
+        self.num_requests += 1
+
+        return batch
+
+class TestSourceSparsePoints(BatchProvider):
+
+    def __init__(self, locations, roi=Roi((0, 0, 0), (100, 100, 100))):
+        self.locations = locations
+        self.roi = roi
+        self.num_requests = 0
+
+    def setup(self):
+
+        self.provides(
+            PointsKey('SPARSE_POINTS'),
+            PointsSpec(roi=self.roi))
+        self.provides(
+            ArrayKey('SPARSE_RAW'),
+            ArraySpec(
+                roi=self.roi,
+                voxel_size=(4, 2, 1)))
+
+    def provide(self, request):
+
+        batch = Batch()
+
+        for key, spec in request.points_specs.items():
+            batch.points[key] = Points(
+                {
+                    i: Point(location)
+                    for i, location in enumerate(self.locations)
+                    if spec.roi.contains(location)
+                },
+                spec.copy())
+
+        for key, spec in request.array_specs.items():
+            spec = spec.copy()
+            spec.voxel_size = Coordinate((4, 2, 1))
+            batch.arrays[key] = Array(
+                np.zeros(spec.roi.get_shape()/spec.voxel_size),
+                spec)
+
+        self.num_requests += 1
+
+        return batch
+
+class TestSourcePreciseSparsePoints(TestSourceSparsePoints):
+
+    def provide(self, request):
+
+        batch = super(TestSourcePreciseSparsePoints, self).provide(request)
+
+        # locations more precise than the float32 default of Point
+        for points in batch.points.values():
+            for point_id, point in points.data.items():
+                point.location = np.array(
+                    self.locations[point_id],
+                    dtype=np.float64)
+
+        return batch
+
 class TestRandomLocation(ProviderTest):
 
     def test_output(self):
@@ -55,3 +145,211 @@ class TestRandomLocation(ProviderTest):
                         }))
 
                 self.assertTrue(np.sum( batch.arrays[ArrayKeys.RAW].data) > 0)
+
+    def test_min_masked(self):
+
+        # a sparse mask, only a few small cubes are masked in
+        mask_data = np.zeros((50, 30, 30), dtype=np.uint8)
+        mask_data[10:13, 5:9, 5:9] = 1
+        mask_data[30:34, 20:25, 18:22] = 1
+        mask_data[45:50, 0:3, 27:30] = 1
+
+        random_location = RandomLocation(
+            min_masked=0.5,
+            mask=ArrayKeys.GT_MASK)
+        pipeline = TestSourceSparseMask(mask_data) + random_location
+
+        request = BatchRequest({
+            ArrayKeys.GT_MASK: ArraySpec(roi=Roi((0, 0, 0), (12, 6, 6)))
+        })
+
+        # all acceptable locations (RandomLocation never picks the last
+        # possible location in each dimension)
+        valid = set()
+        for z in range(0, 50 - 3):
+            for y in range(0, 30 - 3):
+                for x in range(0, 30 - 3):
+                    if mask_data[z:z+3, y:y+3, x:x+3].sum() >= 0.5*27:
+                        valid.add((z*4 - 40, y*2, x*2 + 20))
+
+        with build(pipeline):
+
+            seen = set()
+            for i in range(2000):
+
+                batch = pipeline.request_batch(request)
+
+                mask = batch.arrays[ArrayKeys.GT_MASK]
+                self.assertTrue(mask.data.mean() >= 0.5)
+
+                seen.add(random_location.random_shift)
+
+        # every acceptable location can be drawn
+        self.assertEqual(seen, valid)
+
+    def test_mask_integral_file(self):
+
+        mask_data = np.zeros((50, 30, 30), dtype=np.uint8)
+        mask_data[10:13, 5:9, 5:9] = 1
+        mask_data[30:34, 20:25, 18:22] = 1
+        mask_data[45:50, 0:3, 27:30] = 1
+
+        expected = np.zeros((51, 31, 31), dtype=np.uint64)
+        expected[1:, 1:, 1:] = mask_data.cumsum(0).cumsum(1).cumsum(2)
+
+        integral_file = self.path_to('mask_integral.npy')
+        request = BatchRequest({
+            ArrayKeys.GT_MASK: ArraySpec(roi=Roi((0, 0, 0), (12, 6, 6)))
+        })
+
+        for i in range(2):
+
+            source = TestSourceSparseMask(mask_data)
+            random_location = RandomLocation(
+                min_masked=0.5,
+                mask=ArrayKeys.GT_MASK,
+                mask_block_shape=(16, 16, 7),
+                mask_integral_file=integral_file)
+            pipeline = source + random_location
+
+            with build(pipeline):
+
+                self.assertTrue(np.array_equal(
+                    random_location.mask_integral,
+                    expected))
+
+                # computed blockwise once, reused afterwards
+                if i == 0:
+                    self.assertEqual(source.num_requests, 4*2*5)
+                else:
+                    self.assertEqual(source.num_requests, 0)
+
+                for _ in range(10):
+                    batch = pipeline.request_batch(request)
+                    self.assertTrue(
+                        batch.arrays[ArrayKeys.GT_MASK].data.mean() >= 0.5)
+
+    def test_mask_integral_file_changed(self):
+
+        mask_data = np.zeros((50, 30, 30), dtype=np.uint8)
+        mask_data[10:13, 5:9, 5:9] = 1
+
+        mask_file = self.path_to('mask.hdf')
+        integral_file = self.path_to('mask_integral.npy')
+        request = BatchRequest({
+            ArrayKeys.GT_MASK: ArraySpec(roi=Roi((0, 0, 0), (3, 3, 3)))
+        })
+
+        for i in range(3):
+
+            if i != 1:
+                # (re-)write the mask, same ROI but different content
+                mask_data[30:34, 20:25, 18:22] = i//2
+                with h5py.File(mask_file, 'w') as f:
+                    f['mask'] = mask_data
+
+            expected = np.zeros((51, 31, 31), dtype=np.uint64)
+            expected[1:, 1:, 1:] = mask_data.cumsum(0).cumsum(1).cumsum(2)
+
+            random_location = RandomLocation(
+                min_masked=0.5,
+                mask=ArrayKeys.GT_MASK,
+                mask_integral_file=integral_file)
+            pipeline = Hdf5Source(
+                mask_file,
+                datasets={ArrayKeys.GT_MASK: 'mask'},
+                array_specs={
+                    ArrayKeys.GT_MASK: ArraySpec(interpolatable=False)
+                }) + random_location
+
+            with build(pipeline):
+
+                # reused for an unchanged mask file, recomputed otherwise
+                self.assertTrue(np.array_equal(
+                    random_location.mask_integral,
+                    expected))
+
+                batch = pipeline.request_batch(request)
+                self.assertTrue(
+                    batch.arrays[ArrayKeys.GT_MASK].data.mean() >= 0.5)
+
+    def test_ensure_nonempty(self):
+
+        points = PointsKey('SPARSE_POINTS')
+        raw = ArrayKey('SPARSE_RAW')
+
+        # one point on the boundary of an lcm voxel, two close-by points
+        locations = [(20, 30, 41), (80, 10, 90), (82, 12, 91)]
+
+        source = TestSourceSparsePoints(locations)
+        random_location = RandomLocation(ensure_nonempty=points)
+        pipeline = source + random_location
+
+        request = BatchRequest({
+            points: PointsSpec(roi=Roi((0, 0, 0), (8, 4, 2))),
+            raw: ArraySpec(roi=Roi((0, 0, 0), (8, 4, 2)))
+        })
+
+        # all shifts on the lcm grid (4, 2, 1) that contain a point well
+        # inside (not on the lower boundary), RandomLocation never picks the
+        # last possible location in each dimension
+        valid = set()
+        for z in range(0, 100 - 8, 4):
+            for y in range(0, 100 - 4, 2):
+                for x in range(0, 100 - 2):
+                    roi = Roi((z, y, x), (8, 4, 2))
+                    if any(
+                            roi.contains(l) and
+                            all(c > b for c, b in zip(l, roi.get_begin()))
+                            for l in locations):
+                        valid.add((z, y, x))
+
+        with build(pipeline):
+
+            # only the points are requested upstream in setup
+            self.assertEqual(source.num_requests, 1)
+
+            seen = set()
+            for i in range(1000):
+
+                batch = pipeline.request_batch(request)
+
+                self.assertTrue(len(batch.points[points].data) > 0)
+                for point in batch.points[points].data.values():
+                    self.assertTrue(
+                        request[points].roi.contains(point.location))
+
+                seen.add(random_location.random_shift)
+
+            self.assertEqual(source.num_requests, 1001)
+
+        self.assertEqual(seen, valid)
+
+    def test_ensure_nonempty_large_coordinates(self):
+
+        points = PointsKey('SPARSE_POINTS')
+        raw = ArrayKey('SPARSE_RAW')
+
+        # not representable as float32 (rounds to 2**24)
+        locations = [(20, 30, 2**24 + 1)]
+
+        source = TestSourcePreciseSparsePoints(
+            locations,
+            roi=Roi((0, 0, 0), (100, 100, 2**25)))
+        random_location = RandomLocation(ensure_nonempty=points)
+        pipeline = source + random_location
+
+        request = BatchRequest({
+            points: PointsSpec(roi=Roi((0, 0, 0), (8, 4, 2))),
+            raw: ArraySpec(roi=Roi((0, 0, 0), (8, 4, 2)))
+        })
+
+        with build(pipeline):
+
+            for i in range(10):
+
+                batch = pipeline.request_batch(request)
+
+                # the only shift in x that contains the point well inside
+                self.assertEqual(random_location.random_shift[2], 2**24)
+                self.assertEqual(len(batch.points[points].data), 1)
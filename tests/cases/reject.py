@@ -0,0 +1,143 @@
+from .provider_test import ProviderTest
+from gunpowder import *
+import numpy as np
+
+class RejectTestSource(BatchProvider):
+
+    def __init__(self):
+        self.requested = {}
+
+    def setup(self):
+
+        for key in [ArrayKey('REJECT_MASK'), ArrayKey('REJECT_RAW')]:
+            self.provides(
+                key,
+                ArraySpec(
+                    roi=Roi((0, 0, 0), (100, 100, 100)),
+                    voxel_size=(1, 1, 1),
+                    interpolatable=False))
+
+    def provide(self, request):
+
+        batch = Batch()
+
+        for key, spec in request.array_specs.items():
+
+            self.requested[key] = self.requested.get(key, 0) + 1
+
+            # only the first half in z is masked in
+            data = np.zeros(spec.roi.get_shape(), dtype=np.uint8)
+            z_begin = spec.roi.get_begin()[0]
+            data[:max(0, 50 - z_begin)] = 1
+
+            spec = self.spec[key].copy()
+            spec.roi = request[key].roi
+            batch.arrays[key] = Array(data, spec)
+
+        return batch
+
+class PassMask(BatchFilter):
+
+    def process(self, batch, request):
+        pass
+
+class GrowMask(BatchFilter):
+
+    def prepare(self, request):
+        mask = ArrayKey('REJECT_MASK')
+        request[mask].roi = request[mask].roi.grow((5, 5, 5), (5, 5, 5))
+
+    def process(self, batch, request):
+        mask = ArrayKey('REJECT_MASK')
+        batch.arrays[mask] = batch.arrays[mask].crop(request[mask].roi)
+
+class TestReject(ProviderTest):
+
+    def test_output(self):
+
+        mask = ArrayKey('REJECT_MASK')
+        raw = ArrayKey('REJECT_RAW')
+
+        request = BatchRequest()
+        request.add(mask, (10, 10, 10))
+        request.add(raw, (10, 10, 10))
+
+        for pushdown in [False, True]:
+
+            source = RejectTestSource()
+            pipeline = (
+                source +
+                RandomLocation() +
+                Reject(mask, min_masked=0.5, pushdown=pushdown))
+
+            with build(pipeline):
+
+                counters = {}
+                for i in range(20):
+
+                    batch = pipeline.request_batch(request)
+                    self.assertTrue(batch.arrays[mask].data.mean() > 0.5)
+
+                    for key, value in batch.profiling_stats.get_counters().items():
+                        counters[key] = counters.get(key, 0) + value
+
+            self.assertEqual(counters[('Reject', 'accepted')], 20)
+
+            if pushdown:
+
+                # locations are tested on the mask alone, RAW is only read
+                # for accepted batches
+                self.assertEqual(counters[('Reject', 'rejected')], 0)
+                self.assertEqual(source.requested[raw], 20)
+                self.assertEqual(
+                    counters[('RandomLocation', 'probes accepted')], 20)
+                self.assertEqual(
+                    source.requested[mask],
+                    40 + counters[('RandomLocation', 'probes rejected')])
+
+            else:
+
+                self.assertEqual(
+                    source.requested[raw],
+                    20 + counters[('Reject', 'rejected')])
+
+    def test_pushdown_changed_roi(self):
+
+        mask = ArrayKey('REJECT_MASK')
+        raw = ArrayKey('REJECT_RAW')
+
+        request = BatchRequest()
+        request.add(mask, (10, 10, 10))
+        request.add(raw, (10, 10, 10))
+
+        for node, passes_roi in [(PassMask(), True), (GrowMask(), False)]:
+
+            source = RejectTestSource()
+            random_location = RandomLocation()
+            pipeline = (
+                source +
+                random_location +
+                node +
+                Reject(mask, min_masked=0.5, pushdown=True))
+
+            with build(pipeline):
+
+                counters = {}
+                for i in range(20):
+
+                    batch = pipeline.request_batch(request)
+                    self.assertTrue(batch.arrays[mask].data.mean() > 0.5)
+
+                    for key, value in batch.profiling_stats.get_counters().items():
+                        counters[key] = counters.get(key, 0) + value
+
+                if passes_roi:
+                    self.assertEqual(counters[('Reject', 'rejected')], 0)
+                    self.assertEqual(len(random_location.predicates), 1)
+                else:
+                    # the first probe sees the grown mask ROI, the mask is
+                    # tested in Reject only from then on
+                    self.assertEqual(
+                        source.requested[mask],
+                        source.requested[raw] + 1)
+                    self.assertEqual(len(random_location.predicates), 0)
@@ -0,0 +1,57 @@
+from .provider_test import ProviderTest
+from gunpowder import *
+from gunpowder.ext import h5py
+import numpy as np
+import os
+
+class TestSnapshot(ProviderTest):
+
+    def test_output(self):
+
+        for asynchronous in [False, True]:
+
+            output_dir = self.path_to('snapshots_%s'%asynchronous)
+
+            pipeline = (
+                self.test_source +
+                Snapshot(
+                    {ArrayKeys.RAW: 'volumes/raw'},
+                    output_dir=output_dir,
+                    output_filename='{iteration}.hdf',
+                    asynchronous=asynchronous,
+                    block_when_full=True))
+
+            with build(pipeline):
+                for _ in range(5):
+                    batch = pipeline.request_batch(self.test_request)
+
+            # all queued snapshots are written on teardown
+            self.assertEqual(os.listdir(output_dir), ['0.hdf'])
+
+            with h5py.File(os.path.join(output_dir, '0.hdf'), 'r') as f:
+                self.assertTrue(
+                    (f['volumes/raw'][:] == batch.arrays[ArrayKeys.RAW].data).all())
+                self.assertEqual(
+                    tuple(f['volumes/raw'].attrs['offset']),
+                    (20, 20, 20))
+
+    def test_drop(self):
+
+        output_dir = self.path_to('snapshots')
+
+        pipeline = (
+            self.test_source +
+            Snapshot(
+                {ArrayKeys.RAW: 'volumes/raw'},
+                output_dir=output_dir,
+                asynchronous=True,
+                queue_size=1))
+
+        num_dropped = 0
+        with build(pipeline):
+            for _ in range(20):
+                batch = pipeline.request_batch(self.test_request)
+                num_dropped += batch.profiling_stats.get_counters().get(
+                    ('Snapshot', 'snapshots dropped'), 0)
+
+        self.assertEqual(len(os.listdir(output_dir)) + num_dropped, 20)
@@ -0,0 +1,55 @@
+from .provider_test import ProviderTest
+from gunpowder import *
+from gunpowder.chunked_array import ChunkedArray
+import numpy as np
+
+class TestZarrSource(ProviderTest):
+
+    def test_output(self):
+        path = self.path_to('test_zarr_source.zarr')
+
+        data = np.random.randint(0, 255, size=(35, 40, 45)).astype(np.uint8)
+        array = ChunkedArray.create(
+            path,
+            'volumes/raw',
+            shape=data.shape,
+            chunks=(10, 10, 10),
+            dtype=data.dtype,
+            attrs={'offset': (10, 20, 30), 'resolution': (1, 2, 3)})
+        # leave out the last chunk row, it reads as zeros
+        array.write((0, 0, 0), data[:30])
+        data[30:] = 0
+
+        raw = ArrayKey('RAW')
+        source = ZarrSource(
+            path,
+            {raw: 'volumes/raw'},
+            array_specs={raw: ArraySpec(interpolatable=True)})
+
+        pipeline = source + PreCache(num_workers=2, cache_size=2)
+
+        with build(pipeline):
+
+            self.assertEqual(
+                source.spec[raw].roi,
+                Roi((10, 20, 30), (35, 80, 135)))
+            self.assertEqual(source.spec[raw].voxel_size, (1, 2, 3))
+
+            for node in [source, pipeline]:
+                for offset, shape in [
+                        ((10, 20, 30), (35, 80, 135)),
+                        ((15, 24, 33), (20, 30, 60))]:
+
+                    batch = node.request_batch(
+                        BatchRequest({
+                            raw: ArraySpec(roi=Roi(offset, shape))
+                        })
+                    )
+
+                    begin = (
+                        Coordinate(offset) -
+                        source.spec[raw].roi.get_offset())/(1, 2, 3)
+                    end = begin + Coordinate(shape)/(1, 2, 3)
+                    self.assertTrue(np.array_equal(
+                        batch.arrays[raw].data,
+                        data[begin[0]:end[0], begin[1]:end[1], begin[2]:end[2]]))
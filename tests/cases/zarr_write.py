@@ -0,0 +1,51 @@
+from .provider_test import ProviderTest
+from .hdf5_write import Hdf5WriteTestSource
+from gunpowder import *
+from gunpowder.chunked_array import ChunkedArray
+import numpy as np
+import os
+
+class TestZarrWrite(ProviderTest):
+
+    def test_output(self):
+
+        source = Hdf5WriteTestSource()
+
+        chunk_request = BatchRequest()
+        chunk_request.add(ArrayKeys.RAW, (400,30,34))
+
+        pipeline = (
+            source +
+            ZarrWrite({
+                ArrayKeys.RAW: 'arrays/raw'
+            },
+            output_dir=self.path_to(),
+            output_filename='zarr_write_test.zarr',
+            chunk_shape=(20, 15, 17)) +
+            Scan(chunk_request))
+
+        with build(pipeline):
+
+            full_request = BatchRequest({
+                    ArrayKeys.RAW: pipeline.spec[ArrayKeys.RAW]
+                }
+            )
+
+            batch = pipeline.request_batch(full_request)
+
+        # assert that stored dataset equals batch array
+
+        ds = ChunkedArray(os.path.join(
+            self.path_to('zarr_write_test.zarr'),
+            'arrays/raw'))
+
+        batch_raw = batch.arrays[ArrayKeys.RAW]
+        stored_raw = ds.read((0,)*len(ds.shape), ds.shape)
+
+        self.assertEqual(ds.chunks, (3, 20, 15, 17))
+        self.assertEqual(
+            stored_raw.shape[-3:],
+            batch_raw.spec.roi.get_shape()//batch_raw.spec.voxel_size)
+        self.assertEqual(tuple(ds.attrs['offset']), batch_raw.spec.roi.get_offset())
+        self.assertEqual(tuple(ds.attrs['resolution']), batch_raw.spec.voxel_size)
+        self.assertTrue((stored_raw == batch.arrays[ArrayKeys.RAW].data).all())